@@ -0,0 +1,105 @@
+"""Microbenchmark: order listing serialization, old path vs core/serialization.
+
+The old path is the per-field normalizer the order routes used, followed by
+what FastAPI does with a returned dict (`jsonable_encoder` + `JSONResponse`).
+No database is needed; orders are generated in memory.
+
+Run: python backend/benchmarks/bench_serialization.py [--orders 1000] [--items 3] [--repeat 20]
+"""
+import argparse
+import json
+import sys
+import timeit
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from bson import ObjectId
+
+# Make the project root importable so this script can be run directly
+ROOT = Path(__file__).resolve().parent.parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from fastapi.encoders import jsonable_encoder
+from backend.core.serialization import dumps, order_doc, orjson
+
+
+def make_orders(n: int, items: int) -> list[dict]:
+    now = datetime.utcnow()
+    return [
+        {
+            "_id": ObjectId(),
+            "user_id": ObjectId(),
+            "items": [{"product_id": str(ObjectId()), "quantity": 2, "price": 1299, "name": f"Product {j}"} for j in range(items)],
+            "total_amount": 1299 * 2 * items,
+            "payment_status": "success",
+            "created_at": now - timedelta(minutes=i),
+        }
+        for i in range(n)
+    ]
+
+
+def legacy_order(d: dict) -> dict:
+    # the hand-rolled normalizer previously copied across orders/debug routes
+    uid = d.get("user_id")
+    try:
+        uid_str = str(uid) if uid is not None else None
+    except Exception:
+        uid_str = None
+    items = []
+    for it in d.get("items") or []:
+        try:
+            pid = it.get("product_id")
+        except Exception:
+            pid = None
+        try:
+            pid_str = str(pid) if pid is not None else None
+        except Exception:
+            pid_str = None
+        items.append({"product_id": pid_str, "quantity": it.get("quantity"), "price": it.get("price"), "name": it.get("name")})
+    created = d.get("created_at")
+    try:
+        created_iso = created.isoformat() if hasattr(created, "isoformat") else str(created)
+    except Exception:
+        created_iso = str(created)
+    return {
+        "id": str(d.get("_id")),
+        "user_id": uid_str,
+        "items": items,
+        "total_amount": d.get("total_amount"),
+        "payment_status": d.get("payment_status"),
+        "created_at": created_iso,
+        "simulated": bool(d.get("simulated", False)),
+    }
+
+
+def legacy(docs: list) -> bytes:
+    content = jsonable_encoder({"orders": [legacy_order(d) for d in docs]})
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def current(docs: list) -> bytes:
+    return dumps({"orders": [order_doc(d) for d in docs]})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--items", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    docs = make_orders(args.orders, args.items)
+    assert json.loads(legacy(docs)) == json.loads(current(docs)), "outputs differ"
+
+    print(f"{args.orders} orders x {args.items} items, best of {args.repeat} (encoder: {'orjson' if orjson else 'json'})")
+    results = {}
+    for name, fn in (("legacy", legacy), ("current", current)):
+        best = min(timeit.repeat(lambda: fn(docs), number=1, repeat=args.repeat))
+        results[name] = best
+        print(f"  {name:8s} {best * 1000:8.2f} ms  {args.orders / best:10.0f} orders/s")
+    print(f"  speedup  {results['legacy'] / results['current']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Contention benchmark: single-field stock `$inc` vs sharded stock counters.
+
+N threads each sell one unit at a time of the same product until it is sold
+out, once with the conditional `$inc` on `products.stock` that checkout uses
+and once with `stock_shards` spread over K counters. Needs a running
+MongoDB (MONGO_URI); it works in a scratch database `<DB_NAME>_bench`,
+which is dropped afterwards.
+
+Run: python backend/benchmarks/bench_stock_contention.py [--threads 32] [--units 20000] [--shards 16]
+"""
+import argparse
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Make the project root importable so this script can be run directly
+ROOT = Path(__file__).resolve().parent.parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from pymongo import MongoClient
+from backend.core.config import settings
+from backend.core import stock_shards
+
+
+def run(threads: int, sell_one) -> dict:
+    latencies = [[] for _ in range(threads)]
+    start = threading.Barrier(threads + 1)
+
+    def worker(n):
+        start.wait()
+        out = latencies[n]
+        while True:
+            t0 = time.perf_counter()
+            ok = sell_one()
+            out.append(time.perf_counter() - t0)
+            if not ok:
+                return
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    start.wait()
+    t0 = time.perf_counter()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    flat = sorted(x for per in latencies for x in per)
+    return {
+        "seconds": elapsed,
+        "ops_per_second": len(flat) / elapsed,
+        "p50_ms": statistics.median(flat) * 1000,
+        "p99_ms": flat[int(len(flat) * 0.99) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--units", type=int, default=20000)
+    parser.add_argument("--shards", type=int, default=16)
+    args = parser.parse_args()
+
+    client = MongoClient(settings.MONGO_URI)
+    db = client[settings.DB_NAME + "_bench"]
+    client.drop_database(db.name)
+    try:
+        pid = db.products.insert_one({"name": "bench", "price": 1, "stock": args.units}).inserted_id
+
+        def sell_single():
+            return db.products.update_one({"_id": pid, "stock": {"$gte": 1}}, {"$inc": {"stock": -1}}).modified_count == 1
+
+        single = run(args.threads, sell_single)
+        assert db.products.find_one({"_id": pid})["stock"] == 0
+
+        db.products.update_one({"_id": pid}, {"$set": {"stock": args.units}})
+        db.stock_shards.create_index([("product_id", 1), ("shard", 1)], unique=True)
+        stock_shards.configure(db, pid, args.shards)
+        sharded = run(args.threads, lambda: stock_shards.take(db, pid, 1))
+        assert stock_shards.shard_total(db, pid, fresh=True) == 0
+
+        print(f"{args.units} units, {args.threads} threads, {args.shards} shards")
+        for name, r in (("single", single), ("sharded", sharded)):
+            print(f"  {name:8s} {r['ops_per_second']:9.0f} ops/s  p50 {r['p50_ms']:6.2f} ms  p99 {r['p99_ms']:6.2f} ms")
+    finally:
+        client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,38 @@ class Settings:
     ENV: str = os.getenv("ENV", "development")
     STRIPE_SECRET_KEY: str | None = os.getenv("STRIPE_SECRET_KEY")
     STRIPE_WEBHOOK_SECRET: str | None = os.getenv("STRIPE_WEBHOOK_SECRET")
+    # In-process catalog cache (entries, seconds)
+    CATALOG_CACHE_SIZE: int = int(os.getenv("CATALOG_CACHE_SIZE", "1024"))
+    CATALOG_CACHE_TTL: float = float(os.getenv("CATALOG_CACHE_TTL", "30"))
+    # Default backend for `q` on GET /products: "mongo" ($text) or "bm25" (in-process)
+    SEARCH_ENGINE: str = os.getenv("SEARCH_ENGINE", "mongo")
+    # Idempotency-Key records (seconds kept, in-process cache entries, how long
+    # duplicates wait for an in-flight request, lease before a stuck one is retaken)
+    IDEMPOTENCY_KEY_TTL: int = int(os.getenv("IDEMPOTENCY_KEY_TTL", str(24 * 60 * 60)))
+    IDEMPOTENCY_CACHE_SIZE: int = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "2048"))
+    IDEMPOTENCY_WAIT_SECONDS: float = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+    IDEMPOTENCY_LOCK_SECONDS: int = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+    # Cart inventory holds: how long added units stay reserved, and how often
+    # expired holds are returned to stock
+    CART_HOLD_MINUTES: int = int(os.getenv("CART_HOLD_MINUTES", "15"))
+    HOLD_SWEEP_SECONDS: float = float(os.getenv("HOLD_SWEEP_SECONDS", "30"))
+    # Sharded stock: how long a shard sum is cached, and how often it is
+    # written back to the product's display `stock`
+    STOCK_SHARD_CACHE_SECONDS: float = float(os.getenv("STOCK_SHARD_CACHE_SECONDS", "2"))
+    STOCK_SHARD_REFRESH_SECONDS: float = float(os.getenv("STOCK_SHARD_REFRESH_SECONDS", "1"))
+    # Background tasks (outbox): worker threads, tasks claimed ahead of the
+    # workers, idle poll interval, attempts before giving up, and the lease
+    # after which a task whose worker died is run again
+    TASK_WORKERS: int = int(os.getenv("TASK_WORKERS", "4"))
+    TASK_QUEUE_SIZE: int = int(os.getenv("TASK_QUEUE_SIZE", "100"))
+    TASK_POLL_SECONDS: float = float(os.getenv("TASK_POLL_SECONDS", "1"))
+    TASK_MAX_ATTEMPTS: int = int(os.getenv("TASK_MAX_ATTEMPTS", "5"))
+    TASK_LEASE_SECONDS: int = int(os.getenv("TASK_LEASE_SECONDS", "60"))
+    # Sales counters: documents the all-time and daily totals are spread over
+    SALES_COUNTER_SLOTS: int = int(os.getenv("SALES_COUNTER_SLOTS", "8"))
+    # Sales analytics: memoized closed time buckets (entries, seconds kept)
+    SALES_BUCKET_CACHE_SIZE: int = int(os.getenv("SALES_BUCKET_CACHE_SIZE", "8192"))
+    SALES_BUCKET_CACHE_SECONDS: float = float(os.getenv("SALES_BUCKET_CACHE_SECONDS", str(24 * 60 * 60)))
 
 
 settings = Settings()
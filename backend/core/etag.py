@@ -0,0 +1,49 @@
+import hashlib
+from datetime import datetime
+from fastapi import Request, Response
+from pymongo import ReturnDocument
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag from the given version parts."""
+    digest = hashlib.sha1(":".join(str(p) for p in parts).encode()).hexdigest()[:24]
+    return f'"{digest}"'
+
+
+def doc_version(doc: dict):
+    # documents written before versioning fall back to their timestamps
+    if doc.get("version") is not None:
+        return doc["version"]
+    stamp = doc.get("updated_at") or doc.get("created_at")
+    return stamp.isoformat() if isinstance(stamp, datetime) else stamp
+
+
+def matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [c.strip() for c in header.split(",")]
+    # If-None-Match uses weak comparison
+    return any(c == etag or c == "W/" + etag for c in candidates)
+
+
+def not_modified(etag: str, headers: dict | None = None) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, **(headers or {})})
+
+
+def catalog_version(db) -> int:
+    """Collection-level version of `products`, bumped on every product write."""
+    doc = db.counters.find_one({"_id": "products"})
+    return doc.get("version", 0) if doc else 0
+
+
+def bump_catalog_version(db) -> int:
+    doc = db.counters.find_one_and_update(
+        {"_id": "products"},
+        {"$inc": {"version": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return doc["version"]
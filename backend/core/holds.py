@@ -0,0 +1,226 @@
+"""Time-bounded inventory holds for cart lines.
+
+Adding to the cart holds the units: `products.held` counts every unit in
+an active hold and available-to-sell is `stock - held`. The per-cart detail
+lives in `inventory_holds`, one document per (user, product) with the
+quantity, the price at hold time and an expiry. Holds end in one of three ways:
+- they are consumed by checkout;
+- they are released when the line is removed;
+- they are returned to stock by the sweeper once expired.
+
+Checkout claims a user's holds by stamping them with a token, so the
+sweeper and a concurrent checkout never both release the same hold.
+
+Products in sharded stock mode (see `stock_shards`) hold units by taking
+them out of a shard instead of counting them in `held`.
+"""
+import threading
+import uuid
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from .config import settings
+from .logging import logger
+from . import stock_shards
+
+
+# a checkout that crashed mid-way leaves its claimed holds this long past expiry
+CLAIM_GRACE = timedelta(minutes=5)
+SWEEP_BATCH = 500
+
+
+def available_at_least(quantity: int) -> dict:
+    """Filter matching unsharded products with at least `quantity` units not
+    held. (A worker that has not yet noticed a product became sharded must
+    not sell from its display stock.)"""
+    return {"stock_shards": None, "$expr": {"$gte": [{"$subtract": ["$stock", {"$ifNull": ["$held", 0]}]}, quantity]}}
+
+
+def available_to_sell(db, product_ids) -> dict:
+    """`{product ObjectId: stock - held}` from one projected `$in` query;
+    sharded products report their (briefly cached) shard sum."""
+    ids = list(product_ids)
+    if not ids:
+        return {}
+    out = {}
+    for p in db.products.find({"_id": {"$in": ids}}, {"stock": 1, "held": 1, "stock_shards": 1}):
+        if p.get("stock_shards"):
+            out[p["_id"]] = stock_shards.shard_total(db, p["_id"])
+        else:
+            out[p["_id"]] = max(p.get("stock", 0) - p.get("held", 0), 0)
+    return out
+
+
+def _take_units(db, pid, quantity: int):
+    # returns the product's price, or raises 404/400
+    if stock_shards.is_sharded(db, pid):
+        prod = db.products.find_one({"_id": pid}, {"price": 1})
+        if prod is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        if not stock_shards.take(db, pid, quantity):
+            raise HTTPException(status_code=400, detail="Not enough stock")
+        stock_shards.touch(db, pid)
+        return prod.get("price", 0)
+    prod = db.products.find_one_and_update({"_id": pid, **available_at_least(quantity)}, {"$inc": {"held": quantity}}, projection={"price": 1})
+    if prod is None:
+        if not db.products.count_documents({"_id": pid}, limit=1):
+            raise HTTPException(status_code=404, detail="Product not found")
+        raise HTTPException(status_code=400, detail="Not enough stock")
+    return prod.get("price", 0)
+
+
+def return_units(db, released: dict, session=None):
+    """Make held units ({pid: qty}) available to sell again."""
+    plain = []
+    for pid, qty in released.items():
+        if stock_shards.is_sharded(db, pid):
+            stock_shards.give(db, pid, qty, session=session)
+            stock_shards.touch(db, pid)
+        else:
+            plain.append(UpdateOne({"_id": pid}, {"$inc": {"held": -qty}}))
+    if plain:
+        db.products.bulk_write(plain, ordered=False, session=session)
+
+
+def _expiry(now: datetime) -> datetime:
+    return now + timedelta(minutes=settings.CART_HOLD_MINUTES)
+
+
+def place_hold(db, uid, pid, quantity: int, now: datetime | None = None):
+    """Hold `quantity` more units of a product for the user, or raise 404/400."""
+    now = now or datetime.utcnow()
+    price = _take_units(db, pid, quantity)
+    update = {
+        "$inc": {"quantity": quantity},
+        "$set": {"price": price, "expires_at": _expiry(now)},
+        "$setOnInsert": {"created_at": now},
+    }
+    for _ in range(2):
+        try:
+            db.inventory_holds.update_one({"user_id": uid, "product_id": pid, "claimed_by": None}, update, upsert=True)
+            return
+        except DuplicateKeyError:
+            # lost an upsert race on the unique (user_id, product_id) index, or
+            # the existing hold is claimed by a checkout in progress
+            if not db.inventory_holds.count_documents({"user_id": uid, "product_id": pid, "claimed_by": {"$ne": None}}, limit=1):
+                continue
+            break
+    return_units(db, {pid: quantity})
+    raise HTTPException(status_code=409, detail="Checkout in progress, please retry")
+
+
+def set_hold(db, uid, pid, quantity: int, now: datetime | None = None) -> int:
+    """Make the user's hold on a product exactly `quantity` units; returns
+    the previous quantity so callers can undo."""
+    now = now or datetime.utcnow()
+    hold = db.inventory_holds.find_one({"user_id": uid, "product_id": pid, "claimed_by": None}, {"quantity": 1})
+    current = hold["quantity"] if hold else 0
+    if quantity > current:
+        place_hold(db, uid, pid, quantity - current, now)
+    elif quantity <= 0:
+        release_hold(db, uid, pid)
+    elif quantity < current:
+        shrink_hold(db, uid, pid, current - quantity, now)
+    else:
+        db.inventory_holds.update_one({"_id": hold["_id"]}, {"$set": {"expires_at": _expiry(now)}})
+    return current
+
+
+def shrink_hold(db, uid, pid, quantity: int, now: datetime | None = None):
+    """Give back `quantity` held units (no more than the hold has)."""
+    now = now or datetime.utcnow()
+    hold = db.inventory_holds.find_one_and_update(
+        {"user_id": uid, "product_id": pid, "claimed_by": None, "quantity": {"$gte": quantity}},
+        {"$inc": {"quantity": -quantity}, "$set": {"expires_at": _expiry(now)}},
+    )
+    if hold:
+        return_units(db, {pid: quantity})
+        db.inventory_holds.delete_one({"_id": hold["_id"], "quantity": 0})
+
+
+def release_hold(db, uid, pid):
+    hold = db.inventory_holds.find_one_and_delete({"user_id": uid, "product_id": pid, "claimed_by": None})
+    if hold:
+        return_units(db, {pid: hold["quantity"]})
+
+
+def claim_holds(db, uid, session=None):
+    """Take the user's holds for checkout.
+
+    Returns `(token, {product ObjectId: {"quantity", "price"}})`. Finish with
+    `finish_claim`, or `unclaim_holds` when the checkout fails outside a
+    transaction.
+    """
+    token = uuid.uuid4().hex
+    res = db.inventory_holds.update_many({"user_id": uid, "claimed_by": None}, {"$set": {"claimed_by": token}}, session=session)
+    if not res.modified_count:
+        return token, {}
+    holds = db.inventory_holds.find({"claimed_by": token}, {"product_id": 1, "quantity": 1, "price": 1}, session=session)
+    return token, {h["product_id"]: {"quantity": h["quantity"], "price": h.get("price", 0)} for h in holds}
+
+
+def finish_claim(db, token: str, released: dict, session=None):
+    """Delete claimed holds; `released` ({pid: qty}) are held units that were
+    not bought and go back to available-to-sell."""
+    if released:
+        return_units(db, released, session=session)
+    db.inventory_holds.delete_many({"claimed_by": token}, session=session)
+
+
+def unclaim_holds(db, token: str):
+    db.inventory_holds.update_many({"claimed_by": token}, {"$set": {"claimed_by": None}})
+
+
+def sweep_expired(db, now: datetime | None = None) -> int:
+    """Release expired holds; returns the number released."""
+    now = now or datetime.utcnow()
+    expired = {"expires_at": {"$lt": now}, "$or": [{"claimed_by": None}, {"expires_at": {"$lt": now - CLAIM_GRACE}}]}
+    released = {}
+    count = 0
+    for hold in db.inventory_holds.find(expired, {"_id": 1}).limit(SWEEP_BATCH):
+        # deleting first means only one sweeper (or checkout) releases a hold
+        gone = db.inventory_holds.find_one_and_delete({"_id": hold["_id"], **expired})
+        if gone:
+            released[gone["product_id"]] = released.get(gone["product_id"], 0) + gone["quantity"]
+            count += 1
+    if released:
+        return_units(db, released)
+    return count
+
+
+def reconcile_held(db) -> int:
+    """Recompute `products.held` from the holds collection; returns the
+    number of products corrected. Run it when no carts are being modified.
+    Sharded products do not use `held` and are skipped."""
+    totals = {r["_id"]: r["quantity"] for r in db.inventory_holds.aggregate([{"$group": {"_id": "$product_id", "quantity": {"$sum": "$quantity"}}}])}
+    ops = []
+    for p in db.products.find({"stock_shards": None, "$or": [{"held": {"$ne": 0, "$exists": True}}, {"_id": {"$in": list(totals)}}]}, {"held": 1}):
+        want = totals.get(p["_id"], 0)
+        if p.get("held", 0) != want:
+            ops.append(UpdateOne({"_id": p["_id"]}, {"$set": {"held": want}}))
+    if ops:
+        db.products.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+class HoldSweeper(threading.Thread):
+    """Background thread that calls `sweep_expired` every `interval` seconds."""
+
+    def __init__(self, get_db, interval: float):
+        super().__init__(name="hold-sweeper", daemon=True)
+        self._get_db = get_db
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                released = sweep_expired(self._get_db())
+                if released:
+                    logger.info("Released %d expired inventory holds", released)
+            except Exception:
+                logger.exception("Sweeping inventory holds failed")
+
+    def stop(self):
+        self._stop_event.set()
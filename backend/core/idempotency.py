@@ -0,0 +1,172 @@
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from starlette.concurrency import run_in_threadpool
+from .cache import QueryCache
+from .config import settings
+
+
+MAX_KEY_LENGTH = 255
+# how often a waiter re-reads a record whose owner runs in another process
+POLL_INTERVAL = 0.05
+
+
+def fingerprint(payload) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """Remembers the first response per (scope, owner, Idempotency-Key).
+
+    Records live in the `idempotency_keys` collection (expired by a TTL
+    index on `created_at`); completed ones are also kept in a small
+    in-process cache so most replays skip Mongo. A request that finds its
+    key still in flight waits for the first one to finish instead of
+    running again. A pending record carries a lease (`locked_until`): if
+    its owner dies, a retry after the lease takes the key over.
+    """
+
+    def __init__(self, collection: str = "idempotency_keys"):
+        self.collection = collection
+        self._cache = QueryCache(maxsize=settings.IDEMPOTENCY_CACHE_SIZE, ttl=settings.IDEMPOTENCY_KEY_TTL)
+        self._inflight: dict = {}  # record id -> threading.Event, for owners in this process
+        self._lock = threading.Lock()
+
+    def _record_id(self, scope: str, owner, key: str) -> str:
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+        return f"{scope}:{owner}:{key}"
+
+    def _check(self, record: dict, request_hash: str) -> dict:
+        if record["request_hash"] != request_hash:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        return record
+
+    def begin(self, db, scope: str, owner, key: str, request_hash: str):
+        """Claim the key or wait for its result.
+
+        Returns `(record_id, None)` when the caller owns the key and must
+        run the request then call `complete`/`abandon`, or
+        `(record_id, record)` with the stored response to replay.
+        """
+        rid = self._record_id(scope, owner, key)
+        cached = self._cache.get(rid)
+        if cached is not None:
+            return rid, self._check(cached, request_hash)
+
+        coll = db[self.collection]
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            now = datetime.utcnow()
+            lease = now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+            try:
+                coll.insert_one({"_id": rid, "request_hash": request_hash, "state": "pending", "created_at": now, "locked_until": lease})
+                self._claimed(rid)
+                return rid, None
+            except DuplicateKeyError:
+                pass
+            record = coll.find_one({"_id": rid})
+            if record is None:
+                # the owner failed and released the key between our two calls
+                continue
+            self._check(record, request_hash)
+            if record["state"] == "done":
+                self._cache.set(rid, record)
+                return rid, record
+            if record["locked_until"] <= now:
+                taken = coll.update_one({"_id": rid, "state": "pending", "locked_until": record["locked_until"]}, {"$set": {"locked_until": lease}})
+                if taken.modified_count:
+                    self._claimed(rid)
+                    return rid, None
+                # another retry took the lease first; wait for its result
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+            with self._lock:
+                event = self._inflight.get(rid)
+            if event is not None:
+                event.wait(remaining)
+            else:
+                time.sleep(min(POLL_INTERVAL, remaining))
+
+    def _claimed(self, rid: str):
+        with self._lock:
+            self._inflight[rid] = threading.Event()
+
+    def _release(self, rid: str):
+        with self._lock:
+            event = self._inflight.pop(rid, None)
+        if event is not None:
+            event.set()
+
+    def complete(self, db, rid: str, status_code: int, body):
+        record = db[self.collection].find_one_and_update(
+            {"_id": rid},
+            {"$set": {"state": "done", "status_code": status_code, "body": body}, "$unset": {"locked_until": ""}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if record is not None:
+            self._cache.set(rid, record)
+        self._release(rid)
+
+    def abandon(self, db, rid: str):
+        """Drop a claimed key whose request failed, so a retry runs it again."""
+        db[self.collection].delete_one({"_id": rid, "state": "pending"})
+        self._release(rid)
+
+    def stats(self) -> dict:
+        with self._lock:
+            inflight = len(self._inflight)
+        return {"inflight": inflight, "cache": self._cache.stats()}
+
+
+def replay(record: dict) -> JSONResponse:
+    return JSONResponse(status_code=record["status_code"], content=record["body"], headers={"Idempotent-Replayed": "true"})
+
+
+idempotency_store = IdempotencyStore()
+
+
+def run_idempotent(db, scope: str, owner, key: str | None, payload, handler):
+    """Run `handler()` at most once per key and replay its result for duplicates.
+
+    Without a key, or without an owner to scope it to, the handler simply
+    runs: anonymous callers would otherwise share one namespace and replay
+    each other's responses. Failed requests (exceptions, including
+    HTTPException) release the key so the client can retry.
+    """
+    if key is None or owner is None:
+        return handler()
+    rid, record = idempotency_store.begin(db, scope, owner, key, fingerprint(payload))
+    if record is not None:
+        return replay(record)
+    try:
+        result = handler()
+    except BaseException:
+        idempotency_store.abandon(db, rid)
+        raise
+    idempotency_store.complete(db, rid, 200, result)
+    return result
+
+
+async def run_idempotent_async(db, scope: str, owner, key: str | None, payload, handler):
+    """`run_idempotent` for async routes; `handler` is a coroutine function."""
+    if key is None or owner is None:
+        return await handler()
+    rid, record = await run_in_threadpool(idempotency_store.begin, db, scope, owner, key, fingerprint(payload))
+    if record is not None:
+        return replay(record)
+    try:
+        result = await handler()
+    except BaseException:
+        await run_in_threadpool(idempotency_store.abandon, db, rid)
+        raise
+    await run_in_threadpool(idempotency_store.complete, db, rid, 200, result)
+    return result
@@ -0,0 +1,127 @@
+from datetime import datetime
+from fastapi import HTTPException
+from pymongo import UpdateOne
+from .holds import available_at_least
+from . import stock_shards
+
+
+def _decrement(pid, qty: int, now: datetime, held: int = 0) -> tuple[dict, dict]:
+    # the availability condition makes the check and the decrement one atomic
+    # step; units the buyer already holds count as available to them
+    inc = {"stock": -qty, "version": 1}
+    if held:
+        inc["held"] = -held
+    return (
+        {"_id": pid, **available_at_least(qty - held)},
+        {"$inc": inc, "$set": {"updated_at": now}},
+    )
+
+
+def _take_sharded(db, pid, qty: int, held: int, session=None) -> bool:
+    # held units already left the shards when the hold was placed
+    if qty > held:
+        return stock_shards.take(db, pid, qty - held, session=session)
+    stock_shards.give(db, pid, held - qty, session=session)
+    return True
+
+
+def _split(db, quantities: dict) -> tuple[dict, dict]:
+    sharded = {pid: qty for pid, qty in quantities.items() if stock_shards.is_sharded(db, pid)}
+    plain = {pid: qty for pid, qty in quantities.items() if pid not in sharded}
+    return plain, sharded
+
+
+def reserve_stock(db, quantities: dict, session=None, held: dict | None = None):
+    """Take `quantities` ({product ObjectId: qty}) out of stock, all or nothing.
+
+    `held` ({product ObjectId: qty}) are the buyer's claimed cart holds on
+    those products; they are consumed (released from `products.held`) in
+    the same update.
+
+    Inside a transaction this is one `bulk_write` of conditional decrements;
+    if any of them does not match, a 409 is raised and the transaction
+    rolls everything back. Without a session the products are decremented
+    one by one and the ones already taken are put back on failure.
+    Products in sharded stock mode are taken from their shards instead.
+    """
+    held = held or {}
+    now = datetime.utcnow()
+    plain, sharded = _split(db, quantities)
+    if session is not None:
+        if plain:
+            res = db.products.bulk_write([UpdateOne(*_decrement(pid, qty, now, held.get(pid, 0))) for pid, qty in plain.items()], ordered=False, session=session)
+            if res.matched_count != len(plain):
+                raise HTTPException(status_code=409, detail="Insufficient stock for one or more items")
+        for pid, qty in sharded.items():
+            if not _take_sharded(db, pid, qty, held.get(pid, 0), session=session):
+                raise HTTPException(status_code=409, detail="Insufficient stock for one or more items")
+        _touch(db, sharded)
+        return
+
+    taken = {}
+    for pid, qty in plain.items():
+        res = db.products.update_one(*_decrement(pid, qty, now, held.get(pid, 0)))
+        if not res.matched_count:
+            release_stock(db, taken, held=held)
+            raise HTTPException(status_code=409, detail=f"Product {pid} out of stock or insufficient quantity")
+        taken[pid] = qty
+    for pid, qty in sharded.items():
+        if not _take_sharded(db, pid, qty, held.get(pid, 0)):
+            release_stock(db, taken, held=held)
+            raise HTTPException(status_code=409, detail=f"Product {pid} out of stock or insufficient quantity")
+        taken[pid] = qty
+    _touch(db, sharded)
+
+
+def release_stock(db, quantities: dict, session=None, held: dict | None = None):
+    """Undo `reserve_stock`, putting consumed holds back as well."""
+    if not quantities:
+        return
+    held = held or {}
+    now = datetime.utcnow()
+    plain, sharded = _split(db, quantities)
+    ops = []
+    for pid, qty in plain.items():
+        inc = {"stock": qty, "version": 1}
+        if held.get(pid):
+            inc["held"] = held[pid]
+        ops.append(UpdateOne({"_id": pid}, {"$inc": inc, "$set": {"updated_at": now}}))
+    if ops:
+        db.products.bulk_write(ops, ordered=False, session=session)
+    for pid, qty in sharded.items():
+        # the restored hold keeps its units out of the shards again
+        h = held.get(pid, 0)
+        if qty > h:
+            stock_shards.give(db, pid, qty - h, session=session)
+        else:
+            stock_shards.take(db, pid, h - qty, session=session)
+    _touch(db, sharded)
+
+
+def take_available_stock(db, quantities: dict, held: dict | None = None) -> dict:
+    """Best-effort variant: decrement each product that still has enough
+    stock and skip the rest. Returns the skipped `{pid: qty}`.
+
+    `held` are the buyer's claimed holds, consumed in the same conditional
+    update as in `reserve_stock`; holds on skipped products are left for
+    the caller to release.
+    """
+    if not quantities:
+        return {}
+    held = held or {}
+    now = datetime.utcnow()
+    plain, sharded = _split(db, quantities)
+    skipped = {}
+    for pid, qty in plain.items():
+        if not db.products.update_one(*_decrement(pid, qty, now, held.get(pid, 0))).matched_count:
+            skipped[pid] = qty
+    for pid, qty in sharded.items():
+        if not _take_sharded(db, pid, qty, held.get(pid, 0)):
+            skipped[pid] = qty
+    _touch(db, sharded)
+    return skipped
+
+
+def _touch(db, sharded: dict):
+    for pid in sharded:
+        stock_shards.touch(db, pid)
@@ -0,0 +1,19 @@
+"""Side effects of a placed order, run from the outbox after the response.
+
+Both checkout routes enqueue these inside the same write (or transaction)
+as the order, so they survive a crash; handlers may run more than once.
+Cache invalidation and the suggest popularity update stay in the routes:
+they touch in-process state, so they must run once, in the worker that
+served the checkout, as soon as the order commits.
+"""
+from .tasks import enqueue, task
+from ..utils.orderEmails import send_order_confirmation
+
+
+def enqueue_order_placed(db, order_id, session=None):
+    enqueue(db, "order.confirmation_email", {"order_id": order_id}, session=session)
+
+
+@task("order.confirmation_email")
+def order_confirmation_email(db, payload: dict):
+    send_order_confirmation(db, payload["order_id"])
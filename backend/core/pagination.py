@@ -0,0 +1,68 @@
+import base64
+import json
+from datetime import datetime
+from bson import ObjectId
+from fastapi import HTTPException
+
+
+def _encode_value(v):
+    # keep type information so datetimes/ObjectIds round-trip exactly
+    if isinstance(v, datetime):
+        return {"$dt": v.isoformat()}
+    if isinstance(v, ObjectId):
+        return {"$oid": str(v)}
+    return v
+
+
+def _decode_value(v):
+    if isinstance(v, dict):
+        if "$dt" in v:
+            return datetime.fromisoformat(v["$dt"])
+        if "$oid" in v:
+            return ObjectId(v["$oid"])
+    return v
+
+
+def encode_cursor(sort_name: str, value, last_id) -> str:
+    """Build an opaque cursor from the last row's sort key and `_id`."""
+    raw = json.dumps({"s": sort_name, "v": _encode_value(value), "id": str(last_id)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_name: str):
+    """Return `(value, ObjectId)` from a cursor made by `encode_cursor`.
+
+    Raises a 400 when the cursor is malformed or was issued for another sort.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = _decode_value(data.get("v"))
+        last_id = ObjectId(data["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if data.get("s") != sort_name:
+        raise HTTPException(status_code=400, detail="Cursor does not match sort")
+    return value, last_id
+
+
+def keyset_filter(field: str | None, direction: int, value, last_id: ObjectId) -> dict:
+    """Mongo filter selecting rows strictly after `(value, last_id)` in the
+    ordering `[(field, direction), ("_id", direction)]`.
+
+    `field=None` means the ordering is on `_id` alone. Missing/null keys sort
+    before every other value, so they are handled explicitly.
+    """
+    id_op = "$gt" if direction > 0 else "$lt"
+    if field is None:
+        return {"_id": {id_op: last_id}}
+    if value is None:
+        if direction > 0:
+            return {"$or": [{field: {"$ne": None}}, {field: None, "_id": {id_op: last_id}}]}
+        return {field: None, "_id": {id_op: last_id}}
+    cmp_op = "$gt" if direction > 0 else "$lt"
+    after_value = {field: {cmp_op: value}}
+    if direction < 0:
+        # nulls come last when descending
+        after_value = {"$or": [after_value, {field: None}]}
+    return {"$or": [after_value, {field: value, "_id": {id_op: last_id}}]}
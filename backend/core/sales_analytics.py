@@ -0,0 +1,104 @@
+"""Orders, revenue and units over time for the admin analytics endpoint.
+
+Orders are bucketed with `$dateTrunc` (UTC; weeks start on Monday). The
+`$match` on `created_at` uses the orders' created_at index. A bucket that
+ended more than `CLOSE_GRACE` ago no longer changes, short of orders being
+deleted (see `forget`), so its numbers are memoized in process. Each
+request aggregates only from the first bucket it has no memo for; once
+warm that is just the current, still-open bucket.
+"""
+from datetime import datetime, timedelta, timezone
+from .cache import QueryCache
+from .config import settings
+
+
+GRANULARITIES = {"hour": timedelta(hours=1), "day": timedelta(days=1), "week": timedelta(weeks=1)}
+# buckets returned when `from` is not given
+DEFAULT_BUCKETS = {"hour": 48, "day": 30, "week": 12}
+MAX_BUCKETS = 2000
+# orders committed just after their bucket ended still land in it
+CLOSE_GRACE = timedelta(minutes=1)
+
+_closed = QueryCache(maxsize=settings.SALES_BUCKET_CACHE_SIZE, ttl=settings.SALES_BUCKET_CACHE_SECONDS)
+
+
+def _utc(ts: datetime) -> datetime:
+    # order timestamps are naive UTC
+    return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo else ts
+
+
+def bucket_start(ts: datetime, granularity: str) -> datetime:
+    """Start of the bucket containing `ts`, as `$dateTrunc` computes it."""
+    ts = _utc(ts)
+    if granularity == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    day = datetime(ts.year, ts.month, ts.day)
+    if granularity == "week":
+        day -= timedelta(days=day.weekday())
+    return day
+
+
+def forget():
+    """Drop memoized buckets, e.g. after orders were deleted."""
+    _closed.bump_generation()
+
+
+def _aggregate(db, granularity: str, start: datetime, end: datetime) -> dict:
+    trunc = {"date": "$created_at", "unit": granularity}
+    if granularity == "week":
+        trunc["startOfWeek"] = "monday"
+    pipeline = [
+        {"$match": {"created_at": {"$gte": start, "$lt": end}}},
+        {"$group": {
+            "_id": {"$dateTrunc": trunc},
+            "orders": {"$sum": 1},
+            "revenue": {"$sum": {"$ifNull": ["$total_amount", 0]}},
+            "units": {"$sum": {"$sum": "$items.quantity"}},
+        }},
+    ]
+    return {r["_id"]: {"orders": r["orders"], "revenue": r["revenue"], "units": r["units"]} for r in db.orders.aggregate(pipeline)}
+
+
+def sales_series(db, granularity: str, start: datetime | None = None, end: datetime | None = None, now: datetime | None = None) -> list:
+    """Whole buckets overlapping `[start, end)`, oldest first, empty ones
+    included. `end` defaults to now and `start` to `DEFAULT_BUCKETS` buckets
+    before it. Raises ValueError for an unknown granularity or a range
+    spanning more than `MAX_BUCKETS` buckets."""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of: {', '.join(GRANULARITIES)}")
+    step = GRANULARITIES[granularity]
+    now = now or datetime.utcnow()
+    end = _utc(end) if end else now
+    first = bucket_start(start, granularity) if start else bucket_start(end, granularity) - step * (DEFAULT_BUCKETS[granularity] - 1)
+    if end > first and (end - first) / step > MAX_BUCKETS:
+        raise ValueError(f"range spans more than {MAX_BUCKETS} {granularity} buckets")
+    starts = []
+    b = first
+    while b < end:
+        starts.append(b)
+        b += step
+    if not starts:
+        return []
+
+    generation = _closed.generation
+    out = {}
+    fetch_from = None
+    for b in starts:
+        cached = _closed.get((generation, granularity, b)) if b + step + CLOSE_GRACE <= now else None
+        if cached is None:
+            fetch_from = b
+            break
+        out[b] = cached
+    if fetch_from is not None:
+        fresh = _aggregate(db, granularity, fetch_from, starts[-1] + step)
+        for b in starts:
+            if b < fetch_from:
+                continue
+            out[b] = fresh.get(b) or {"orders": 0, "revenue": 0, "units": 0}
+            if b + step + CLOSE_GRACE <= now:
+                _closed.set((generation, granularity, b), out[b])
+    return [{"start": b, "end": b + step, **out[b]} for b in starts]
+
+
+def stats() -> dict:
+    return _closed.stats()
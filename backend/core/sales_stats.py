@@ -0,0 +1,124 @@
+"""Pre-aggregated sales counters for the admin dashboard.
+
+Every order `$inc`s three sets of counters as it is written (inside the
+checkout transaction when there is one):
+- `sales_totals`: orders, revenue and units over all time;
+- `sales_daily`: the same per UTC day;
+- `product_sales`: quantity and revenue per product.
+
+The all-time and daily counters are split over `SALES_COUNTER_SLOTS`
+documents picked at random. That way concurrent checkouts do not all
+write-conflict on one document, and readers sum at most that many.
+
+`rebuild` recomputes everything from the orders collection (see
+backend/rebuild_sales_stats.py). Products are counted under the order
+lines' `product_id`, so older orders that stored it as a string should go
+through backend/migrate_order_product_ids.py first.
+"""
+import random
+from datetime import datetime, timedelta
+from pymongo import DESCENDING, UpdateOne
+from .config import settings
+
+
+def _day(ts: datetime) -> datetime:
+    return datetime(ts.year, ts.month, ts.day)
+
+
+def _lines(order: dict) -> dict:
+    """`{product id: [quantity, revenue]}` for an order's items."""
+    out = {}
+    for it in order.get("items") or ():
+        if not isinstance(it, dict) or it.get("product_id") is None:
+            continue
+        qty, price = it.get("quantity") or 0, it.get("price") or 0
+        line = out.setdefault(it["product_id"], [0, 0])
+        line[0] += qty
+        line[1] += qty * price
+    return out
+
+
+def record_order(db, order: dict, session=None, sign: int = 1):
+    """Add an order to the counters; `sign=-1` takes a deleted one out."""
+    lines = _lines(order)
+    inc = {
+        "orders": sign,
+        "revenue": sign * (order.get("total_amount") or 0),
+        "units": sign * sum(qty for qty, _ in lines.values()),
+    }
+    slot = random.randrange(settings.SALES_COUNTER_SLOTS)
+    db.sales_totals.update_one({"_id": slot}, {"$inc": inc}, upsert=True, session=session)
+    day = _day(order.get("created_at") or datetime.utcnow())
+    db.sales_daily.update_one({"day": day, "slot": slot}, {"$inc": inc}, upsert=True, session=session)
+    if lines:
+        db.product_sales.bulk_write(
+            [UpdateOne({"_id": pid}, {"$inc": {"quantity": sign * qty, "revenue": sign * revenue}}, upsert=True) for pid, (qty, revenue) in lines.items()],
+            ordered=False,
+            session=session,
+        )
+
+
+def totals(db) -> dict:
+    out = {"orders": 0, "revenue": 0, "units": 0}
+    for doc in db.sales_totals.find():
+        for k in out:
+            out[k] += doc.get(k, 0)
+    return out
+
+
+def daily(db, days: int = 30, now: datetime | None = None) -> list:
+    """Per-day counters for the last `days` days, oldest first, with empty
+    days filled in."""
+    today = _day(now or datetime.utcnow())
+    start = today - timedelta(days=days - 1)
+    buckets = {start + timedelta(days=n): {"orders": 0, "revenue": 0, "units": 0} for n in range(days)}
+    for doc in db.sales_daily.find({"day": {"$gte": start, "$lte": today}}):
+        bucket = buckets.get(doc["day"])
+        if bucket is not None:
+            for k in bucket:
+                bucket[k] += doc.get(k, 0)
+    return [{"date": day.date().isoformat(), **bucket} for day, bucket in buckets.items()]
+
+
+def top_products(db, limit: int = 10) -> list:
+    """Best sellers by quantity with their current product name (None once
+    the product is deleted), in one round trip."""
+    return list(db.product_sales.aggregate([
+        {"$match": {"quantity": {"$gt": 0}}},
+        {"$sort": {"quantity": DESCENDING, "_id": DESCENDING}},
+        {"$limit": limit},
+        {"$lookup": {"from": "products", "localField": "_id", "foreignField": "_id", "as": "product"}},
+        {"$project": {"quantity": 1, "revenue": 1, "name": {"$arrayElemAt": ["$product.name", 0]}}},
+    ]))
+
+
+def rebuild(db, batch_size: int = 1000) -> dict:
+    """Recompute every counter from the orders collection in one pass.
+
+    Orders placed while this runs may be missed or counted twice; run it
+    while checkout is quiet.
+    """
+    all_time = {"orders": 0, "revenue": 0, "units": 0}
+    by_day: dict = {}
+    by_product: dict = {}
+    for order in db.orders.find({}, {"items": 1, "total_amount": 1, "created_at": 1}).batch_size(batch_size):
+        lines = _lines(order)
+        inc = {"orders": 1, "revenue": order.get("total_amount") or 0, "units": sum(qty for qty, _ in lines.values())}
+        day = by_day.setdefault(_day(order.get("created_at") or datetime.utcnow()), {"orders": 0, "revenue": 0, "units": 0})
+        for k, v in inc.items():
+            all_time[k] += v
+            day[k] += v
+        for pid, (qty, revenue) in lines.items():
+            line = by_product.setdefault(pid, [0, 0])
+            line[0] += qty
+            line[1] += revenue
+
+    db.sales_totals.delete_many({})
+    db.sales_totals.insert_one({"_id": 0, **all_time})
+    db.sales_daily.delete_many({})
+    if by_day:
+        db.sales_daily.insert_many([{"day": day, "slot": 0, **counts} for day, counts in by_day.items()])
+    db.product_sales.delete_many({})
+    if by_product:
+        db.product_sales.insert_many([{"_id": pid, "quantity": qty, "revenue": revenue} for pid, (qty, revenue) in by_product.items()])
+    return {"orders": all_time["orders"], "days": len(by_day), "products": len(by_product)}
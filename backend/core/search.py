@@ -0,0 +1,136 @@
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# name matches count more than description matches
+FIELD_WEIGHTS = {"name": 3, "category": 2, "description": 1}
+# prefix expansions score less than an exact term, and are capped per token
+PREFIX_WEIGHT = 0.5
+MAX_PREFIX_TERMS = 50
+
+
+def tokenize(text) -> list[str]:
+    if not text:
+        return []
+    return [t.lower() for t in _TOKEN_RE.findall(str(text))]
+
+
+class SearchIndex:
+    """In-process inverted index over products with BM25 ranking.
+
+    Documents are keyed by their `_id`. The index is per process: it is built
+    from the database at startup and patched by the product CRUD routes of
+    the same worker.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ready = False
+        self._postings: dict[str, dict] = {}  # term -> {doc_id: weighted tf}
+        self._doc_terms: dict = {}  # doc_id -> Counter of terms, for removal
+        self._doc_len: dict = {}
+        self._total_len = 0
+        self._terms: list[str] = []  # sorted vocabulary for prefix lookups
+        self._lock = threading.RLock()
+
+    def _analyze(self, doc: dict) -> Counter:
+        terms = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            for tok in tokenize(doc.get(field)):
+                terms[tok] += weight
+        return terms
+
+    def add(self, doc: dict):
+        """Index (or re-index) a product document."""
+        doc_id = doc["_id"]
+        terms = self._analyze(doc)
+        with self._lock:
+            self._remove_locked(doc_id)
+            for term, tf in terms.items():
+                posting = self._postings.get(term)
+                if posting is None:
+                    posting = self._postings[term] = {}
+                    insort(self._terms, term)
+                posting[doc_id] = tf
+            length = sum(terms.values())
+            self._doc_terms[doc_id] = terms
+            self._doc_len[doc_id] = length
+            self._total_len += length
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(doc_id, None)
+            if not posting:
+                del self._postings[term]
+                i = bisect_left(self._terms, term)
+                if i < len(self._terms) and self._terms[i] == term:
+                    self._terms.pop(i)
+        self._total_len -= self._doc_len.pop(doc_id, 0)
+
+    def build(self, docs):
+        """Replace the index contents with `docs`."""
+        with self._lock:
+            self._postings.clear()
+            self._doc_terms.clear()
+            self._doc_len.clear()
+            self._total_len = 0
+            self._terms = []
+            for doc in docs:
+                self.add(doc)
+            self.ready = True
+
+    def build_from_db(self, db):
+        self.build(db.products.find({}, {"name": 1, "description": 1, "category": 1}))
+
+    def _expand(self, token: str) -> list[tuple[str, float]]:
+        out = []
+        if token in self._postings:
+            out.append((token, 1.0))
+        i = bisect_left(self._terms, token)
+        while i < len(self._terms) and len(out) < MAX_PREFIX_TERMS:
+            term = self._terms[i]
+            if not term.startswith(token):
+                break
+            if term != token:
+                out.append((term, PREFIX_WEIGHT))
+            i += 1
+        return out
+
+    def search(self, query: str) -> list[tuple]:
+        """Return `[(doc_id, score), ...]` best first; ties break on id."""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        scores: dict = {}
+        with self._lock:
+            n = len(self._doc_len)
+            if not n:
+                return []
+            avg_len = self._total_len / n
+            for token in set(tokens):
+                for term, weight in self._expand(token):
+                    posting = self._postings[term]
+                    idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                    for doc_id, tf in posting.items():
+                        norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                        scores[doc_id] = scores.get(doc_id, 0.0) + weight * idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda kv: (-kv[1], str(kv[0])))
+
+
+product_search = SearchIndex()
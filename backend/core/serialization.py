@@ -0,0 +1,80 @@
+"""One-pass BSON → JSON bytes for read-heavy routes.
+
+Handlers build plain dicts straight from Mongo documents, leaving ObjectIds
+and datetimes in place, and return `json_response(...)`: the encoder turns
+ObjectIds into strings and datetimes into ISO 8601 while it writes, and the
+raw `Response` keeps FastAPI from walking the result again with
+`jsonable_encoder`. orjson is used when installed, the stdlib otherwise.
+"""
+import json
+from datetime import date, datetime
+from bson import ObjectId
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+
+def _default(v):
+    # only called for types the encoder does not know natively
+    if isinstance(v, ObjectId):
+        return str(v)
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, bytes):
+        return v.decode("utf-8", "replace")
+    # Decimal128, Int64 subclasses, etc.
+    return str(v)
+
+
+if orjson is not None:
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+else:
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, default=_default, separators=(",", ":")).encode()
+
+
+def json_response(content, status_code: int = 200, headers: dict | None = None) -> Response:
+    return Response(content=dumps(content), status_code=status_code, headers=headers, media_type="application/json")
+
+
+def bson_doc(doc: dict) -> dict:
+    """Expose `_id` as `id`; everything else is left for the encoder."""
+    if not isinstance(doc, dict):
+        return doc
+    out = {"id": doc["_id"]} if "_id" in doc else {}
+    out.update((k, v) for k, v in doc.items() if k != "_id")
+    return out
+
+
+ORDER_PROJECTION = {"user_id": 1, "items": 1, "total_amount": 1, "payment_status": 1, "created_at": 1, "simulated": 1}
+
+
+def order_product_id(product_id):
+    """How order lines store a product id: an ObjectId, like carts and holds.
+    Ids that are not ObjectIds (lines for unknown products) are kept as is."""
+    if isinstance(product_id, str) and ObjectId.is_valid(product_id):
+        return ObjectId(product_id)
+    return product_id or None
+
+
+def order_doc(d: dict) -> dict:
+    """The public shape of an order document (see `OrderOut`)."""
+    items = []
+    for it in d.get("items") or ():
+        if isinstance(it, dict):
+            items.append({"product_id": it.get("product_id"), "quantity": it.get("quantity"), "price": it.get("price"), "name": it.get("name")})
+        else:
+            items.append({"product_id": None, "quantity": None, "price": None, "name": None})
+    return {
+        "id": d.get("_id"),
+        "user_id": d.get("user_id"),
+        "items": items,
+        "total_amount": d.get("total_amount"),
+        "payment_status": d.get("payment_status"),
+        "created_at": d.get("created_at"),
+        "simulated": bool(d.get("simulated", False)),
+    }
@@ -0,0 +1,158 @@
+"""Sharded stock counters for hot products.
+
+A product flagged with `stock_shards: K` keeps its sellable units in K
+documents of the `stock_shards` collection. It no longer keeps them in its
+own `stock` field, so concurrent checkouts spread their `$inc`s over K
+documents instead of queueing on one. Each shard holds units that are
+free to sell. Units held in carts are taken out of a shard when the hold is
+placed and go back into one when it is released, so `products.held` stays
+0 for sharded products.
+
+The product's `stock` field becomes a display value: the shard sum, cached
+briefly in process and written back at most every
+`STOCK_SHARD_REFRESH_SECONDS` per product.
+"""
+import random
+import threading
+import time
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING
+from .cache import QueryCache
+from .config import settings
+from .etag import bump_catalog_version
+
+
+MAX_SHARDS = 64
+# how long a worker trusts its list of sharded products
+REGISTRY_TTL = 5.0
+
+_totals = QueryCache(maxsize=4096, ttl=settings.STOCK_SHARD_CACHE_SECONDS)
+
+
+class _Registry:
+    """Which products are sharded, and into how many shards."""
+
+    def __init__(self):
+        self._shards: dict = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def shards(self, db) -> dict:
+        if time.monotonic() - self._loaded_at > REGISTRY_TTL:
+            with self._lock:
+                if time.monotonic() - self._loaded_at > REGISTRY_TTL:
+                    self._shards = {p["_id"]: p["stock_shards"] for p in db.products.find({"stock_shards": {"$gt": 0}}, {"stock_shards": 1})}
+                    self._loaded_at = time.monotonic()
+        return self._shards
+
+    def invalidate(self):
+        self._loaded_at = 0.0
+
+
+registry = _Registry()
+
+
+def is_sharded(db, pid) -> bool:
+    return pid in registry.shards(db)
+
+
+def shard_total(db, pid, fresh: bool = False) -> int:
+    """Sum of a product's shards (units free to sell), cached briefly."""
+    if not fresh:
+        cached = _totals.get(pid)
+        if cached is not None:
+            return cached
+    total = sum(s.get("stock", 0) for s in db.stock_shards.find({"product_id": pid}, {"stock": 1}))
+    _totals.set(pid, total)
+    return total
+
+
+_last_refresh: dict = {}
+
+
+def touch(db, pid):
+    """Note that a product's shards changed; its display `stock` is
+    rewritten (bumping the catalog version, so cached listings and ETags
+    follow) at most every `STOCK_SHARD_REFRESH_SECONDS`."""
+    now = time.monotonic()
+    if now - _last_refresh.get(pid, 0.0) < settings.STOCK_SHARD_REFRESH_SECONDS:
+        return
+    _last_refresh[pid] = now
+    total = shard_total(db, pid, fresh=True)
+    res = db.products.update_one({"_id": pid, "stock_shards": {"$gt": 0}}, {"$set": {"stock": total, "updated_at": datetime.utcnow()}, "$inc": {"version": 1}})
+    if res.modified_count:
+        bump_catalog_version(db)
+
+
+def take(db, pid, quantity: int, session=None) -> bool:
+    """Take `quantity` units from the product's shards; all or nothing.
+
+    Tries one random shard first (the common case under contention), then
+    the fullest shard, and only then gathers units across shards.
+    """
+    if quantity <= 0:
+        return True
+    k = random.randrange(registry.shards(db).get(pid, 1))
+    for flt, sort in (
+        ({"product_id": pid, "shard": {"$gte": k}, "stock": {"$gte": quantity}}, [("shard", ASCENDING)]),
+        ({"product_id": pid, "stock": {"$gte": quantity}}, [("stock", DESCENDING)]),
+    ):
+        if db.stock_shards.find_one_and_update(flt, {"$inc": {"stock": -quantity}}, sort=sort, projection={"_id": 1}, session=session):
+            return True
+
+    taken = []
+    remaining = quantity
+    for shard in db.stock_shards.find({"product_id": pid, "stock": {"$gt": 0}}, {"stock": 1}, session=session).sort("stock", DESCENDING):
+        part = min(shard["stock"], remaining)
+        res = db.stock_shards.update_one({"_id": shard["_id"], "stock": {"$gte": part}}, {"$inc": {"stock": -part}}, session=session)
+        if res.modified_count:
+            taken.append((shard["_id"], part))
+            remaining -= part
+            if not remaining:
+                return True
+    for shard_id, part in taken:
+        db.stock_shards.update_one({"_id": shard_id}, {"$inc": {"stock": part}}, session=session)
+    return False
+
+
+def give(db, pid, quantity: int, session=None):
+    """Put `quantity` units back into one of the product's shards."""
+    if quantity <= 0:
+        return
+    k = random.randrange(registry.shards(db).get(pid, 1))
+    db.stock_shards.update_one({"product_id": pid, "shard": k}, {"$inc": {"stock": quantity}}, upsert=True, session=session)
+
+
+def _held_units(db, pid) -> int:
+    return sum(h["quantity"] for h in db.inventory_holds.find({"product_id": pid}, {"quantity": 1}))
+
+
+def configure(db, pid, shards: int, stock: int | None = None) -> int:
+    """Split a product's stock over `shards` counters (0 turns sharding off).
+
+    `stock` is the on-hand count to distribute (defaults to the current
+    stock); units already held in carts stay with their holds. Returns the
+    units free to sell. Meant for admin use while the product is quiet:
+    decrements racing with the switch may be lost.
+    """
+    prod = db.products.find_one({"_id": pid}, {"stock": 1, "held": 1, "stock_shards": 1})
+    if prod is None:
+        return None
+    held = _held_units(db, pid)
+    if stock is None:
+        # on hand = free units + held units, however they are tracked today
+        free = shard_total(db, pid, fresh=True) if prod.get("stock_shards") else prod.get("stock", 0) - prod.get("held", 0)
+        stock = free + held
+    free = max(stock - held, 0)
+    now = datetime.utcnow()
+    db.stock_shards.delete_many({"product_id": pid})
+    if shards > 0:
+        base, extra = divmod(free, shards)
+        db.stock_shards.insert_many([{"product_id": pid, "shard": i, "stock": base + (1 if i < extra else 0)} for i in range(shards)])
+        db.products.update_one({"_id": pid}, {"$set": {"stock_shards": shards, "stock": free, "held": 0, "updated_at": now}, "$inc": {"version": 1}})
+    else:
+        db.products.update_one({"_id": pid}, {"$set": {"stock": stock, "held": held, "updated_at": now}, "$unset": {"stock_shards": ""}, "$inc": {"version": 1}})
+    _totals.delete(pid)
+    registry.invalidate()
+    bump_catalog_version(db)
+    return free
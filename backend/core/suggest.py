@@ -0,0 +1,191 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+
+
+# prefixes this short match a large part of the index, so they keep a
+# running top list instead of scanning their key range per keystroke
+TOP_PREFIX_LEN = 2
+# entries kept per short prefix (room for the largest `limit`)
+TOP_K = 50
+# sales shift rankings only slowly, so memoized answers may lag them this long
+MEMO_TTL = 30.0
+
+
+def _order(item):
+    # most sold first, then names starting with the prefix, then by name
+    (rank, label) = item[1]
+    return (-rank[0], not rank[1], label.lower())
+
+
+def _name_keys(name: str) -> list[str]:
+    # every word-start suffix, so "lap" finds "Ultra Laptop"
+    tokens = (name or "").lower().split()
+    return [" ".join(tokens[i:]) for i in range(len(tokens))]
+
+
+class SuggestIndex:
+    """Sorted-array prefix index over product names and categories.
+
+    Suggestions are ranked by popularity (units sold). Like the search
+    index it is per process: built at startup and patched by product CRUD
+    and checkout in the same worker.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._keys: list[tuple] = []  # sorted (key, kind, ref)
+        self._products: dict = {}  # product id str -> {"name", "category"}
+        self._categories: dict = {}  # category -> number of products
+        self._popularity: dict = {}  # product id str -> units sold
+        self._category_popularity: dict = {}
+        # answers memoized until the next catalog change (or MEMO_TTL); keeps
+        # 1-2 letter prefixes cheap
+        self._memo: dict = {}
+        # short prefix -> {(kind, ref): (rank, label)}, best TOP_K over the
+        # whole prefix range; rebuilt lazily after catalog changes, kept
+        # current by record_sale
+        self._top: dict = {}
+        self._lock = threading.RLock()
+
+    def _insert(self, entry):
+        insort(self._keys, entry)
+
+    def _delete(self, entry):
+        i = bisect_left(self._keys, entry)
+        if i < len(self._keys) and self._keys[i] == entry:
+            self._keys.pop(i)
+
+    def add_product(self, doc: dict):
+        pid = str(doc["_id"])
+        with self._lock:
+            self._remove_locked(pid)
+            name, category = doc.get("name") or "", doc.get("category")
+            for key in _name_keys(name):
+                self._insert((key, "product", pid))
+            if category:
+                count = self._categories.get(category, 0)
+                if not count:
+                    self._insert((category.lower(), "category", category))
+                self._categories[category] = count + 1
+                self._category_popularity[category] = self._category_popularity.get(category, 0) + self._popularity.get(pid, 0)
+            self._products[pid] = {"name": name, "lower": name.lower(), "category": category}
+            self._memo.clear()
+            self._top.clear()
+
+    def remove_product(self, product_id):
+        with self._lock:
+            self._remove_locked(str(product_id))
+
+    def _remove_locked(self, pid: str):
+        prev = self._products.pop(pid, None)
+        if prev is None:
+            return
+        self._memo.clear()
+        self._top.clear()
+        for key in _name_keys(prev["name"]):
+            self._delete((key, "product", pid))
+        category = prev["category"]
+        if category:
+            self._category_popularity[category] = self._category_popularity.get(category, 0) - self._popularity.get(pid, 0)
+            count = self._categories.get(category, 0) - 1
+            if count > 0:
+                self._categories[category] = count
+            else:
+                self._categories.pop(category, None)
+                self._category_popularity.pop(category, None)
+                self._delete((category.lower(), "category", category))
+
+    def record_sale(self, product_id, quantity: int):
+        pid = str(product_id)
+        with self._lock:
+            self._popularity[pid] = self._popularity.get(pid, 0) + quantity
+            prod = self._products.get(pid)
+            if prod and prod["category"]:
+                self._category_popularity[prod["category"]] = self._category_popularity.get(prod["category"], 0) + quantity
+            if prod and self._top:
+                # popularity only grows, so entries trimmed earlier cannot outrank these
+                self._raise_in_top(("product", pid), _name_keys(prod["name"]))
+                if prod["category"]:
+                    self._raise_in_top(("category", prod["category"]), [prod["category"].lower()])
+
+    def _raise_in_top(self, entry: tuple, keys: list):
+        for p in {key[:n] for key in keys for n in range(1, TOP_PREFIX_LEN + 1)}:
+            top = self._top.get(p)
+            if top is None:
+                continue
+            top[entry] = self._rank(entry[0], entry[1], p)
+            if len(top) > TOP_K:
+                worst = max(top.items(), key=_order)
+                del top[worst[0]]
+
+    def build(self, docs, popularity: dict):
+        with self._lock:
+            self._keys, self._products, self._categories, self._category_popularity = [], {}, {}, {}
+            self._memo = {}
+            self._top = {}
+            self._popularity = {str(k): v for k, v in popularity.items()}
+            for doc in docs:
+                self.add_product(doc)
+            self.ready = True
+
+    def build_from_db(self, db):
+        popularity = {}
+        for r in db.orders.aggregate([
+            {"$unwind": "$items"},
+            {"$group": {"_id": "$items.product_id", "units": {"$sum": "$items.quantity"}}},
+        ]):
+            if r["_id"] is not None:
+                popularity[str(r["_id"])] = popularity.get(str(r["_id"]), 0) + r["units"]
+        self.build(db.products.find({}, {"name": 1, "category": 1}), popularity)
+
+    def _rank(self, kind: str, ref: str, p: str):
+        if kind == "product":
+            prod = self._products[ref]
+            return (self._popularity.get(ref, 0), prod["lower"].startswith(p)), prod["name"]
+        return (self._category_popularity.get(ref, 0), True), ref
+
+    def _scan(self, p: str) -> dict:
+        """Every entry whose key starts with `p`, with its best rank."""
+        seen = {}
+        i = bisect_left(self._keys, (p,))
+        while i < len(self._keys):
+            key, kind, ref = self._keys[i]
+            if not key.startswith(p):
+                break
+            rank, label = self._rank(kind, ref, p)
+            # a product matched on several words keeps its best rank
+            if (kind, ref) not in seen or seen[(kind, ref)][0] < rank:
+                seen[(kind, ref)] = (rank, label)
+            i += 1
+        return seen
+
+    def suggest(self, prefix: str, limit: int = 8) -> list[dict]:
+        p = " ".join((prefix or "").lower().split())
+        if not p:
+            return []
+        with self._lock:
+            memo = self._memo.get((p, limit))
+            if memo is not None and memo[0] > time.monotonic():
+                return memo[1]
+            if len(p) <= TOP_PREFIX_LEN:
+                seen = self._top.get(p)
+                if seen is None:
+                    seen = self._top[p] = dict(heapq.nsmallest(TOP_K, self._scan(p).items(), key=_order))
+            else:
+                seen = self._scan(p)
+            best = heapq.nsmallest(limit, seen.items(), key=_order)
+            out = []
+            for (kind, ref), (_, label) in best:
+                if kind == "product":
+                    out.append({"type": "product", "id": ref, "name": label})
+                else:
+                    out.append({"type": "category", "name": label})
+            if len(self._memo) > 10000:
+                self._memo.clear()
+            self._memo[(p, limit)] = (time.monotonic() + MEMO_TTL, out)
+        return out
+
+
+product_suggest = SuggestIndex()
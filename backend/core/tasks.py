@@ -0,0 +1,183 @@
+"""Durable background tasks: a Mongo outbox drained by an in-process pool.
+
+`enqueue` writes a task to the `outbox` collection. Pass the request's
+session so the task commits (or not) with the order. A dispatcher thread claims due
+tasks with a lease and hands them to a bounded pool of worker threads;
+failures are retried with exponential backoff up to `TASK_MAX_ATTEMPTS`.
+Tasks whose worker died are picked up again once their lease expires, so
+handlers must be safe to run more than once.
+"""
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, ReturnDocument
+from .config import settings
+from .logging import logger
+
+
+_handlers: dict = {}
+
+
+def task(name: str):
+    """Register `fn(db, payload)` as the handler for tasks named `name`."""
+    def register(fn):
+        _handlers[name] = fn
+        return fn
+    return register
+
+
+def enqueue(db, name: str, payload: dict, session=None, delay: float = 0):
+    now = datetime.utcnow()
+    db.outbox.insert_one({
+        "name": name,
+        "payload": payload,
+        "status": "pending",
+        "attempts": 0,
+        "created_at": now,
+        "run_after": now + timedelta(seconds=delay),
+    }, session=session)
+
+
+class TaskQueue:
+    def __init__(self, get_db, workers: int, queue_size: int):
+        self._get_db = get_db
+        self.workers = workers
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._owner = uuid.uuid4().hex
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: list = []
+        self._lock = threading.Lock()
+        self.running = 0
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            self._threads = [threading.Thread(target=self._dispatch, name="task-dispatcher", daemon=True)]
+            self._threads += [threading.Thread(target=self._work, name=f"task-worker-{n}", daemon=True) for n in range(self.workers)]
+            for t in self._threads:
+                t.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        self._stopping.set()
+        self._wake.set()
+        for _ in range(self.workers):
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+        for t in threads:
+            t.join(timeout)
+
+    def notify(self):
+        """Look for due tasks now rather than at the next poll."""
+        self.start()
+        self._wake.set()
+
+    def _claim(self, db):
+        now = datetime.utcnow()
+        return db.outbox.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "run_after": {"$lte": now}},
+                # the worker that held it died
+                {"status": "running", "locked_until": {"$lt": now}},
+            ]},
+            {"$set": {"status": "running", "owner": self._owner, "locked_until": now + timedelta(seconds=settings.TASK_LEASE_SECONDS)}, "$inc": {"attempts": 1}},
+            sort=[("run_after", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _dispatch(self):
+        while not self._stopping.is_set():
+            try:
+                db = self._get_db()
+                # only claim what the pool can start soon; the rest stays in the outbox
+                while not self._stopping.is_set() and not self._queue.full():
+                    doc = self._claim(db)
+                    if doc is None:
+                        break
+                    self._queue.put(doc)
+            except Exception:
+                logger.exception("Claiming outbox tasks failed")
+            self._wake.wait(settings.TASK_POLL_SECONDS)
+            self._wake.clear()
+
+    def _work(self):
+        while True:
+            doc = self._queue.get()
+            if doc is None or self._stopping.is_set():
+                return
+            with self._lock:
+                self.running += 1
+            try:
+                self._run(doc)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                # a slot freed up; let the dispatcher refill it
+                self._wake.set()
+
+    def _run(self, doc: dict):
+        db = self._get_db()
+        mine = {"_id": doc["_id"], "owner": self._owner}
+        try:
+            handler = _handlers[doc["name"]]
+            handler(db, doc.get("payload") or {})
+        except Exception as e:
+            now = datetime.utcnow()
+            if doc["attempts"] >= settings.TASK_MAX_ATTEMPTS:
+                logger.exception("Task %s (%s) failed permanently", doc["name"], doc["_id"])
+                db.outbox.update_one(mine, {"$set": {"status": "failed", "failed_at": now, "last_error": repr(e)}, "$unset": {"locked_until": ""}})
+                with self._lock:
+                    self.failed += 1
+            else:
+                delay = min(2 ** doc["attempts"], 300)
+                logger.warning("Task %s (%s) failed, retrying in %ss: %r", doc["name"], doc["_id"], delay, e)
+                db.outbox.update_one(mine, {"$set": {"status": "pending", "run_after": now + timedelta(seconds=delay), "last_error": repr(e)}, "$unset": {"locked_until": ""}})
+                with self._lock:
+                    self.retried += 1
+            return
+        db.outbox.update_one(mine, {"$set": {"status": "done", "finished_at": datetime.utcnow()}, "$unset": {"locked_until": ""}})
+        with self._lock:
+            self.processed += 1
+
+    def stats(self) -> dict:
+        """Queue depth and lag. `lag_seconds` is how long the oldest due
+        task has been waiting."""
+        db = self._get_db()
+        now = datetime.utcnow()
+        oldest = db.outbox.find_one({"status": "pending", "run_after": {"$lte": now}}, {"run_after": 1}, sort=[("run_after", ASCENDING)])
+        with self._lock:
+            local = {
+                "workers": self.workers,
+                "started": bool(self._threads),
+                "queued": self._queue.qsize(),
+                "running": self.running,
+                "processed": self.processed,
+                "retried": self.retried,
+                "failed": self.failed,
+            }
+        return {
+            **local,
+            "pending": db.outbox.count_documents({"status": "pending"}),
+            "in_progress": db.outbox.count_documents({"status": "running"}),
+            "dead": db.outbox.count_documents({"status": "failed"}),
+            "lag_seconds": (now - oldest["run_after"]).total_seconds() if oldest else 0.0,
+        }
+
+
+def _get_db():
+    from ..database.connection import get_db
+    return get_db()
+
+
+task_queue = TaskQueue(_get_db, workers=settings.TASK_WORKERS, queue_size=settings.TASK_QUEUE_SIZE)
@@ -0,0 +1,151 @@
+"""Declarative registry of the MongoDB indexes the API relies on.
+
+`ensure_indexes` creates anything missing (it is idempotent and runs at
+startup), `verify_indexes` only reports. Use `backend/ensure_indexes.py` to
+run either from the command line ahead of a deploy.
+"""
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure, PyMongoError
+from ..core.config import settings
+from ..core.logging import logger
+
+
+# collection -> list of (keys, options); names are left to Mongo's defaults so
+# indexes created by older seed scripts are recognised as the same index
+INDEXES = {
+    "products": [
+        # $text search in list_products
+        ([("name", TEXT), ("description", TEXT)], {}),
+        # category filter + price range / price sorts
+        ([("category", ASCENDING), ("price", ASCENDING), ("_id", ASCENDING)], {}),
+        ([("price", ASCENDING), ("_id", ASCENDING)], {}),
+        # sort=newest
+        ([("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+        # bulk import upserts on sku; products without one are not indexed
+        ([("sku", ASCENDING)], {"unique": True, "partialFilterExpression": {"sku": {"$type": "string"}}}),
+    ],
+    "carts": [
+        ([("user_id", ASCENDING)], {"unique": True}),
+    ],
+    "orders": [
+        # /orders/me and the admin user filter; _id matches the keyset sort
+        ([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+        # admin listing, insights recent orders
+        ([("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+        # admin status filter
+        ([("payment_status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+    ],
+    "users": [
+        ([("email", ASCENDING)], {"unique": True}),
+    ],
+    "login_failures": [
+        ([("ip", ASCENDING), ("created_at", ASCENDING)], {}),
+        # attempts only matter for an hour; keep a day for auditing
+        ([("created_at", ASCENDING)], {"expireAfterSeconds": 24 * 60 * 60}),
+    ],
+    "refresh_tokens": [
+        ([("jti", ASCENDING)], {"unique": True}),
+        ([("user_id", ASCENDING)], {}),
+        ([("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    ],
+    "inventory_holds": [
+        # one hold per cart line
+        ([("user_id", ASCENDING), ("product_id", ASCENDING)], {"unique": True}),
+        # sweeper
+        ([("expires_at", ASCENDING)], {}),
+        # checkout claims
+        ([("claimed_by", ASCENDING)], {}),
+    ],
+    "stock_shards": [
+        ([("product_id", ASCENDING), ("shard", ASCENDING)], {"unique": True}),
+    ],
+    "idempotency_keys": [
+        ([("created_at", ASCENDING)], {"expireAfterSeconds": settings.IDEMPOTENCY_KEY_TTL}),
+    ],
+    "sales_daily": [
+        ([("day", ASCENDING), ("slot", ASCENDING)], {"unique": True}),
+    ],
+    "product_sales": [
+        # top sellers
+        ([("quantity", DESCENDING), ("_id", DESCENDING)], {}),
+    ],
+    "outbox": [
+        # claiming due tasks
+        ([("status", ASCENDING), ("run_after", ASCENDING)], {}),
+        # finished tasks are kept a week for debugging
+        ([("finished_at", ASCENDING)], {"expireAfterSeconds": 7 * 24 * 60 * 60}),
+    ],
+}
+
+
+def _models(specs) -> list[IndexModel]:
+    return [IndexModel(keys, **opts) for keys, opts in specs]
+
+
+def ensure_indexes(db) -> dict:
+    """Create every registered index. Returns `{collection: {"created": [...], "errors": {...}}}`.
+
+    Each index is created separately so one conflict (e.g. duplicate data
+    under a unique index) does not block the others.
+    """
+    report = {}
+    for coll_name, specs in INDEXES.items():
+        coll = db[coll_name]
+        created, errors = [], {}
+        existing = set(coll.index_information().keys())
+        for model in _models(specs):
+            name = model.document["name"]
+            if name in existing:
+                continue
+            try:
+                coll.create_indexes([model])
+                created.append(name)
+            except PyMongoError as e:
+                errors[name] = str(e)
+                logger.warning("Failed to create index %s.%s: %s", coll_name, name, e)
+        report[coll_name] = {"created": created, "errors": errors}
+    return report
+
+
+def _index_usage(coll) -> dict:
+    # $indexStats counts accesses since the server (re)started
+    try:
+        return {s["name"]: s.get("accesses", {}).get("ops", 0) for s in coll.aggregate([{"$indexStats": {}}])}
+    except OperationFailure:
+        return {}
+
+
+# options that change what an index enforces or keeps
+COMPARED_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+
+def _differs(model: IndexModel, info: dict) -> bool:
+    """Whether an existing index (from `index_information()`) has other keys
+    or options than the registered `model` under the same name."""
+    doc = model.document
+    # text indexes are stored under _fts/_ftsx keys; their name already
+    # encodes the indexed fields
+    if TEXT not in doc["key"].values() and list(doc["key"].items()) != [(k, v) for k, v in info["key"]]:
+        return True
+    return any(doc.get(opt) != info.get(opt) for opt in COMPARED_OPTIONS)
+
+
+def verify_indexes(db) -> dict:
+    """Report registered indexes that are missing or exist with other keys or
+    options ("different"), plus existing ones that are not registered or have
+    not been used since the server started."""
+    report = {}
+    for coll_name, specs in INDEXES.items():
+        coll = db[coll_name]
+        info = coll.index_information()
+        existing = set(info.keys())
+        models = _models(specs)
+        wanted = {m.document["name"] for m in models}
+        usage = _index_usage(coll)
+        report[coll_name] = {
+            "missing": sorted(wanted - existing),
+            "different": sorted(m.document["name"] for m in models if m.document["name"] in info and _differs(m, info[m.document["name"]])),
+            "unregistered": sorted(existing - wanted - {"_id_"}),
+            "unused": sorted(name for name, ops in usage.items() if ops == 0 and name != "_id_"),
+        }
+    return report
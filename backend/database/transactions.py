@@ -0,0 +1,34 @@
+from ..core.logging import logger
+
+
+_supports_transactions = None
+
+
+def supports_transactions(db) -> bool:
+    """Multi-document transactions need a replica set or mongos; a standalone
+    development mongod does not have them."""
+    global _supports_transactions
+    if _supports_transactions is None:
+        try:
+            hello = db.client.admin.command("hello")
+            _supports_transactions = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        except Exception:
+            _supports_transactions = False
+        if not _supports_transactions:
+            logger.warning("MongoDB deployment has no transaction support; multi-document writes are not atomic")
+    return _supports_transactions
+
+
+def run_in_transaction(db, callback):
+    """Run `callback(session)` inside a transaction and return its result.
+
+    `with_transaction` retries the whole callback on transient errors
+    (e.g. write conflicts between concurrent checkouts) and retries the
+    commit when its outcome is unknown. Without transaction support the
+    callback runs once with `session=None`, so it must stay safe (if not
+    atomic) in that mode.
+    """
+    if not supports_transactions(db):
+        return callback(None)
+    with db.client.start_session() as session:
+        return session.with_transaction(callback)
@@ -0,0 +1,34 @@
+"""Create (or just check) the MongoDB indexes declared in backend/database/indexes.py.
+Run: python backend/ensure_indexes.py [--check]
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Make the project root importable so this script can be run directly
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backend.database.connection import get_db
+from backend.database.indexes import ensure_indexes, verify_indexes
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--check", action="store_true", help="only report missing/different/unused indexes, exit 1 if any are missing or different")
+    args = parser.parse_args(argv)
+
+    db = get_db()
+    if not args.check:
+        created = ensure_indexes(db)
+        print(json.dumps({"created": created}, indent=2))
+    report = verify_indexes(db)
+    print(json.dumps({"verify": report}, indent=2))
+    broken = any(r["missing"] or r["different"] for r in report.values())
+    return 1 if broken else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
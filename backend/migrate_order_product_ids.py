@@ -0,0 +1,56 @@
+"""Store order line product ids as ObjectIds (older orders have strings).
+Run: python backend/migrate_order_product_ids.py [--dry-run]
+
+Safe to run more than once, and while the shop is live: only lines still
+holding a valid ObjectId string are rewritten. Rebuild the sales counters
+afterwards (backend/rebuild_sales_stats.py) if orders predate them.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Make the project root importable so this script can be run directly
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from pymongo import UpdateOne
+from backend.database.connection import get_db
+from backend.core.serialization import order_product_id
+
+
+def migrate(db, batch_size: int = 1000, dry_run: bool = False) -> dict:
+    scanned = changed = 0
+    ops = []
+    for order in db.orders.find({"items.product_id": {"$type": "string"}}, {"items": 1}).batch_size(batch_size):
+        scanned += 1
+        items = order.get("items") or []
+        fixed = [{**it, "product_id": order_product_id(it.get("product_id"))} if isinstance(it, dict) else it for it in items]
+        if fixed == items:
+            # only non-ObjectId strings (lines for unknown products) left
+            continue
+        changed += 1
+        # match the lines we read so a concurrent edit is not overwritten
+        ops.append(UpdateOne({"_id": order["_id"], "items": items}, {"$set": {"items": fixed}}))
+        if len(ops) >= batch_size:
+            if not dry_run:
+                db.orders.bulk_write(ops, ordered=False)
+            ops = []
+    if ops and not dry_run:
+        db.orders.bulk_write(ops, ordered=False)
+    return {"scanned": scanned, "changed": changed, "dry_run": dry_run}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="count the orders that would change without writing")
+    parser.add_argument("--batch-size", type=int, default=1000, help="orders per read batch and bulk write")
+    args = parser.parse_args(argv)
+
+    print(json.dumps(migrate(get_db(), batch_size=args.batch_size, dry_run=args.dry_run), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
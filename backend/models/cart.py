@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Literal, Optional
 
 
 class CartItem(BaseModel):
@@ -17,3 +17,14 @@ class CartOut(BaseModel):
     user_id: str
     items: List[CartItem]
     updated_at: str | None = None
+
+
+class CartOperation(BaseModel):
+    op: Literal["add", "set", "remove"]
+    product_id: str
+    quantity: int = Field(1, ge=0)  # "set" with 0 removes the line
+    price: Optional[int] = Field(None, ge=0)  # defaults to the product's current price
+
+
+class CartPatch(BaseModel):
+    operations: List[CartOperation] = Field(..., min_length=1, max_length=100)
@@ -9,6 +9,7 @@ class ProductBase(BaseModel):
     stock: int = Field(..., ge=0)
     category: Optional[str] = None
     images: Optional[List[str]] = []
+    sku: Optional[str] = None
 
 
 class ProductCreate(ProductBase):
@@ -22,6 +23,7 @@ class ProductUpdate(BaseModel):
     stock: Optional[int] = None
     category: Optional[str] = None
     images: Optional[List[str]] = None
+    sku: Optional[str] = None
 
 
 class ProductOut(ProductBase):
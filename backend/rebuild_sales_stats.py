@@ -0,0 +1,28 @@
+"""Recompute the admin dashboard's sales counters from the orders collection.
+Run: python backend/rebuild_sales_stats.py
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Make the project root importable so this script can be run directly
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backend.database.connection import get_db
+from backend.core.sales_stats import rebuild
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=1000, help="orders fetched per round trip")
+    args = parser.parse_args(argv)
+
+    print(json.dumps(rebuild(get_db(), batch_size=args.batch_size), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
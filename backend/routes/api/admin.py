@@ -1,42 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from ...core.security import require_admin
 from ...database.connection import get_db
+from ...core.cache import catalog_cache
+from ...core.idempotency import idempotency_store
+from ...core.serialization import bson_doc, json_response
+from ...core.holds import reconcile_held
+from ...core.tasks import task_queue
+from ...core.sales_stats import daily as daily_sales, record_order, top_products, totals as sales_totals
+from ...core import sales_analytics
 from bson import ObjectId
 from datetime import datetime
 import bcrypt
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 from pydantic import BaseModel
 
-from bson import ObjectId as BsonObjectId
-
-
-def _serialize_value(v):
-    # convert ObjectId and other BSON types to JSON-safe values
-    try:
-        if isinstance(v, BsonObjectId):
-            return str(v)
-    except Exception:
-        pass
-    # nested structures
-    if isinstance(v, dict):
-        return {k: _serialize_value(val) for k, val in v.items()}
-    if isinstance(v, list):
-        return [_serialize_value(x) for x in v]
-    return v
-
-
-def _normalize_doc(doc: dict) -> dict:
-    if not isinstance(doc, dict):
-        return doc
-    out = {}
-    for k, v in doc.items():
-        if k == "_id":
-            out["id"] = str(v)
-            continue
-        out[k] = _serialize_value(v)
-    return out
-
 
 class AdminCreateUser(BaseModel):
     username: str
@@ -127,7 +105,10 @@ def delete_user(user_id: str, user=Depends(require_admin)):
     res = db.users.delete_one({"_id": oid})
     # cleanup related data: carts, orders, refresh_tokens
     db.carts.delete_many({"user_id": oid})
+    for order in db.orders.find({"user_id": oid}, {"items": 1, "total_amount": 1, "created_at": 1}):
+        record_order(db, order, sign=-1)
     db.orders.delete_many({"user_id": oid})
+    sales_analytics.forget()
     db.refresh_tokens.delete_many({"user_id": oid})
     if res.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
@@ -136,72 +117,74 @@ def delete_user(user_id: str, user=Depends(require_admin)):
 
 @router.get("/admin/insights")
 def insights(user=Depends(require_admin)):
+    """Dashboard numbers. Sales figures come from the counters in
+    `sales_stats` and collection sizes from metadata, so the cost does not
+    grow with order history."""
     db = get_db()
-    users_count = db.users.count_documents({})
-    products_count = db.products.count_documents({})
-    orders_count = db.orders.count_documents({})
-    carts_count = db.carts.count_documents({})
-    revenue_cursor = db.orders.aggregate([
-        {"$group": {"_id": None, "total": {"$sum": "$total_amount"}}}
-    ])
-    revenue = 0
-    try:
-        for r in revenue_cursor:
-            revenue = r.get("total", 0)
-    except Exception:
-        revenue = 0
+    sales = sales_totals(db)
 
     # simple recent orders sample
     recent = []
     for d in db.orders.find().sort("created_at", -1).limit(10):
-        recent.append(_normalize_doc(d))
+        recent.append(bson_doc(d))
 
-    # aggregate top selling products
-    product_sales = []
-    try:
-        pipeline = [
-            {"$unwind": "$items"},
-            {"$group": {"_id": "$items.product_id", "quantity": {"$sum": "$items.quantity"}, "revenue": {"$sum": {"$multiply": ["$items.quantity", "$items.price"]}}}},
-            {"$sort": {"quantity": -1}},
-            {"$limit": 10}
-        ]
-        for r in db.orders.aggregate(pipeline):
-            pid = r.get("_id")
-            prod = None
-            try:
-                # pid can be ObjectId or string; handle both
-                if isinstance(pid, BsonObjectId):
-                    prod = db.products.find_one({"_id": pid})
-                else:
-                    try:
-                        prod = db.products.find_one({"_id": ObjectId(pid)}) if pid else None
-                    except Exception:
-                        prod = None
-            except Exception:
-                prod = None
-            product_sales.append({
-                "product_id": str(pid) if pid else None,
-                "name": prod.get("name") if prod else None,
-                "quantity": r.get("quantity", 0),
-                "revenue": r.get("revenue", 0),
-            })
-    except Exception:
-        product_sales = []
+    product_sales = [
+        {"product_id": r["_id"], "name": r.get("name"), "quantity": r.get("quantity", 0), "revenue": r.get("revenue", 0)}
+        for r in top_products(db)
+    ]
 
     # visitors count if tracked
     visitors_count = 0
     try:
-        visitors_count = db.visitors.count_documents({}) if "visitors" in db.list_collection_names() else 0
+        visitors_count = db.visitors.estimated_document_count()
     except Exception:
         visitors_count = 0
 
-    return {
-        "users_count": users_count,
-        "products_count": products_count,
-        "orders_count": orders_count,
-        "carts_count": carts_count,
-        "total_revenue": revenue,
+    return json_response({
+        "users_count": db.users.estimated_document_count(),
+        "products_count": db.products.estimated_document_count(),
+        "orders_count": sales["orders"],
+        "carts_count": db.carts.estimated_document_count(),
+        "total_revenue": sales["revenue"],
         "recent_orders": recent,
         "product_sales": product_sales,
+        "daily_sales": daily_sales(db),
         "visitors_count": visitors_count,
-    }
+    })
+
+
+@router.get("/admin/analytics/sales")
+def sales_analytics_series(
+    granularity: str = "day",
+    created_from: Optional[datetime] = Query(None, alias="from"),
+    created_to: Optional[datetime] = Query(None, alias="to"),
+    user=Depends(require_admin),
+):
+    """Orders, revenue and units per hour, day or week (UTC, weeks start on
+    Monday) for the whole buckets overlapping `[from, to)`. `to` defaults to
+    now; `from` defaults to the last 48 hours, 30 days or 12 weeks."""
+    try:
+        buckets = sales_analytics.sales_series(get_db(), granularity, created_from, created_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return json_response({"granularity": granularity, "buckets": buckets})
+
+
+@router.get("/admin/cache")
+def cache_stats(user=Depends(require_admin)):
+    """Hit/miss/eviction counters for sizing the in-process catalog cache."""
+    return {"catalog": catalog_cache.stats(), "idempotency": idempotency_store.stats(), "sales_buckets": sales_analytics.stats()}
+
+
+@router.post("/admin/holds/reconcile")
+def reconcile_holds(user=Depends(require_admin)):
+    """Recompute products' held counts from the cart holds, e.g. after a
+    worker died between its two hold writes."""
+    return {"corrected": reconcile_held(get_db())}
+
+
+@router.get("/admin/tasks")
+def task_stats(user=Depends(require_admin)):
+    """Outbox depth and lag (`lag_seconds`: age of the oldest due task) plus
+    this worker's pool counters."""
+    return task_queue.stats()
@@ -1,41 +1,130 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from ...core.security import get_current_user
 from ...database.connection import get_db
-from ...models.cart import CartItem
+from ...models.cart import CartItem, CartPatch
+from ...core.etag import make_etag, doc_version, matches, not_modified, catalog_version
 from bson import ObjectId
 from datetime import datetime
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from ...core.holds import place_hold, release_hold, set_hold, shrink_hold
+from ...core.logging import logger
 
 router = APIRouter()
 
 
-@router.get("/cart")
-def get_cart(user=Depends(get_current_user)):
-    db = get_db()
-    doc = db.carts.find_one({"user_id": ObjectId(user.get("id"))})
-    if not doc:
-        return {"items": []}
-    # convert ids and enrich items with product info (name, image, stock)
+# what cart enrichment needs from a product; only the first image is read
+CART_PRODUCT_PROJECTION = {"name": 1, "stock": 1, "held": 1, "image": 1, "image_url": 1, "images": {"$slice": 1}}
+
+
+def _as_object_id(pid):
+    if isinstance(pid, ObjectId):
+        return pid
+    try:
+        return ObjectId(pid)
+    except Exception:
+        return None
+
+
+def _cart_items(db, items: list, enrich: bool = True, products: dict | None = None) -> list:
+    """Convert stored cart lines to JSON-safe dicts.
+
+    With `enrich`, name/image/stock are attached from one projected `$in`
+    query. `products` ({ObjectId: doc}) lets callers that already hold some
+    of the products skip re-reading them.
+    """
+    products = dict(products or {})
+    if enrich:
+        missing = {oid for oid in (_as_object_id(it.get("product_id")) for it in items) if oid is not None and oid not in products}
+        if missing:
+            for prod in db.products.find({"_id": {"$in": list(missing)}}, CART_PRODUCT_PROJECTION):
+                products[prod["_id"]] = prod
     out_items = []
-    for it in doc.get("items", []):
+    for it in items:
         pid = it.get("product_id")
-        pid_str = str(pid) if pid is not None else None
         item_obj = {
-            "product_id": pid_str,
+            "product_id": str(pid) if pid is not None else None,
             "quantity": it.get("quantity", 0),
             "price": it.get("price", 0),
         }
-        try:
-            prod = db.products.find_one({"_id": ObjectId(pid)}) if pid else None
-            if prod:
-                item_obj["name"] = prod.get("name")
-                # include a primary image if available
-                images = prod.get("images") or []
-                item_obj["image"] = (images[0] if images else prod.get("image") or prod.get("image_url"))
-                item_obj["stock"] = prod.get("stock", 0)
-        except Exception:
-            pass
+        prod = products.get(_as_object_id(pid)) if enrich and pid is not None else None
+        if prod:
+            item_obj["name"] = prod.get("name")
+            # include a primary image if available
+            images = prod.get("images") or []
+            item_obj["image"] = (images[0] if images else prod.get("image") or prod.get("image_url"))
+            item_obj["stock"] = prod.get("stock", 0)
+            # available to other shoppers; this cart's own hold is included in held
+            item_obj["available"] = max(prod.get("stock", 0) - prod.get("held", 0), 0)
         out_items.append(item_obj)
-    return {"items": out_items, "updated_at": doc.get("updated_at")}
+    return out_items
+
+
+def _cart_response(db, doc: dict | None, enrich: bool = True, products: dict | None = None) -> dict:
+    if not doc:
+        return {"items": [], "count": 0, "total": 0}
+    items = doc.get("items", [])
+    return {
+        "items": _cart_items(db, items, enrich, products),
+        "count": sum(it.get("quantity", 0) for it in items),
+        "total": sum(it.get("quantity", 0) * it.get("price", 0) for it in items),
+        "updated_at": doc.get("updated_at"),
+    }
+
+
+@router.get("/cart")
+def get_cart(request: Request, response: Response, enrich: bool = True, user=Depends(get_current_user)):
+    """Current user's cart. `enrich=false` skips the product lookup for
+    clients that only need counts and totals."""
+    db = get_db()
+    doc = db.carts.find_one({"user_id": ObjectId(user.get("id"))})
+    # enrichment shows product name/stock, so product writes change the cart too
+    etag = make_etag("cart", user.get("id"), doc_version(doc) if doc else None, catalog_version(db) if enrich else "plain")
+    cache_headers = {"Cache-Control": "private, no-cache"}
+    if matches(request, etag):
+        return not_modified(etag, cache_headers)
+    response.headers.update({"ETag": etag, **cache_headers})
+    return _cart_response(db, doc, enrich)
+
+
+def _product_oid(product_id: str) -> ObjectId:
+    oid = _as_object_id(product_id)
+    if oid is None:
+        raise HTTPException(status_code=400, detail="Invalid product id")
+    return oid
+
+
+def _line_ids(pid: ObjectId) -> list:
+    # older carts may hold the id as a string
+    return [pid, str(pid)]
+
+
+def _add_line(db, uid: ObjectId, pid: ObjectId, quantity: int, price: int, now: datetime) -> dict:
+    """Atomically add `quantity` of a product to the user's cart and return the cart.
+
+    Increments the existing line in place, otherwise pushes a new one
+    (creating the cart if needed). The unique index on `carts.user_id`
+    turns a lost race on the push/upsert into a DuplicateKeyError, which is
+    retried as an increment.
+    """
+    for _ in range(3):
+        doc = db.carts.find_one_and_update(
+            {"user_id": uid, "items.product_id": {"$in": _line_ids(pid)}},
+            {"$inc": {"items.$.quantity": quantity}, "$set": {"items.$.price": price, "updated_at": now}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc:
+            return doc
+        try:
+            return db.carts.find_one_and_update(
+                {"user_id": uid, "items.product_id": {"$nin": _line_ids(pid)}},
+                {"$push": {"items": {"product_id": pid, "quantity": quantity, "price": price}}, "$set": {"updated_at": now}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            continue
+    raise HTTPException(status_code=409, detail="Cart changed concurrently, please retry")
 
 
 @router.post("/cart/add")
@@ -44,34 +133,23 @@ def add_to_cart(item: CartItem, user=Depends(get_current_user)):
     # Only regular users can add to cart (admins are not allowed)
     if user.get("role") != "user":
         raise HTTPException(status_code=403, detail="Only regular users can add items to cart")
-    # ensure product exists and has enough stock
-    prod = db.products.find_one({"_id": ObjectId(item.product_id)})
-    if not prod:
-        raise HTTPException(status_code=404, detail="Product not found")
-    if prod.get("stock", 0) < item.quantity:
-        raise HTTPException(status_code=400, detail="Not enough stock")
-
-    # upsert user's cart
-    cart = db.carts.find_one({"user_id": ObjectId(user.get("id"))})
-    if not cart:
-        cart_doc = {"user_id": ObjectId(user.get("id")), "items": [{"product_id": ObjectId(item.product_id), "quantity": item.quantity, "price": item.price}], "updated_at": datetime.utcnow()}
-        db.carts.insert_one(cart_doc)
-        return {"message": "added"}
-
-    # find existing item
-    updated = False
-    for it in cart.get("items", []):
-        if str(it.get("product_id")) == item.product_id:
-            it["quantity"] = it.get("quantity", 0) + item.quantity
-            it["price"] = item.price
-            updated = True
-            break
-    if not updated:
-        cart["items"].append({"product_id": ObjectId(item.product_id), "quantity": item.quantity, "price": item.price})
-
-    cart["updated_at"] = datetime.utcnow()
-    db.carts.update_one({"user_id": ObjectId(user.get("id"))}, {"$set": {"items": cart["items"], "updated_at": cart["updated_at"]}})
-    return {"message": "added"}
+    uid = ObjectId(user.get("id"))
+    pid = _product_oid(item.product_id)
+    now = datetime.utcnow()
+    # holding the units checks that the product exists and has enough stock
+    place_hold(db, uid, pid, item.quantity, now)
+    try:
+        cart = _add_line(db, uid, pid, item.quantity, item.price, now)
+    except HTTPException:
+        shrink_hold(db, uid, pid, item.quantity)
+        raise
+    return {"message": "added", "cart": _cart_response(db, cart, enrich=False)}
+
+
+def _missing_cart_or_item(db, uid: ObjectId):
+    if not db.carts.count_documents({"user_id": uid}, limit=1):
+        raise HTTPException(status_code=404, detail="Cart not found")
+    raise HTTPException(status_code=404, detail="Item not in cart")
 
 
 @router.put("/cart/update")
@@ -79,27 +157,25 @@ def update_cart(item: CartItem, user=Depends(get_current_user)):
     db = get_db()
     if user.get("role") != "user":
         raise HTTPException(status_code=403, detail="Only regular users can update cart")
-    cart = db.carts.find_one({"user_id": ObjectId(user.get("id"))})
+    uid = ObjectId(user.get("id"))
+    pid = _product_oid(item.product_id)
+    now = datetime.utcnow()
+    if item.quantity <= 0:
+        # remove
+        update = {"$pull": {"items": {"product_id": {"$in": _line_ids(pid)}}}, "$set": {"updated_at": now}}
+    else:
+        update = {"$set": {"items.$.quantity": item.quantity, "items.$.price": item.price, "updated_at": now}}
+    # resize the hold first so a quantity beyond available stock is refused
+    previous = set_hold(db, uid, pid, item.quantity, now)
+    cart = db.carts.find_one_and_update(
+        {"user_id": uid, "items.product_id": {"$in": _line_ids(pid)}},
+        update,
+        return_document=ReturnDocument.AFTER,
+    )
     if not cart:
-        raise HTTPException(status_code=404, detail="Cart not found")
-
-    found = False
-    new_items = []
-    for it in cart.get("items", []):
-        if str(it.get("product_id")) == item.product_id:
-            if item.quantity <= 0:
-                # remove
-                continue
-            it["quantity"] = item.quantity
-            it["price"] = item.price
-            found = True
-        new_items.append(it)
-
-    if not found:
-        raise HTTPException(status_code=404, detail="Item not in cart")
-
-    db.carts.update_one({"user_id": ObjectId(user.get("id"))}, {"$set": {"items": new_items, "updated_at": datetime.utcnow()}})
-    return {"message": "updated"}
+        set_hold(db, uid, pid, previous)
+        _missing_cart_or_item(db, uid)
+    return {"message": "updated", "cart": _cart_response(db, cart, enrich=False)}
 
 
 @router.delete("/cart/remove")
@@ -107,10 +183,115 @@ def remove_from_cart(product_id: str, user=Depends(get_current_user)):
     db = get_db()
     if user.get("role") != "user":
         raise HTTPException(status_code=403, detail="Only regular users can remove items from cart")
-    cart = db.carts.find_one({"user_id": ObjectId(user.get("id"))})
+    uid = ObjectId(user.get("id"))
+    pid = _product_oid(product_id)
+    cart = db.carts.find_one_and_update(
+        {"user_id": uid},
+        {"$pull": {"items": {"product_id": {"$in": _line_ids(pid)}}}, "$set": {"updated_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER,
+    )
     if not cart:
         raise HTTPException(status_code=404, detail="Cart not found")
+    release_hold(db, uid, pid)
+    return {"message": "removed", "cart": _cart_response(db, cart, enrich=False)}
+
+
+def _patch_ops(uid: ObjectId, pid: ObjectId, op: str, quantity: int, price: int) -> list:
+    """Update operations for one PATCH entry; the cart is known to exist."""
+    has_line = {"user_id": uid, "items.product_id": {"$in": _line_ids(pid)}}
+    no_line = {"user_id": uid, "items.product_id": {"$nin": _line_ids(pid)}}
+    new_line = {"$push": {"items": {"product_id": pid, "quantity": quantity, "price": price}}}
+    if op == "remove" or (op == "set" and quantity == 0):
+        return [UpdateOne({"user_id": uid}, {"$pull": {"items": {"product_id": {"$in": _line_ids(pid)}}}})]
+    if op == "add":
+        return [UpdateOne(has_line, {"$inc": {"items.$.quantity": quantity}, "$set": {"items.$.price": price}}), UpdateOne(no_line, new_line)]
+    return [UpdateOne(has_line, {"$set": {"items.$.quantity": quantity, "items.$.price": price}}), UpdateOne(no_line, new_line)]
+
+
+def _patch_holds(db, uid: ObjectId, ops: list, now: datetime):
+    """Bring the cart holds in line with a PATCH, all or nothing.
+
+    The operations are folded into one change per product: either "add n
+    units" or "end up with n units" (after a set/remove). Stock is checked
+    by the hold updates themselves. Returns a function that undoes the
+    hold changes, for when the cart write fails.
+    """
+    changes = {}  # pid -> (absolute, quantity)
+    for o, pid in ops:
+        absolute, quantity = changes.get(pid, (False, 0))
+        if o.op == "add":
+            changes[pid] = (absolute, quantity + o.quantity)
+        else:
+            changes[pid] = (True, 0 if o.op == "remove" else o.quantity)
+
+    undo = []
+
+    def rollback():
+        for step in reversed(undo):
+            try:
+                step()
+            except Exception:
+                logger.exception("Undoing a cart hold change failed")
+
+    try:
+        for pid, (absolute, quantity) in changes.items():
+            if absolute:
+                previous = set_hold(db, uid, pid, quantity, now)
+                undo.append(lambda pid=pid, previous=previous: set_hold(db, uid, pid, previous))
+            elif quantity:
+                place_hold(db, uid, pid, quantity, now)
+                undo.append(lambda pid=pid, quantity=quantity: shrink_hold(db, uid, pid, quantity))
+    except HTTPException as e:
+        rollback()
+        if e.status_code == 400:
+            raise HTTPException(status_code=400, detail=f"Not enough stock for product {pid}")
+        raise
+    except Exception:
+        rollback()
+        raise
+    return rollback
+
+
+@router.patch("/cart")
+def patch_cart(payload: CartPatch, user=Depends(get_current_user)):
+    """Apply a list of add/set/remove operations in order and return the cart.
+
+    Products are validated with one query and the holds are adjusted once
+    per product. Then every operation goes to the database in a single
+    ordered `bulk_write`, and each one is an atomic positional update, as
+    in the single-item routes.
+    """
+    db = get_db()
+    if user.get("role") != "user":
+        raise HTTPException(status_code=403, detail="Only regular users can modify cart")
+    uid = ObjectId(user.get("id"))
+    for o in payload.operations:
+        if o.op == "add" and o.quantity < 1:
+            raise HTTPException(status_code=400, detail="quantity must be at least 1 for add")
+    ops = [(o, _product_oid(o.product_id)) for o in payload.operations]
+
+    wanted = {pid for o, pid in ops if o.op != "remove"}
+    products = {p["_id"]: p for p in db.products.find({"_id": {"$in": list(wanted)}}, {**CART_PRODUCT_PROJECTION, "price": 1})} if wanted else {}
+    for o, pid in ops:
+        if o.op != "remove" and pid not in products:
+            raise HTTPException(status_code=404, detail=f"Product {o.product_id} not found")
+
+    now = datetime.utcnow()
+    undo_holds = _patch_holds(db, uid, ops, now)
+    # first op creates the cart if needed, so the per-item ops never upsert
+    requests = [UpdateOne({"user_id": uid}, {"$setOnInsert": {"items": []}, "$set": {"updated_at": now}}, upsert=True)]
+    for o, pid in ops:
+        price = o.price if o.price is not None else products.get(pid, {}).get("price", 0)
+        requests.extend(_patch_ops(uid, pid, o.op, o.quantity, price))
+    try:
+        try:
+            db.carts.bulk_write(requests, ordered=True)
+        except DuplicateKeyError:
+            # a concurrent request created the cart first; nothing was applied
+            db.carts.bulk_write(requests, ordered=True)
+    except Exception:
+        undo_holds()
+        raise
 
-    new_items = [it for it in cart.get("items", []) if str(it.get("product_id")) != product_id]
-    db.carts.update_one({"user_id": ObjectId(user.get("id"))}, {"$set": {"items": new_items, "updated_at": datetime.utcnow()}})
-    return {"message": "removed"}
+    cart = db.carts.find_one({"user_id": uid})
+    return _cart_response(db, cart, products=products)
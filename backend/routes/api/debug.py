@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException, Depends
 from ...database.connection import get_db
 from bson import ObjectId
 from ...core.security import get_current_user
+from ...core.serialization import ORDER_PROJECTION, json_response, order_doc
 
 router = APIRouter()
 
@@ -10,46 +11,8 @@ router = APIRouter()
 def debug_orders(limit: int = 50):
     """Return recent orders with user_id shown as string (or null) for debugging."""
     db = get_db()
-    docs = db.orders.find().sort("created_at", -1).limit(limit)
-    out = []
-    for d in docs:
-        uid = d.get("user_id")
-        try:
-            uid_str = str(uid) if uid is not None else None
-        except Exception:
-            uid_str = None
-        # Normalize items: ensure product_id and other nested ObjectIds are strings
-        items = []
-        raw_items = d.get("items") or []
-        for it in raw_items:
-            pid = it.get("product_id") if isinstance(it, dict) else None
-            try:
-                pid_str = str(pid) if pid is not None else None
-            except Exception:
-                pid_str = None
-            items.append({
-                "product_id": pid_str,
-                "quantity": it.get("quantity") if isinstance(it, dict) else None,
-                "price": it.get("price") if isinstance(it, dict) else None,
-                "name": it.get("name") if isinstance(it, dict) else None,
-            })
-
-        created = d.get("created_at")
-        try:
-            created_iso = created.isoformat() if hasattr(created, "isoformat") else str(created)
-        except Exception:
-            created_iso = str(created)
-
-        out.append({
-            "id": str(d.get("_id")),
-            "user_id": uid_str,
-            "items": items,
-            "total_amount": d.get("total_amount"),
-            "payment_status": d.get("payment_status"),
-            "created_at": created_iso,
-            "simulated": bool(d.get("simulated", False)),
-        })
-    return {"orders": out}
+    docs = db.orders.find({}, ORDER_PROJECTION).sort("created_at", -1).limit(limit)
+    return json_response({"orders": [order_doc(d) for d in docs]})
 
 
 @router.post("/debug/claim")
@@ -1,146 +1,244 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Optional
 from ...core.security import get_current_user, require_admin
 from ...database.connection import get_db
 from ...models.order import OrderCreate
+from ...core.logging import logger
+from ...core.cache import catalog_cache
+from ...core.etag import bump_catalog_version
+from ...core.order_events import enqueue_order_placed
+from ...core.sales_stats import record_order
+from ...core.suggest import product_suggest
+from ...core.tasks import task_queue
+from ...core.inventory import reserve_stock, release_stock
+from ...core.holds import claim_holds, finish_claim, unclaim_holds
+from ...database.transactions import run_in_transaction
+from ...core.idempotency import run_idempotent
+from ...core.pagination import decode_cursor, encode_cursor, keyset_filter
+from ...core.serialization import ORDER_PROJECTION, dumps, json_response, order_doc
+from ...utils.orderExporter import FORMATS as EXPORT_FORMATS, export_orders as export_order_rows, parquet_available
 from bson import ObjectId
 from datetime import datetime
 
 router = APIRouter()
 
 
+def _product_oid(product_id: str) -> ObjectId:
+    try:
+        return ObjectId(product_id)
+    except Exception:
+        raise HTTPException(status_code=404, detail=f"Product {product_id} not found")
+
+
 @router.post("/checkout")
-def checkout(payload: OrderCreate, user=Depends(get_current_user)):
-    db = get_db()
-    # Validate items and stock
-    total = 0
-    updates = []
-    items_with_snapshot = []
-    for it in payload.items:
-        prod = db.products.find_one({"_id": ObjectId(it.product_id)})
-        if not prod:
-            raise HTTPException(status_code=404, detail=f"Product {it.product_id} not found")
-        if prod.get("stock", 0) < it.quantity:
-            raise HTTPException(status_code=400, detail=f"Product {it.product_id} out of stock or insufficient quantity")
-        # Use authoritative server-side price to prevent client manipulation
-        price_snapshot = prod.get("price", 0)
-        total += it.quantity * price_snapshot
-        updates.append((prod["_id"], it.quantity))
-        items_with_snapshot.append({"product_id": it.product_id, "quantity": it.quantity, "price": price_snapshot})
-
-    # create order
-    order_doc = {
-        "user_id": ObjectId(user.get("id")),
-        "items": items_with_snapshot,
-        "total_amount": total,
-        "payment_status": "success",
-        "created_at": datetime.utcnow(),
-    }
-    res = db.orders.insert_one(order_doc)
-
-    # decrement stock
-    for pid, qty in updates:
-        db.products.update_one({"_id": pid}, {"$inc": {"stock": -qty}})
-
-    # clear user's cart
-    db.carts.update_one({"user_id": ObjectId(user.get("id"))}, {"$set": {"items": []}})
-
-    return {"order_id": str(res.inserted_id), "message": "order_placed"}
+def checkout(payload: OrderCreate, user=Depends(get_current_user), idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    """Place an order for `payload.items`.
 
+    Products are read with one `$in` query and stock is taken with
+    conditional decrements, so concurrent checkouts cannot oversell. On a
+    replica set the order insert, stock change and cart clear commit in
+    one transaction (retried on write conflicts).
 
-@router.get("/orders/me")
-def my_orders(user=Depends(get_current_user)):
+    Units the buyer holds from their cart are consumed instead of re-read:
+    the hold supplies the price and its units count as available.
+
+    With an `Idempotency-Key` header a retried request replays the first
+    response instead of placing a second order.
+    """
     db = get_db()
-    docs = db.orders.find({"user_id": ObjectId(user.get("id"))}).sort("created_at", -1)
-    out = []
-    for d in docs:
-        # normalize nested values to JSON-safe types
-        uid = d.get("user_id")
+    return run_idempotent(db, "checkout", user.get("id"), idempotency_key, payload.model_dump(), lambda: _checkout(db, payload, user))
+
+
+def _checkout(db, payload: OrderCreate, user) -> dict:
+    uid = ObjectId(user.get("id"))
+    quantities = {}
+    for it in payload.items:
+        pid = _product_oid(it.product_id)
+        quantities[pid] = quantities.get(pid, 0) + it.quantity
+
+    def place_order(session):
+        # cart holds already carry the price and reserved units, so only
+        # products ordered without a hold are read
+        token, holds = claim_holds(db, uid, session=session)
+        reserved = False
+        try:
+            held = {pid: h["quantity"] for pid, h in holds.items() if pid in quantities}
+            unheld = [pid for pid in quantities if pid not in holds]
+            products = {p["_id"]: p for p in db.products.find({"_id": {"$in": unheld}}, {"price": 1, "stock": 1, "held": 1, "stock_shards": 1}, session=session)} if unheld else {}
+            # Validate items and stock
+            total = 0
+            items_with_snapshot = []
+            for it in payload.items:
+                pid = ObjectId(it.product_id)
+                if pid in holds:
+                    price_snapshot = holds[pid]["price"]
+                else:
+                    prod = products.get(pid)
+                    if not prod:
+                        raise HTTPException(status_code=404, detail=f"Product {it.product_id} not found")
+                    # (a sharded product's stock is only a display value; its shards decide)
+                    if not prod.get("stock_shards") and prod.get("stock", 0) - prod.get("held", 0) < quantities[pid]:
+                        raise HTTPException(status_code=400, detail=f"Product {it.product_id} out of stock or insufficient quantity")
+                    # Use authoritative server-side price to prevent client manipulation
+                    price_snapshot = prod.get("price", 0)
+                total += it.quantity * price_snapshot
+                items_with_snapshot.append({"product_id": pid, "quantity": it.quantity, "price": price_snapshot})
+
+            reserve_stock(db, quantities, session=session, held=held)
+            reserved = True
+            order_doc = {
+                "user_id": uid,
+                "items": items_with_snapshot,
+                "total_amount": total,
+                "payment_status": "success",
+                "created_at": datetime.utcnow(),
+            }
+            res = db.orders.insert_one(order_doc, session=session)
+        except Exception:
+            # without a transaction nothing rolls back on its own; the
+            # buyer's holds must not stay claimed until they expire
+            if session is None:
+                if reserved:
+                    release_stock(db, quantities, held=held)
+                unclaim_holds(db, token)
+            raise
+        # holds on cart lines that were not ordered end with the cart
+        finish_claim(db, token, {pid: h["quantity"] for pid, h in holds.items() if pid not in quantities}, session=session)
+        # clear user's cart
+        db.carts.update_one({"user_id": uid}, {"$set": {"items": [], "updated_at": datetime.utcnow()}}, session=session)
+        # the confirmation email runs after the response
         try:
-            uid_str = str(uid) if uid is not None else None
+            record_order(db, order_doc, session=session)
+            enqueue_order_placed(db, res.inserted_id, session=session)
         except Exception:
-            uid_str = None
-
-        items = []
-        for it in d.get("items") or []:
-            pid = it.get("product_id") if isinstance(it, dict) or isinstance(it, dict) else it.get("product_id") if isinstance(it, dict) else it
-            try:
-                pid_str = str(pid) if pid is not None else None
-            except Exception:
-                pid_str = None
-            # handle when item is dict-like
-            if isinstance(it, dict):
-                qty = it.get("quantity")
-                price = it.get("price")
-                name = it.get("name")
-            else:
-                qty = None
-                price = None
-                name = None
-            items.append({"product_id": pid_str, "quantity": qty, "price": price, "name": name})
-
-        created = d.get("created_at")
+            if session is not None:
+                raise
+            # the order is placed; failing the request now would invite a duplicate
+            logger.exception("Recording order %s failed", res.inserted_id)
+        return res.inserted_id
+
+    order_id = run_in_transaction(db, place_order)
+    # stock changed: drop this worker's cached details now; other workers
+    # notice the new catalog and product versions
+    for pid, qty in quantities.items():
+        catalog_cache.delete(("product", pid))
+        product_suggest.record_sale(pid, qty)
+    bump_catalog_version(db)
+    task_queue.notify()
+
+    return {"order_id": str(order_id), "message": "order_placed"}
+
+
+# newest first; _id breaks ties so the keyset cursor is exact
+ORDER_SORT = [("created_at", -1), ("_id", -1)]
+ORDER_PAGE_MAX = 200
+STREAM_BATCH_SIZE = 500
+
+
+def _order_query(base: dict, after: Optional[str]) -> dict:
+    if not after:
+        return base
+    value, last_id = decode_cursor(after, "orders")
+    return {"$and": [base, keyset_filter("created_at", -1, value, last_id)]} if base else keyset_filter("created_at", -1, value, last_id)
+
+
+def _order_page(db, base: dict, after: Optional[str], limit: int) -> dict:
+    # fetch one extra row to know whether there is a next page
+    docs = list(db.orders.find(_order_query(base, after), ORDER_PROJECTION).sort(ORDER_SORT).limit(limit + 1))
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor("orders", docs[-1].get("created_at"), docs[-1]["_id"])
+    return json_response({"orders": [order_doc(d) for d in docs], "next_cursor": next_cursor})
+
+
+def _stream_orders(db, query: dict):
+    """Yield `{"orders": [...]}` piece by piece straight off the cursor."""
+    yield b'{"orders":['
+    first = True
+    for d in db.orders.find(query, ORDER_PROJECTION).sort(ORDER_SORT).batch_size(STREAM_BATCH_SIZE):
+        yield (b"" if first else b",") + dumps(order_doc(d))
+        first = False
+    yield b"]}"
+
+
+def _admin_order_filter(status: Optional[str], created_from: Optional[datetime], created_to: Optional[datetime], user_id: Optional[str]) -> dict:
+    query = {}
+    if status:
+        query["payment_status"] = status
+    if created_from or created_to:
+        query["created_at"] = {}
+        if created_from:
+            query["created_at"]["$gte"] = created_from
+        if created_to:
+            query["created_at"]["$lt"] = created_to
+    if user_id:
         try:
-            created_iso = created.isoformat() if hasattr(created, "isoformat") else str(created)
+            query["user_id"] = ObjectId(user_id)
         except Exception:
-            created_iso = str(created)
+            raise HTTPException(status_code=400, detail="Invalid user_id")
+    return query
 
-        out.append({
-            "id": str(d.get("_id")),
-            "user_id": uid_str,
-            "items": items,
-            "total_amount": d.get("total_amount"),
-            "payment_status": d.get("payment_status"),
-            "created_at": created_iso,
-            "simulated": bool(d.get("simulated", False)),
-        })
-    return {"orders": out}
+
+def _order_listing(db, base: dict, after: Optional[str], limit: int, stream: bool):
+    if stream:
+        return StreamingResponse(_stream_orders(db, _order_query(base, after)), media_type="application/json")
+    return _order_page(db, base, after, limit)
+
+
+@router.get("/orders/me")
+def my_orders(user=Depends(get_current_user), limit: int = Query(50, ge=1, le=ORDER_PAGE_MAX), after: Optional[str] = None, stream: bool = False):
+    """The caller's orders, newest first, `limit` per page; pass `next_cursor`
+    back as `after` for the next page."""
+    db = get_db()
+    return _order_listing(db, {"user_id": ObjectId(user.get("id"))}, after, limit, stream)
 
 
 @router.get("/orders/admin", dependencies=[Depends(require_admin)])
-def all_orders():
+def all_orders(
+    limit: int = Query(50, ge=1, le=ORDER_PAGE_MAX),
+    after: Optional[str] = None,
+    status: Optional[str] = None,
+    created_from: Optional[datetime] = Query(None, alias="from"),
+    created_to: Optional[datetime] = Query(None, alias="to"),
+    user_id: Optional[str] = None,
+    stream: bool = False,
+):
+    """All orders, newest first, filtered by payment `status`, a `from`/`to`
+    creation range (to is exclusive) and `user_id`.
+
+    Pages are keyset-based like `/orders/me`; `stream=true` returns every
+    matching order as one JSON document written incrementally instead.
+    """
     db = get_db()
-    docs = db.orders.find().sort("created_at", -1)
-    out = []
-    for d in docs:
-        uid = d.get("user_id")
-        try:
-            uid_str = str(uid) if uid is not None else None
-        except Exception:
-            uid_str = None
-
-        items = []
-        for it in d.get("items") or []:
-            try:
-                pid = it.get("product_id")
-            except Exception:
-                pid = None
-            try:
-                pid_str = str(pid) if pid is not None else None
-            except Exception:
-                pid_str = None
-            if isinstance(it, dict):
-                qty = it.get("quantity")
-                price = it.get("price")
-                name = it.get("name")
-            else:
-                qty = None
-                price = None
-                name = None
-            items.append({"product_id": pid_str, "quantity": qty, "price": price, "name": name})
-
-        created = d.get("created_at")
-        try:
-            created_iso = created.isoformat() if hasattr(created, "isoformat") else str(created)
-        except Exception:
-            created_iso = str(created)
-
-        out.append({
-            "id": str(d.get("_id")),
-            "user_id": uid_str,
-            "items": items,
-            "total_amount": d.get("total_amount"),
-            "payment_status": d.get("payment_status"),
-            "created_at": created_iso,
-            "simulated": bool(d.get("simulated", False)),
-        })
-    return {"orders": out}
+    return _order_listing(db, _admin_order_filter(status, created_from, created_to, user_id), after, limit, stream)
+
+
+@router.get("/orders/admin/export", dependencies=[Depends(require_admin)])
+def export_orders(
+    format: str = "csv",
+    status: Optional[str] = None,
+    created_from: Optional[datetime] = Query(None, alias="from"),
+    created_to: Optional[datetime] = Query(None, alias="to"),
+    user_id: Optional[str] = None,
+    batch_size: int = Query(1000, ge=1, le=10000),
+):
+    """Download matching orders, one row per line item, oldest first.
+
+    `format` is csv, ndjson or parquet (parquet needs pyarrow installed).
+    The file is streamed from the Mongo cursor `batch_size` rows at a time.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow")
+    db = get_db()
+    query = _admin_order_filter(status, created_from, created_to, user_id)
+    media_type, ext = EXPORT_FORMATS[format]
+    filename = f"orders-{datetime.utcnow():%Y%m%d-%H%M%S}.{ext}"
+    return StreamingResponse(
+        export_order_rows(db, query, format, batch_size),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
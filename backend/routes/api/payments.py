@@ -1,94 +1,170 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Header, HTTPException, Request
+from typing import Optional
 from ...core.config import settings
 from ...database.connection import get_db
 import json
 from bson import ObjectId
 from datetime import datetime
 from ...core.security import get_current_user
+from ...core.cache import catalog_cache
+from ...core.etag import bump_catalog_version
+from ...core.logging import logger
+from ...core.order_events import enqueue_order_placed
+from ...core.sales_stats import record_order
+from ...core.serialization import order_product_id
+from ...core.suggest import product_suggest
+from ...core.tasks import task_queue
+from ...core.inventory import take_available_stock
+from ...core.holds import claim_holds, finish_claim, unclaim_holds
+from ...core.idempotency import run_idempotent_async
 
 router = APIRouter()
 
 
 @router.post("/payments/create-checkout-session")
-async def create_checkout_session(payload: dict, request: Request):
+async def create_checkout_session(payload: dict, request: Request, idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
     """Simulated checkout session for development.
 
     This endpoint validates items against the DB (authoritative prices), creates
     an order with payment_status 'paid' (simulation), decrements stock where
     possible, and returns a URL (success_url) and the created order id.
+    Signed-in requests repeating an `Idempotency-Key` get the first response
+    back; anonymous ones have no namespace for the key and always run.
     """
     items = payload.get("items", [])
     if not items:
         raise HTTPException(status_code=400, detail="No items provided")
 
+    db = get_db()
+    # Try to associate the order with the authenticated user if present
+    user_id = None
+    try:
+        user = await get_current_user(request)
+        if user and user.get("id"):
+            user_id = ObjectId(user.get("id"))
+    except Exception:
+        user_id = None
+
+    return await run_idempotent_async(
+        db, "checkout-session", user_id, idempotency_key, payload,
+        lambda: _create_checkout_session(db, payload, items, user_id),
+    )
+
+
+async def _create_checkout_session(db, payload: dict, items: list, user_id):
     success_url = payload.get("success_url") or payload.get("return_url") or "/checkout/success"
     cancel_url = payload.get("cancel_url") or "/checkout/cancel"
 
-    db = get_db()
-
     total = 0.0
-    updates = []  # list of (ObjectId, qty) for stock decrement
+    updates = {}  # ObjectId -> qty for stock decrement
+    short = {}  # ObjectId -> qty ordered but not in stock
     items_with_snapshot = []
 
+    # load every referenced product in one query
+    oids = set()
     for it in items:
-        pid = it.get("product_id")
-        qty = int(it.get("quantity", 1) or 1)
-        prod = None
         try:
-            prod = db.products.find_one({"_id": ObjectId(pid)}) if pid else None
+            oids.add(ObjectId(it.get("product_id")))
         except Exception:
-            prod = None
+            pass
+    products = {p["_id"]: p for p in db.products.find({"_id": {"$in": list(oids)}}, {"price": 1, "name": 1, "stock": 1, "held": 1, "stock_shards": 1})} if oids else {}
+    # the buyer's cart holds count as available to them
+    token, holds = claim_holds(db, user_id) if user_id else (None, {})
 
-        if not prod:
-            price_snapshot = float(it.get("price", 0) or 0)
-            name = it.get("name") or it.get("product_name") or None
+    try:
+        for it in items:
+            pid = it.get("product_id")
+            qty = int(it.get("quantity", 1) or 1)
+            try:
+                prod = products.get(ObjectId(pid)) if pid else None
+            except Exception:
+                prod = None
+
+            if not prod:
+                price_snapshot = float(it.get("price", 0) or 0)
+                name = it.get("name") or it.get("product_name") or None
+                total += qty * price_snapshot
+                items_with_snapshot.append({"product_id": order_product_id(pid), "quantity": qty, "price": price_snapshot, "name": name})
+                continue
+
+            price_snapshot = float(prod.get("price", 0) or 0)
+            name = prod.get("name")
+            own = holds.get(prod["_id"], {}).get("quantity", 0)
+            if prod.get("stock_shards") or prod.get("stock", 0) - prod.get("held", 0) + own >= updates.get(prod["_id"], 0) + qty:
+                updates[prod["_id"]] = updates.get(prod["_id"], 0) + qty
+            else:
+                short[prod["_id"]] = short.get(prod["_id"], 0) + qty
+            # even if stock insufficient, include the item with snapshot price
             total += qty * price_snapshot
-            items_with_snapshot.append({"product_id": pid or None, "quantity": qty, "price": price_snapshot, "name": name})
-            continue
-
-        price_snapshot = float(prod.get("price", 0) or 0)
-        name = prod.get("name")
-        if prod.get("stock", 0) >= qty:
-            updates.append((prod.get("_id"), qty))
-        # even if stock insufficient, include the item with snapshot price
-        total += qty * price_snapshot
-        items_with_snapshot.append({"product_id": str(prod.get("_id")), "quantity": qty, "price": price_snapshot, "name": name})
+            items_with_snapshot.append({"product_id": prod["_id"], "quantity": qty, "price": price_snapshot, "name": name})
+
+        order_doc = {
+            "user_id": user_id,
+            "items": items_with_snapshot,
+            "total_amount": total,
+            "payment_status": "paid",  # simulated
+            "created_at": datetime.utcnow(),
+            "simulated": True,
+        }
+
+        res = db.orders.insert_one(order_doc)
+    except Exception:
+        # nothing is taken yet; give the buyer's holds back to their cart
+        if token:
+            unclaim_holds(db, token)
+        raise
 
-    # Try to associate the order with the authenticated user if present
-    user_id = None
     try:
-        user = await get_current_user(request)
-        if user and user.get("id"):
-            user_id = ObjectId(user.get("id"))
+        record_order(db, order_doc)
     except Exception:
-        user_id = None
+        logger.exception("Updating sales counters for order %s failed", res.inserted_id)
 
-    order_doc = {
-        "user_id": user_id,
-        "items": items_with_snapshot,
-        "total_amount": total,
-        "payment_status": "paid",  # simulated
-        "created_at": datetime.utcnow(),
-        "simulated": True,
-    }
-
-    res = db.orders.insert_one(order_doc)
-
-    # decrement stock for processed items
-    for pid, qty in updates:
+    # decrement stock for processed items, consuming the buyer's holds in the
+    # same update (skipping any that ran out meanwhile)
+    held = {pid: h["quantity"] for pid, h in holds.items() if pid in updates}
+    try:
+        skipped = take_available_stock(db, updates, held=held)
+        returned = skipped
+    except Exception:
+        logger.exception("Taking stock for order %s failed", res.inserted_id)
+        skipped = dict(updates)
+        # unknown which holds were consumed; reconcile_held fixes `held` later
+        returned = {}
+    if token:
+        # holds not consumed (lines not ordered or not fulfilled) go back to stock
+        finish_claim(db, token, {pid: h["quantity"] for pid, h in holds.items() if pid not in updates or pid in returned})
+    updates = {pid: qty for pid, qty in updates.items() if pid not in skipped}
+    for pid, qty in skipped.items():
+        short[pid] = short.get(pid, 0) + qty
+    if short:
+        logger.warning("Order %s was paid but could not be fulfilled for %s", res.inserted_id, short)
+        db.orders.update_one({"_id": res.inserted_id}, {"$set": {"unfulfilled": [{"product_id": pid, "quantity": qty} for pid, qty in short.items()]}})
+
+    for pid, qty in updates.items():
+        catalog_cache.delete(("product", pid))
+        product_suggest.record_sale(pid, qty)
+    if updates:
         try:
-            db.products.update_one({"_id": pid}, {"$inc": {"stock": -qty}})
+            bump_catalog_version(db)
         except Exception:
             pass
 
     # Clear user's cart if we could associate the order with a user
     try:
         if user_id:
-            db.carts.update_one({"user_id": user_id}, {"$set": {"items": []}})
+            db.carts.update_one({"user_id": user_id}, {"$set": {"items": [], "updated_at": datetime.utcnow()}})
     except Exception:
         # non-critical
         pass
 
+    # the confirmation email runs after the response
+    try:
+        enqueue_order_placed(db, res.inserted_id)
+        task_queue.notify()
+    except Exception:
+        # non-critical
+        logger.exception("Queueing side effects for order %s failed", res.inserted_id)
+
     return {"url": success_url, "order_id": str(res.inserted_id)}
 
 
@@ -1,10 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends, Query, UploadFile, File
+from fastapi import APIRouter, HTTPException, Depends, Query, UploadFile, File, Request, Response
 from ...database.connection import get_db
 from ...models.product import ProductCreate, ProductUpdate, ProductOut
 from ...core.security import require_admin, get_current_user
+from ...core.pagination import encode_cursor, decode_cursor, keyset_filter
+from ...core.cache import catalog_cache
+from ...core.search import product_search
+from ...core.suggest import product_suggest
+from ...core.holds import available_to_sell
+from ...core import stock_shards
+from ...core.config import settings
+from ...core.etag import make_etag, doc_version, matches, not_modified, catalog_version, bump_catalog_version
 from bson import ObjectId
-from typing import Optional
+from typing import Optional, List
 from ...utils.cloudinaryUploader import save_uploaded_image
+from ...utils.productImporter import iter_lines, iter_ndjson, iter_csv, import_products
+from starlette.concurrency import run_in_threadpool
 
 router = APIRouter()
 
@@ -16,11 +26,193 @@ def _obj_id(id_str: str) -> ObjectId:
         raise HTTPException(status_code=400, detail="Invalid id")
 
 
+# fields a client may ask for with `fields=`; "images" in the card preset is
+# trimmed to the first image (the thumbnail)
+PRODUCT_FIELDS = ("name", "description", "price", "stock", "category", "images", "sku", "created_at", "updated_at")
+# read alongside any projection so detail responses can carry an ETag
+VERSION_FIELDS = ("version", "updated_at", "created_at")
+# stock bookkeeping, never part of a product response
+INTERNAL_FIELDS = ("held", "stock_shards", "version")
+FIELD_PRESETS = {
+    "card": ("name", "price", "stock", "category", "images"),
+    "detail": None,
+}
+
+
+def _parse_fields(fields: Optional[str]):
+    """Turn `fields=` into `(key, field_list)`; `field_list` None means whole documents."""
+    if not fields:
+        return "detail", None
+    if fields in FIELD_PRESETS:
+        return fields, FIELD_PRESETS[fields]
+    wanted = tuple(sorted({f.strip() for f in fields.split(",") if f.strip()}))
+    unknown = [f for f in wanted if f not in PRODUCT_FIELDS]
+    if unknown or not wanted:
+        raise HTTPException(status_code=400, detail="Unknown fields: " + ", ".join(unknown) if unknown else "No fields requested")
+    return wanted, wanted
+
+
+def _find_projection(fields_key, field_list, extra=()) -> Optional[dict]:
+    """Projection for find()/find_one(); `extra` fields (e.g. sort keys) are always kept."""
+    if field_list is None:
+        return {f: 0 for f in INTERNAL_FIELDS if f not in extra}
+    proj = {f: 1 for f in (*field_list, *extra)}
+    if fields_key == "card":
+        proj["images"] = {"$slice": 1}
+    return proj
+
+
+def _project_stage(fields_key, field_list, extra=()) -> Optional[dict]:
+    """Same projection as `_find_projection`, as an aggregation `$project` stage."""
+    if field_list is None:
+        return {"$project": {f: 0 for f in INTERNAL_FIELDS if f not in extra}}
+    proj = {f: 1 for f in (*field_list, *extra)}
+    if fields_key == "card":
+        proj["images"] = {"$slice": [{"$ifNull": ["$images", []]}, 1]}
+    return {"$project": proj}
+
+
+# sort name -> (field, direction); `_id` is always the tie-breaker
+SORTS = {
+    "price_asc": ("price", 1),
+    "price_desc": ("price", -1),
+    "newest": ("created_at", -1),
+    "default": (None, 1),
+}
+
+
+def _sort_spec(field: Optional[str], direction: int) -> list:
+    if field is None:
+        return [("_id", direction)]
+    return [(field, direction), ("_id", direction)]
+
+
+def _regex_fallback(query: dict, q: str) -> dict:
+    # used when no text index exists: search name/description case-insensitively
+    fallback_query = {k: v for k, v in query.items() if k != "$text"}
+    fallback_query["$or"] = [{"name": {"$regex": q, "$options": "i"}}, {"description": {"$regex": q, "$options": "i"}}]
+    return fallback_query
+
+
+def _is_missing_text_index(e) -> bool:
+    msg = str(e)
+    return "text index required" in msg or "IndexNotFound" in msg
+
+
+TOTAL_MODES = ("exact", "estimated", "none")
+# unfiltered facets are keyed on the catalog version, so they can outlive the listing TTL
+FACET_CACHE_TTL = 24 * 60 * 60
+
+
+def _facet_stages(price_buckets: int, price_bounds: Optional[list]) -> dict:
+    if price_bounds:
+        histogram = {"$bucket": {"groupBy": "$price", "boundaries": price_bounds, "default": "other", "output": {"count": {"$sum": 1}}}}
+    else:
+        histogram = {"$bucketAuto": {"groupBy": "$price", "buckets": price_buckets, "output": {"count": {"$sum": 1}}}}
+    return {
+        "categories": [{"$group": {"_id": "$category", "count": {"$sum": 1}}}, {"$sort": {"count": -1, "_id": 1}}],
+        "price_histogram": [histogram],
+    }
+
+
+def _format_facets(result: dict, price_bounds: Optional[list]) -> dict:
+    categories = [{"category": r["_id"], "count": r["count"]} for r in result.get("categories", [])]
+    histogram = []
+    for r in result.get("price_histogram", []):
+        bucket = r["_id"]
+        if isinstance(bucket, dict):
+            # $bucketAuto: {min, max}
+            histogram.append({"min": bucket.get("min"), "max": bucket.get("max"), "count": r["count"]})
+        elif bucket == "other":
+            histogram.append({"min": None, "max": None, "count": r["count"], "other": True})
+        else:
+            # $bucket: _id is the inclusive lower boundary
+            i = price_bounds.index(bucket)
+            histogram.append({"min": bucket, "max": price_bounds[i + 1], "count": r["count"]})
+    return {"categories": categories, "price_histogram": histogram}
+
+
+def _fetch_page(db, query: dict, page_stages: list, total_mode: str, facet_stages: Optional[dict] = None):
+    """Return `(docs, total, facet_results)` for one listing page.
+
+    The items run as their own pipeline so the keyset `$match` and `$sort`
+    can use an index (`$facet` branches cannot). The exact total and any
+    facets share a second pipeline; a bare total is a `count_documents`.
+    """
+    docs = list(db.products.aggregate([{"$match": query}, *page_stages]))
+    if total_mode == "none" and not facet_stages:
+        return docs, None, None
+    if not facet_stages:
+        if total_mode == "estimated" and not query:
+            return docs, db.products.estimated_document_count(), None
+        return docs, db.products.count_documents(query), None
+
+    branches = dict(facet_stages)
+    if total_mode != "none":
+        branches["total"] = [{"$count": "n"}]
+    result = next(db.products.aggregate([{"$match": query}, {"$facet": branches}]), None) or {}
+    counted = result.get("total") or [{}]
+    total = counted[0].get("n", 0) if total_mode != "none" else None
+    return docs, total, result
+
+
+SEARCH_ENGINES = ("mongo", "bm25")
+
+
+def _relevance_page(db, query: dict, ranked: list, after: Optional[str], page: int, limit: int, total_mode: str, facet_stages: Optional[dict] = None, projection: Optional[dict] = None):
+    """Page through BM25 results in score order.
+
+    Mongo only applies the remaining filters (category/price) to the ranked
+    ids; ordering and paging happen on the ranked list.
+    """
+    if query:
+        allowed = {d["_id"] for d in db.products.find({**query, "_id": {"$in": [doc_id for doc_id, _ in ranked]}}, {"_id": 1})}
+        ranked = [r for r in ranked if r[0] in allowed]
+    if after:
+        value, last_id = decode_cursor(after, "relevance")
+        boundary = (-float(value), str(last_id))
+        start = next((i for i, (doc_id, score) in enumerate(ranked) if (-score, str(doc_id)) > boundary), len(ranked))
+    else:
+        start = max((page - 1) * limit, 0)
+    window = ranked[start:start + limit]
+    by_id = {d["_id"]: d for d in db.products.find({"_id": {"$in": [doc_id for doc_id, _ in window]}}, projection)}
+    docs = []
+    for doc_id, score in window:
+        d = by_id.get(doc_id)
+        if d is not None:
+            d["score"] = score
+            docs.append(d)
+    total = None if total_mode == "none" else len(ranked)
+    facet_result = None
+    if facet_stages:
+        ids = [doc_id for doc_id, _ in ranked]
+        facet_result = next(db.products.aggregate([{"$match": {"_id": {"$in": ids}}}, {"$facet": facet_stages}]), None) or {}
+    return docs, total, facet_result
+
+
 @router.get("/products")
-def list_products(q: Optional[str] = Query(None), category: Optional[str] = Query(None), page: int = 1, limit: int = 12, min_price: Optional[int] = None, max_price: Optional[int] = None, sort: Optional[str] = None):
+def list_products(request: Request, response: Response, q: Optional[str] = Query(None), category: Optional[str] = Query(None), page: int = 1, limit: int = Query(12, ge=1), min_price: Optional[int] = None, max_price: Optional[int] = None, sort: Optional[str] = None, after: Optional[str] = None, total: str = "exact", search_engine: str = settings.SEARCH_ENGINE, facets: bool = False, price_buckets: int = Query(5, ge=1, le=50), price_bounds: Optional[str] = None, fields: Optional[str] = None):
+    """List products.
+
+    Pass `after` (the `next_cursor` of a previous response) for keyset
+    pagination, which stays fast on deep pages; `page` is ignored then.
+    `total=none` skips counting (infinite scroll), `total=estimated` uses
+    collection metadata when there is no filter.
+    `search_engine=bm25` answers `q` from the in-process index instead of
+    Mongo's $text, ranked by relevance unless another sort is given.
+    `facets=true` adds category counts and a price histogram for the
+    filter (`price_buckets` auto-sized buckets, or explicit comma-separated
+    `price_bounds`).
+    `fields` takes a preset (`card`, `detail`) or a comma-separated list of
+    product fields; the sort field is always included for the cursor.
+    The ETag is derived from the catalog version and the normalized query.
+    """
     db = get_db()
+    if search_engine not in SEARCH_ENGINES:
+        raise HTTPException(status_code=400, detail="search_engine must be one of: " + ", ".join(SEARCH_ENGINES))
+    use_bm25 = bool(q) and search_engine == "bm25"
     query = {}
-    if q:
+    if q and not use_bm25:
         # prefer $text search, but fall back to regex if text index missing
         query_text = {"$search": q}
         query["$text"] = query_text
@@ -34,73 +226,272 @@ def list_products(q: Optional[str] = Query(None), category: Optional[str] = Quer
             price_query["$lte"] = max_price
         query["price"] = price_query
 
+    sort_name = sort if sort in SORTS else "default"
+    sort_field, direction = SORTS[sort_name]
+    by_relevance = use_bm25 and sort_name == "default"
+    fields_key, field_list = _parse_fields(fields)
+    sort_extra = (sort_field,) if sort_field else ()
+    bounds = None
+    if price_bounds:
+        try:
+            bounds = sorted({int(b) for b in price_bounds.split(",") if b.strip()})
+        except ValueError:
+            raise HTTPException(status_code=400, detail="price_bounds must be comma-separated integers")
+        if len(bounds) < 2:
+            raise HTTPException(status_code=400, detail="price_bounds needs at least two values")
+    if total not in TOTAL_MODES:
+        raise HTTPException(status_code=400, detail="total must be one of: " + ", ".join(TOTAL_MODES))
+
+    # $text and the regex fallback are both case-insensitive, so q can be folded
+    params_key = ((q or "").strip().lower(), category, min_price, max_price, sort_name, after or page, limit, total, use_bm25, facets and (tuple(bounds) if bounds else price_buckets), fields_key)
+    version = catalog_version(db)
+    etag = make_etag("products", version, repr(params_key))
+    if matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    # the DB version in the key also drops entries written by other workers
+    cache_key = ("list", catalog_cache.generation, version, params_key)
+    cached = catalog_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    facet_stages = None
+    cached_facets = None
+    # like the listing key, the DB version drops facets after writes from other workers
+    facet_key = ("facets", catalog_cache.generation, version, tuple(bounds) if bounds else price_buckets)
+    if facets:
+        # the unfiltered facets only change on product writes, so keep them until the next one
+        if not q and not query:
+            cached_facets = catalog_cache.get(facet_key)
+        if cached_facets is None:
+            facet_stages = _facet_stages(price_buckets, bounds)
+
+    if use_bm25:
+        if not product_search.ready:
+            product_search.build_from_db(db)
+        ranked = product_search.search(q)
+
+    if by_relevance:
+        docs, count, facet_result = _relevance_page(db, query, ranked, after, page, limit, total, facet_stages, _find_projection(fields_key, field_list))
+        next_cursor = None
+        if len(docs) == limit:
+            next_cursor = encode_cursor("relevance", docs[-1]["score"], docs[-1]["_id"])
+        facet_out = _format_facets(facet_result, bounds) if facet_result is not None else None
+        return _listing_result(cache_key, docs, count, page, limit, next_cursor, facet_out)
+
+    if use_bm25:
+        query["_id"] = {"$in": [doc_id for doc_id, _ in ranked]}
+
+    page_stages = []
+    if after:
+        value, last_id = decode_cursor(after, sort_name)
+        page_stages.append({"$match": keyset_filter(sort_field, direction, value, last_id)})
+    page_stages.append({"$sort": dict(_sort_spec(sort_field, direction))})
+    if not after:
+        page_stages.append({"$skip": max((page - 1) * limit, 0)})
+    page_stages.append({"$limit": limit})
+    project = _project_stage(fields_key, field_list, sort_extra)
+    if project:
+        page_stages.append(project)
+
     from pymongo.errors import OperationFailure
     try:
-        total = db.products.count_documents(query)
+        docs, count, facet_result = _fetch_page(db, query, page_stages, total, facet_stages)
     except OperationFailure as e:
-        # fallback: if text index required for $text, use regex search on name/description
-        msg = str(e)
-        if "text index required" in msg or "IndexNotFound" in msg:
-            # remove $text and use regex search
-            qval = q
-            if qval:
-                regex_q = {"$or": [{"name": {"$regex": qval, "$options": "i"}}, {"description": {"$regex": qval, "$options": "i"}}]}
-                # merge with other filters
-                fallback_query = {k: v for k, v in query.items() if k != "$text"}
-                fallback_query.update(regex_q)
-                total = db.products.count_documents(fallback_query)
-                cursor = db.products.find(fallback_query)
-            else:
-                raise
-        else:
+        if not (q and _is_missing_text_index(e)):
             raise
-    skip = max((page - 1) * limit, 0)
+        docs, count, facet_result = _fetch_page(db, _regex_fallback(query, q), page_stages, total, facet_stages)
 
-    # If cursor wasn't set by the fallback above, use the normal query
-    try:
-        cursor
-    except NameError:
-        cursor = db.products.find(query)
-    if sort:
-        # simple mapping: price_asc, price_desc, newest
-        if sort == "price_asc":
-            cursor = cursor.sort("price", 1)
-        elif sort == "price_desc":
-            cursor = cursor.sort("price", -1)
-        elif sort == "newest":
-            cursor = cursor.sort("created_at", -1)
-
-    docs = cursor.skip(skip).limit(limit)
+    facet_out = cached_facets
+    if facet_stages:
+        facet_out = _format_facets(facet_result, bounds)
+        if not q and not query:
+            catalog_cache.set(facet_key, facet_out, ttl=FACET_CACHE_TTL)
+
+    next_cursor = None
+    if len(docs) == limit:
+        last = docs[-1]
+        next_cursor = encode_cursor(sort_name, last.get(sort_field) if sort_field else None, last["_id"])
+    return _listing_result(cache_key, docs, count, page, limit, next_cursor, facet_out)
+
+
+def _listing_result(cache_key, docs: list, count, page: int, limit: int, next_cursor: Optional[str], facet_out: Optional[dict] = None) -> dict:
     items = []
     for d in docs:
         d["id"] = str(d["_id"])
         d.pop("_id", None)
         items.append(d)
 
-    return {"items": items, "total": total, "page": page, "limit": limit}
+    result = {"items": items, "total": count, "page": page, "limit": limit, "next_cursor": next_cursor}
+    if facet_out is not None:
+        result["facets"] = facet_out
+    catalog_cache.set(cache_key, result)
+    return result
 
 
 @router.get("/products/categories")
-def get_categories():
+def get_categories(request: Request, response: Response):
     db = get_db()
+    version = catalog_version(db)
+    etag = make_etag("categories", version)
+    if matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    cache_key = ("categories", catalog_cache.generation, version)
+    cached = catalog_cache.get(cache_key)
+    if cached is not None:
+        return cached
     cats = db.products.distinct("category")
     # filter out falsy values and return unique list
     cats = [c for c in cats if c]
-    return {"categories": cats}
+    result = {"categories": cats}
+    catalog_cache.set(cache_key, result)
+    return result
+
+
+def _public(doc: dict) -> dict:
+    doc["id"] = str(doc.pop("_id"))
+    for f in INTERNAL_FIELDS:
+        doc.pop(f, None)
+    return doc
+
+
+def _version_projection() -> dict:
+    return {f: 1 for f in VERSION_FIELDS}
+
+
+def _cached_variants(oid, version) -> dict:
+    """Projections of a product cached from document version `version`.
+
+    Entries carry the version they were built from, so a write made by
+    another worker (which cannot drop this worker's cache) is noticed on
+    the next read.
+    """
+    entry = catalog_cache.get(("product", oid))
+    if entry is None or entry[0] != version:
+        return {}
+    return entry[1]
+
+
+def _cache_detail(doc: dict, fields_key, field_list, variants: dict):
+    """Normalize a product fetched with `VERSION_FIELDS` and cache it.
+
+    One cache entry per product holds every projection served for it, so a
+    write can drop them all with one delete. Returns `(etag, doc)`.
+    """
+    oid = doc["_id"]
+    version = doc_version(doc)
+    etag = make_etag("product", oid, version, fields_key)
+    if field_list is not None:
+        for f in VERSION_FIELDS:
+            if f not in field_list:
+                doc.pop(f, None)
+    _public(doc)
+    catalog_cache.set(("product", oid), (version, {**variants, fields_key: (etag, doc)}))
+    return etag, doc
+
+
+@router.get("/products/suggest")
+def suggest_products(prefix: str = Query(..., min_length=1, max_length=100), limit: int = Query(8, ge=1, le=20)):
+    """Typeahead for the search box, answered from the in-memory prefix index."""
+    if not product_suggest.ready:
+        product_suggest.build_from_db(get_db())
+    return {"suggestions": product_suggest.suggest(prefix, limit)}
+
+
+BATCH_MAX_IDS = 100
+
+
+@router.get("/products/batch")
+def get_products_batch(ids: List[str] = Query(...), fields: Optional[str] = None):
+    """Fetch up to `BATCH_MAX_IDS` products in one `$in` query.
+
+    `ids` may be comma-separated and/or repeated. Results follow request
+    order; unknown or malformed ids come back with `found: false`.
+    """
+    wanted = [i.strip() for raw in ids for i in raw.split(",") if i.strip()]
+    if len(wanted) > BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_IDS} ids per request")
+    fields_key, field_list = _parse_fields(fields)
+
+    oids = {}
+    for i in wanted:
+        if ObjectId.is_valid(i):
+            oids[i] = ObjectId(i)
+    found = {}
+    variants_by_id = {}
+    missing = []
+    db = get_db()
+    # only products cached here need their current version checked
+    cached = [oid for oid in set(oids.values()) if catalog_cache.get(("product", oid)) is not None]
+    versions = {d["_id"]: doc_version(d) for d in db.products.find({"_id": {"$in": cached}}, _version_projection())} if cached else {}
+    for oid in set(oids.values()):
+        variants = _cached_variants(oid, versions[oid]) if oid in versions else {}
+        if fields_key in variants:
+            found[oid] = variants[fields_key][1]
+        else:
+            variants_by_id[oid] = variants
+            missing.append(oid)
+    if missing:
+        for doc in db.products.find({"_id": {"$in": missing}}, _find_projection(fields_key, field_list, VERSION_FIELDS)):
+            oid = doc["_id"]
+            found[oid] = _cache_detail(doc, fields_key, field_list, variants_by_id[oid])[1]
+
+    items = []
+    for i in wanted:
+        oid = oids.get(i)
+        if oid is None:
+            items.append({"id": i, "found": False, "error": "invalid_id"})
+        elif oid not in found:
+            items.append({"id": i, "found": False, "error": "not_found"})
+        else:
+            items.append({"id": i, "found": True, "product": found[oid]})
+    return {"items": items}
+
+
+@router.get("/products/availability")
+def get_availability(ids: List[str] = Query(...)):
+    """Units available to sell (stock minus units held in carts) for up to
+    `BATCH_MAX_IDS` products. Not cached: holds change it constantly."""
+    wanted = [i.strip() for raw in ids for i in raw.split(",") if i.strip()]
+    if len(wanted) > BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_IDS} ids per request")
+    oids = {i: ObjectId(i) for i in wanted if ObjectId.is_valid(i)}
+    available = available_to_sell(get_db(), set(oids.values()))
+    return {"items": [{"id": i, "available": available.get(oids.get(i))} for i in wanted]}
 
 
 @router.get("/products/{product_id}")
-def get_product(product_id: str):
+def get_product(product_id: str, request: Request, response: Response, fields: Optional[str] = None):
     db = get_db()
     oid = _obj_id(product_id)
-    doc = db.products.find_one({"_id": oid})
-    if not doc:
+    fields_key, field_list = _parse_fields(fields)
+    current = db.products.find_one({"_id": oid}, _version_projection())
+    if not current:
         raise HTTPException(status_code=404, detail="Product not found")
-    doc["id"] = str(doc["_id"])
-    doc.pop("_id", None)
+    variants = _cached_variants(oid, doc_version(current))
+    if fields_key in variants:
+        etag, doc = variants[fields_key]
+    else:
+        doc = db.products.find_one({"_id": oid}, _find_projection(fields_key, field_list, VERSION_FIELDS))
+        if not doc:
+            raise HTTPException(status_code=404, detail="Product not found")
+        etag, doc = _cache_detail(doc, fields_key, field_list, variants)
+    if matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
     return doc
 
 
+def _invalidate_catalog(db, oid: ObjectId | None = None):
+    # listings/categories are keyed on the generation and the catalog
+    # version (which other workers see too); details on the id
+    bump_catalog_version(db)
+    catalog_cache.bump_generation()
+    if oid is not None:
+        catalog_cache.delete(("product", oid))
+
+
 @router.post("/products", dependencies=[Depends(require_admin)])
 def create_product(payload: ProductCreate):
     db = get_db()
@@ -108,15 +499,17 @@ def create_product(payload: ProductCreate):
     # set created_at timestamp
     from datetime import datetime
     doc["created_at"] = datetime.utcnow()
+    doc["updated_at"] = doc["created_at"]
+    doc["version"] = 1
 
     res = db.products.insert_one(doc)
+    _invalidate_catalog(db)
+    product_search.add(doc)
+    product_suggest.add_product(doc)
 
     # fetch the saved document and normalize ObjectId to strings for JSON
     created = db.products.find_one({"_id": res.inserted_id})
-    if created:
-        created["id"] = str(created.get("_id"))
-        created.pop("_id", None)
-    return created
+    return _public(created) if created else created
 
 
 @router.put("/products/{product_id}", dependencies=[Depends(require_admin)])
@@ -126,11 +519,33 @@ def update_product(product_id: str, payload: ProductUpdate):
     update = {k: v for k, v in payload.model_dump().items() if v is not None}
     if not update:
         raise HTTPException(status_code=400, detail="No fields to update")
-    db.products.update_one({"_id": oid}, {"$set": update})
+    from datetime import datetime
+    shards = stock_shards.registry.shards(db).get(oid)
+    if shards and "stock" in update:
+        # a sharded product's stock lives in its shards
+        stock_shards.configure(db, oid, shards, stock=update.pop("stock"))
+    update["updated_at"] = datetime.utcnow()
+    db.products.update_one({"_id": oid}, {"$set": update, "$inc": {"version": 1}})
+    _invalidate_catalog(db, oid)
     doc = db.products.find_one({"_id": oid})
-    doc["id"] = str(doc["_id"])
-    doc.pop("_id", None)
-    return doc
+    if not doc:
+        raise HTTPException(status_code=404, detail="Product not found")
+    product_search.add(doc)
+    product_suggest.add_product(doc)
+    return _public(doc)
+
+
+@router.put("/products/{product_id}/stock-shards", dependencies=[Depends(require_admin)])
+def set_stock_shards(product_id: str, shards: int = Query(..., ge=0, le=stock_shards.MAX_SHARDS)):
+    """Switch a hot product to sharded stock counters (`shards=0` switches
+    back). Its current stock is redistributed; do this while it is quiet."""
+    db = get_db()
+    oid = _obj_id(product_id)
+    available = stock_shards.configure(db, oid, shards)
+    if available is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    _invalidate_catalog(db, oid)
+    return {"id": product_id, "shards": shards, "available": available}
 
 
 @router.delete("/products/{product_id}", dependencies=[Depends(require_admin)])
@@ -138,11 +553,41 @@ def delete_product(product_id: str):
     db = get_db()
     oid = _obj_id(product_id)
     res = db.products.delete_one({"_id": oid})
+    db.stock_shards.delete_many({"product_id": oid})
+    _invalidate_catalog(db, oid)
+    product_search.remove(oid)
+    product_suggest.remove_product(oid)
     if res.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
     return {"message": "deleted"}
 
 
+IMPORT_FORMATS = ("ndjson", "csv")
+
+
+@router.post("/products/import", dependencies=[Depends(require_admin)])
+async def import_products_stream(request: Request, format: Optional[str] = None, batch_size: int = Query(1000, ge=1, le=10000)):
+    """Bulk-load products from an NDJSON or CSV request body.
+
+    The body is parsed as it streams in; rows are validated with
+    `ProductCreate` and written with unordered `bulk_write` batches. Rows
+    with a `sku` are upserted on it, others are inserted. CSV lists
+    (`images`) are `|`-separated.
+    """
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be one of: " + ", ".join(IMPORT_FORMATS))
+    db = get_db()
+    parse = iter_csv if format == "csv" else iter_ndjson
+    report = await import_products(db, parse(iter_lines(request.stream())), batch_size=batch_size)
+    if report["inserted"] or report["upserted"] or report["updated"]:
+        _invalidate_catalog(db)
+        await run_in_threadpool(product_search.build_from_db, db)
+        await run_in_threadpool(product_suggest.build_from_db, db)
+    return report
+
+
 @router.post("/products/upload-image")
 async def upload_product_image(file: UploadFile = File(...)):
     # Use cloudinary uploader util to save the image and return URL
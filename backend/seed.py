@@ -12,6 +12,7 @@ if str(PARENT) not in sys.path:
     sys.path.insert(0, str(PARENT))
 
 from backend.database.connection import get_db
+from backend.database.indexes import ensure_indexes
 import bcrypt
 
 
@@ -33,11 +34,8 @@ def create_admin():
         "role": "admin",
     }
     res = db.users.insert_one(user)
-    # ensure jti index for refresh tokens
-    try:
-        db.refresh_tokens.create_index("jti", unique=True)
-    except Exception:
-        pass
+    # ensure jti index for refresh tokens (and the rest of the registry)
+    ensure_indexes(db)
     print("Inserted admin user id:", res.inserted_id)
 
 
@@ -11,6 +11,7 @@ if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
 from backend.database.connection import get_db
+from backend.database.indexes import ensure_indexes
 from bson import ObjectId
 
 
@@ -40,14 +41,9 @@ def seed():
     if existing:
         print("Products already seeded")
         return
-    for p in SAMPLE:
-        db.products.insert_one({**p})
-    # create text index for search
-    try:
-        db.products.create_index([("name", "text"), ("description", "text")])
-        print("Created text index on products.name and products.description")
-    except Exception as e:
-        print("Failed to create index:", e)
+    db.products.insert_many([{**p} for p in SAMPLE])
+    # create the text index for search along with the other registered indexes
+    ensure_indexes(db)
     print("Seeded sample products")
 
 
@@ -15,9 +15,43 @@ from fastapi.exceptions import RequestValidationError
 from slowapi.middleware import SlowAPIMiddleware
 from backend.config.limiter import limiter
 
+from contextlib import asynccontextmanager
+from backend.database.connection import get_db
+from backend.database.indexes import ensure_indexes
+from backend.core.search import product_search
+from backend.core.suggest import product_suggest
+from backend.core.holds import HoldSweeper
+from backend.core.tasks import task_queue
+import backend.core.order_events  # noqa: F401  (registers the order task handlers)
+from backend.core.config import settings
+
 configure_logging()
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # provision indexes before serving; a DB hiccup here should not block startup
+    try:
+        report = ensure_indexes(get_db())
+        created = {c: r["created"] for c, r in report.items() if r["created"]}
+        if created:
+            logger.info("Created indexes: %s", created)
+    except Exception:
+        logger.exception("Index provisioning failed")
+    try:
+        product_search.build_from_db(get_db())
+        product_suggest.build_from_db(get_db())
+    except Exception:
+        logger.exception("Building the product search indexes failed")
+    sweeper = HoldSweeper(get_db, settings.HOLD_SWEEP_SECONDS)
+    sweeper.start()
+    task_queue.start()
+    yield
+    task_queue.stop()
+    sweeper.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 # Attach limiter to app state and add middleware
 app.state.limiter = limiter
 app.add_middleware(SlowAPIMiddleware)
@@ -0,0 +1,26 @@
+import time
+from backend.core.cache import QueryCache
+
+
+def test_lru_eviction_ttl_and_generation():
+    cache = QueryCache(maxsize=2, ttl=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)  # evicts "b", the least recently used
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+    gen = cache.generation
+    cache.set(("list", gen), "page")
+    cache.bump_generation()
+    assert cache.get(("list", cache.generation)) is None
+
+    cache.set("d", 4)
+    time.sleep(0.06)
+    assert cache.get("d") is None
+
+    stats = cache.stats()
+    assert stats["evictions"] >= 1
+    assert stats["expirations"] == 1
+    assert stats["hits"] == 2
@@ -0,0 +1,191 @@
+from fastapi.testclient import TestClient
+from backend.server import app
+from backend.database.connection import get_db
+from bson import ObjectId
+
+client = TestClient(app)
+
+
+def login_buyer(db, email="cartbuyer@example.com"):
+    db.users.delete_many({"email": email})
+    db.carts.delete_many({})
+    c = TestClient(app)
+    c.post("/api/auth/register", json={"username": "cartbuyer", "email": email, "password": "buyerpw"})
+    res = c.post("/api/auth/login", json={"email": email, "password": "buyerpw"})
+    assert res.status_code == 200
+    return c
+
+
+def test_cart_enrichment_and_totals():
+    db = get_db()
+    db.products.delete_many({})
+    p1 = db.products.insert_one({"name": "Socks", "price": 300, "stock": 9, "images": ["s1.jpg", "s2.jpg"]}).inserted_id
+    p2 = db.products.insert_one({"name": "Hat", "price": 800, "stock": 4}).inserted_id
+    buyer = login_buyer(db)
+
+    assert buyer.post("/api/cart/add", json={"product_id": str(p1), "quantity": 2, "price": 300}).status_code == 200
+    assert buyer.post("/api/cart/add", json={"product_id": str(p2), "quantity": 1, "price": 800}).status_code == 200
+
+    cart = buyer.get("/api/cart").json()
+    assert [it["name"] for it in cart["items"]] == ["Socks", "Hat"]
+    assert cart["items"][0]["image"] == "s1.jpg"
+    assert cart["count"] == 3 and cart["total"] == 1400
+
+    plain = buyer.get("/api/cart", params={"enrich": "false"}).json()
+    assert "name" not in plain["items"][0]
+    assert plain["total"] == 1400
+
+
+def test_cart_mutations_are_atomic_and_return_the_cart():
+    from concurrent.futures import ThreadPoolExecutor
+    db = get_db()
+    db.products.delete_many({})
+    pid = str(db.products.insert_one({"name": "Socks", "price": 300, "stock": 100}).inserted_id)
+    buyer = login_buyer(db)
+    # concurrent first adds rely on the unique carts.user_id index
+    db.carts.create_index("user_id", unique=True)
+
+    def add(_):
+        return buyer.post("/api/cart/add", json={"product_id": pid, "quantity": 1, "price": 300}).status_code
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert set(pool.map(add, range(20))) == {200}
+    cart = buyer.get("/api/cart").json()
+    assert len(cart["items"]) == 1
+    assert cart["items"][0]["quantity"] == 20
+
+    res = buyer.put("/api/cart/update", json={"product_id": pid, "quantity": 3, "price": 300})
+    assert res.json()["cart"]["items"][0]["quantity"] == 3
+    res = buyer.delete("/api/cart/remove", params={"product_id": pid})
+    assert res.json()["cart"]["items"] == []
+    res = buyer.put("/api/cart/update", json={"product_id": pid, "quantity": 3, "price": 300})
+    assert res.status_code == 404
+
+
+def test_patch_cart_applies_operations_in_order():
+    db = get_db()
+    db.products.delete_many({})
+    a = str(db.products.insert_one({"name": "Socks", "price": 300, "stock": 10}).inserted_id)
+    b = str(db.products.insert_one({"name": "Hat", "price": 800, "stock": 1}).inserted_id)
+    buyer = login_buyer(db)
+
+    res = buyer.patch("/api/cart", json={"operations": [
+        {"op": "add", "product_id": a, "quantity": 2},
+        {"op": "add", "product_id": b, "quantity": 1},
+        {"op": "add", "product_id": a, "quantity": 1},
+        {"op": "set", "product_id": b, "quantity": 0},
+    ]})
+    assert res.status_code == 200
+    cart = res.json()
+    assert [(it["name"], it["quantity"], it["price"]) for it in cart["items"]] == [("Socks", 3, 300)]
+
+    res = buyer.patch("/api/cart", json={"operations": [{"op": "add", "product_id": b, "quantity": 2}]})
+    assert res.status_code == 400
+
+
+def test_cart_holds_reserve_stock_until_released_or_expired():
+    from datetime import datetime, timedelta
+    from backend.core.holds import sweep_expired
+    db = get_db()
+    db.products.delete_many({})
+    db.inventory_holds.delete_many({})
+    pid = db.products.insert_one({"name": "Last units", "price": 900, "stock": 3}).inserted_id
+    buyer = login_buyer(db)
+    other = login_buyer(db, email="otherbuyer@example.com")
+
+    assert buyer.post("/api/cart/add", json={"product_id": str(pid), "quantity": 2, "price": 900}).status_code == 200
+    available = lambda: TestClient(app).get("/api/products/availability", params={"ids": str(pid)}).json()["items"][0]["available"]
+    assert available() == 1
+    # the held units are not offered to anyone else
+    assert other.post("/api/cart/add", json={"product_id": str(pid), "quantity": 2, "price": 900}).status_code == 400
+    assert buyer.put("/api/cart/update", json={"product_id": str(pid), "quantity": 3, "price": 900}).status_code == 200
+    assert available() == 0
+    assert buyer.delete("/api/cart/remove", params={"product_id": str(pid)}).status_code == 200
+    assert available() == 3
+
+    # expired holds go back to stock
+    assert other.post("/api/cart/add", json={"product_id": str(pid), "quantity": 3, "price": 900}).status_code == 200
+    assert sweep_expired(db, datetime.utcnow() + timedelta(days=1)) == 1
+    assert available() == 3
+
+    # checkout consumes the hold
+    assert other.post("/api/cart/add", json={"product_id": str(pid), "quantity": 2, "price": 900}).status_code == 200
+    res = other.post("/api/checkout", json={"items": [{"product_id": str(pid), "quantity": 2, "price": 1}]})
+    assert res.status_code == 200
+    prod = db.products.find_one({"_id": pid})
+    assert prod["stock"] == 1 and prod.get("held", 0) == 0
+    assert db.inventory_holds.count_documents({}) == 0
+    assert db.orders.find_one({"_id": ObjectId(res.json()["order_id"])})["total_amount"] == 1800
+
+
+def test_simulated_payment_consumes_holds_and_flags_short_lines():
+    db = get_db()
+    db.products.delete_many({})
+    db.inventory_holds.delete_many({})
+    held = db.products.insert_one({"name": "Held", "price": 100, "stock": 3}).inserted_id
+    scarce = db.products.insert_one({"name": "Scarce", "price": 50, "stock": 1}).inserted_id
+    buyer = login_buyer(db, email="paybuyer@example.com")
+    assert buyer.post("/api/cart/add", json={"product_id": str(held), "quantity": 2, "price": 100}).status_code == 200
+
+    res = buyer.post("/api/payments/create-checkout-session", json={"items": [
+        {"product_id": str(held), "quantity": 2},
+        {"product_id": str(scarce), "quantity": 2},
+    ]})
+    assert res.status_code == 200
+    prod = db.products.find_one({"_id": held})
+    assert prod["stock"] == 1 and prod.get("held", 0) == 0
+    assert db.products.find_one({"_id": scarce})["stock"] == 1
+    assert db.inventory_holds.count_documents({}) == 0
+    order = db.orders.find_one({"_id": ObjectId(res.json()["order_id"])})
+    assert order["unfulfilled"] == [{"product_id": scarce, "quantity": 2}]
+
+
+def test_patch_cart_releases_holds_when_the_cart_write_fails():
+    db = get_db()
+    db.products.delete_many({})
+    db.inventory_holds.delete_many({})
+    pid = db.products.insert_one({"name": "Gloves", "price": 200, "stock": 4}).inserted_id
+    buyer = login_buyer(db, email="patchfail@example.com")
+
+    assert buyer.patch("/api/cart", json={"operations": [{"op": "add", "product_id": str(pid), "quantity": 0}]}).status_code == 400
+
+    # a corrupt cart document makes the $push fail after the holds were taken
+    uid = db.users.find_one({"email": "patchfail@example.com"})["_id"]
+    db.carts.insert_one({"user_id": uid, "items": "corrupt"})
+    failing = TestClient(app, raise_server_exceptions=False)
+    failing.cookies = buyer.cookies
+    res = failing.patch("/api/cart", json={"operations": [{"op": "add", "product_id": str(pid), "quantity": 3}]})
+    assert res.status_code == 500
+    assert db.products.find_one({"_id": pid}).get("held", 0) == 0
+    assert db.inventory_holds.count_documents({"product_id": pid}) == 0
+
+
+def test_failed_checkouts_give_the_holds_back_to_the_cart():
+    db = get_db()
+    db.products.delete_many({})
+    db.inventory_holds.delete_many({})
+    held = db.products.insert_one({"name": "Scarf", "price": 100, "stock": 3}).inserted_id
+    scarce = db.products.insert_one({"name": "Hat", "price": 50, "stock": 1}).inserted_id
+    buyer = login_buyer(db, email="failcheckout@example.com")
+    assert buyer.post("/api/cart/add", json={"product_id": str(held), "quantity": 2, "price": 100}).status_code == 200
+
+    res = buyer.post("/api/checkout", json={"items": [
+        {"product_id": str(held), "quantity": 2, "price": 100},
+        {"product_id": str(scarce), "quantity": 2, "price": 50},
+    ]})
+    assert res.status_code == 400
+    assert db.inventory_holds.count_documents({"product_id": held, "claimed_by": {"$ne": None}}) == 0
+    assert buyer.put("/api/cart/update", json={"product_id": str(held), "quantity": 3, "price": 100}).status_code == 200
+    assert buyer.delete("/api/cart/remove", params={"product_id": str(held)}).status_code == 200
+    assert db.products.find_one({"_id": held}).get("held", 0) == 0
+
+    # the simulated payment fails before placing the order
+    assert buyer.post("/api/cart/add", json={"product_id": str(held), "quantity": 1, "price": 100}).status_code == 200
+    failing = TestClient(app, raise_server_exceptions=False)
+    failing.cookies = buyer.cookies
+    res = failing.post("/api/payments/create-checkout-session", json={"items": [{"product_id": str(held), "quantity": "two"}]})
+    assert res.status_code == 500
+    assert db.orders.count_documents({"items.product_id": held}) == 0
+    assert db.inventory_holds.count_documents({"product_id": held, "claimed_by": {"$ne": None}}) == 0
+    assert buyer.post("/api/cart/add", json={"product_id": str(held), "quantity": 1, "price": 100}).status_code == 200
+    assert db.products.find_one({"_id": held})["held"] == 2
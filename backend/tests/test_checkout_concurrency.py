@@ -0,0 +1,211 @@
+"""Parallel checkouts must never oversell.
+
+Against a single-node replica set (see `replset/docker-compose.yml`) the
+checkout runs in a transaction; against a standalone mongod it falls back to
+conditional decrements with compensation. Both must end with exactly as many
+orders as there was stock.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from backend.server import app
+from backend.database.connection import get_db
+from backend.core import stock_shards
+from backend.core.config import settings
+from backend.core.etag import catalog_version
+from backend.core.idempotency import IdempotencyStore
+
+
+def test_parallel_checkouts_do_not_oversell():
+    db = get_db()
+    db.products.delete_many({})
+    db.orders.delete_many({})
+    pid = str(db.products.insert_one({"name": "Limited", "price": 500, "stock": 5}).inserted_id)
+
+    email = "rushbuyer@example.com"
+    db.users.delete_many({"email": email})
+    buyer = TestClient(app)
+    buyer.post("/api/auth/register", json={"username": "rushbuyer", "email": email, "password": "buyerpw"})
+    assert buyer.post("/api/auth/login", json={"email": email, "password": "buyerpw"}).status_code == 200
+
+    def checkout(_):
+        return buyer.post("/api/checkout", json={"items": [{"product_id": pid, "quantity": 1, "price": 500}]}).status_code
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        codes = list(pool.map(checkout, range(20)))
+
+    assert codes.count(200) == 5
+    assert set(codes) <= {200, 400, 409}
+    assert db.orders.count_documents({}) == 5
+    assert db.products.find_one()["stock"] == 0
+
+
+def test_checkout_is_all_or_nothing():
+    db = get_db()
+    db.products.delete_many({})
+    db.orders.delete_many({})
+    plenty = str(db.products.insert_one({"name": "Plenty", "price": 100, "stock": 10}).inserted_id)
+    scarce = str(db.products.insert_one({"name": "Scarce", "price": 100, "stock": 1}).inserted_id)
+
+    email = "allornothing@example.com"
+    db.users.delete_many({"email": email})
+    buyer = TestClient(app)
+    buyer.post("/api/auth/register", json={"username": "aon", "email": email, "password": "buyerpw"})
+    assert buyer.post("/api/auth/login", json={"email": email, "password": "buyerpw"}).status_code == 200
+
+    res = buyer.post("/api/checkout", json={"items": [
+        {"product_id": plenty, "quantity": 2, "price": 100},
+        {"product_id": scarce, "quantity": 2, "price": 100},
+    ]})
+    assert res.status_code == 400
+    assert db.orders.count_documents({}) == 0
+    stock = {p["name"]: p["stock"] for p in db.products.find()}
+    assert stock == {"Plenty": 10, "Scarce": 1}
+
+
+def test_idempotency_key_replays_instead_of_reordering():
+    db = get_db()
+    db.products.delete_many({})
+    db.orders.delete_many({})
+    db.idempotency_keys.delete_many({})
+    pid = str(db.products.insert_one({"name": "Retry", "price": 250, "stock": 10}).inserted_id)
+
+    email = "retrybuyer@example.com"
+    db.users.delete_many({"email": email})
+    buyer = TestClient(app)
+    buyer.post("/api/auth/register", json={"username": "retrybuyer", "email": email, "password": "buyerpw"})
+    assert buyer.post("/api/auth/login", json={"email": email, "password": "buyerpw"}).status_code == 200
+
+    body = {"items": [{"product_id": pid, "quantity": 2, "price": 250}]}
+
+    def checkout(_):
+        res = buyer.post("/api/checkout", json=body, headers={"Idempotency-Key": "order-1"})
+        return res.status_code, res.json()["order_id"]
+
+    # duplicates arriving while the first is in flight wait for its result
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(pool.map(checkout, range(6)))
+    assert {code for code, _ in results} == {200}
+    assert len({order_id for _, order_id in results}) == 1
+    assert db.orders.count_documents({}) == 1
+    assert db.products.find_one()["stock"] == 8
+
+    res = buyer.post("/api/checkout", json=body, headers={"Idempotency-Key": "order-1"})
+    assert res.headers["Idempotent-Replayed"] == "true"
+    other = {"items": [{"product_id": pid, "quantity": 1, "price": 250}]}
+    assert buyer.post("/api/checkout", json=other, headers={"Idempotency-Key": "order-1"}).status_code == 422
+
+    session = {"items": [{"product_id": pid, "quantity": 1}]}
+    first = buyer.post("/api/payments/create-checkout-session", json=session, headers={"Idempotency-Key": "sess-1"}).json()
+    again = buyer.post("/api/payments/create-checkout-session", json=session, headers={"Idempotency-Key": "sess-1"}).json()
+    assert first["order_id"] == again["order_id"]
+    assert db.orders.count_documents({}) == 2
+
+    # anonymous callers have no namespace of their own, so their keys are not stored
+    anon = [TestClient(app).post("/api/payments/create-checkout-session", json=session, headers={"Idempotency-Key": "sess-1"}).json() for _ in range(2)]
+    assert anon[0]["order_id"] != anon[1]["order_id"] != first["order_id"]
+    assert db.orders.count_documents({}) == 4
+
+
+class _ReadTogether:
+    """Collection wrapper whose `find_one` returns only once both callers
+    have read, so both see the same expired lease before either takes it."""
+
+    def __init__(self, coll, barrier):
+        self._coll = coll
+        self._barrier = barrier
+
+    def find_one(self, *args, **kwargs):
+        doc = self._coll.find_one(*args, **kwargs)
+        try:
+            self._barrier.wait(timeout=2)
+        except threading.BrokenBarrierError:
+            pass
+        return doc
+
+    def __getattr__(self, name):
+        return getattr(self._coll, name)
+
+
+def test_expired_idempotency_lease_is_taken_over_once(monkeypatch):
+    db = get_db()
+    db.idempotency_keys.delete_many({})
+    monkeypatch.setattr(settings, "IDEMPOTENCY_WAIT_SECONDS", 0.3)
+    rid = "checkout:u1:retry"
+    expired = datetime.utcnow() - timedelta(seconds=5)
+    db.idempotency_keys.insert_one({"_id": rid, "request_hash": "h", "state": "pending", "created_at": expired, "locked_until": expired})
+    coll = _ReadTogether(db.idempotency_keys, threading.Barrier(2))
+
+    def begin(_):
+        # one store per caller, like retries landing on two workers
+        try:
+            return IdempotencyStore().begin({"idempotency_keys": coll}, "checkout", "u1", "retry", "h")
+        except HTTPException as e:
+            return e.status_code
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        results = list(pool.map(begin, range(2)))
+    assert results.count((rid, None)) == 1
+    assert results.count(409) == 1
+
+
+def test_sharded_stock_does_not_oversell():
+    import bcrypt
+    db = get_db()
+    db.products.delete_many({})
+    db.orders.delete_many({})
+    db.stock_shards.delete_many({})
+    db.inventory_holds.delete_many({})
+    pid = str(db.products.insert_one({"name": "Drop", "price": 700, "stock": 7}).inserted_id)
+
+    db.users.delete_many({"email": "shardadmin@example.com"})
+    pw = bcrypt.hashpw(b"adminpass", bcrypt.gensalt()).decode()
+    db.users.insert_one({"username": "shardadmin", "email": "shardadmin@example.com", "password_hash": pw, "role": "admin"})
+    admin = TestClient(app)
+    assert admin.post("/api/auth/login", json={"email": "shardadmin@example.com", "password": "adminpass"}).status_code == 200
+    res = admin.put(f"/api/products/{pid}/stock-shards", params={"shards": 4})
+    assert res.json()["available"] == 7
+    assert sorted(s["stock"] for s in db.stock_shards.find()) == [1, 2, 2, 2]
+
+    email = "dropbuyer@example.com"
+    db.users.delete_many({"email": email})
+    buyer = TestClient(app)
+    buyer.post("/api/auth/register", json={"username": "dropbuyer", "email": email, "password": "buyerpw"})
+    assert buyer.post("/api/auth/login", json={"email": email, "password": "buyerpw"}).status_code == 200
+    # a cart hold takes its units out of the shards
+    assert buyer.post("/api/cart/add", json={"product_id": pid, "quantity": 2, "price": 700}).status_code == 200
+    assert sum(s["stock"] for s in db.stock_shards.find()) == 5
+
+    def checkout(_):
+        return buyer.post("/api/checkout", json={"items": [{"product_id": pid, "quantity": 1, "price": 700}]}).status_code
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        codes = list(pool.map(checkout, range(20)))
+    # one checkout consumed the 2-unit hold for 1 unit and returned the other
+    assert codes.count(200) == 7
+    assert sum(s["stock"] for s in db.stock_shards.find()) == 0
+    assert db.inventory_holds.count_documents({}) == 0
+
+    res = admin.put(f"/api/products/{pid}/stock-shards", params={"shards": 0})
+    assert res.json()["available"] == 0
+    assert db.products.find_one()["stock"] == 0 and db.stock_shards.count_documents({}) == 0
+
+
+def test_shard_stock_refresh_bumps_the_catalog_version(monkeypatch):
+    db = get_db()
+    db.products.delete_many({})
+    db.stock_shards.delete_many({})
+    pid = db.products.insert_one({"name": "Hot", "price": 10, "stock": 8}).inserted_id
+    before = catalog_version(db)
+    assert stock_shards.configure(db, pid, 4) == 8
+    assert catalog_version(db) > before
+
+    # a refresh outside the product routes must still move cached listings on
+    monkeypatch.setattr(stock_shards, "_last_refresh", {})
+    assert stock_shards.take(db, pid, 3)
+    before = catalog_version(db)
+    stock_shards.touch(db, pid)
+    assert db.products.find_one({"_id": pid})["stock"] == 5
+    assert catalog_version(db) > before
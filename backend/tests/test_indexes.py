@@ -0,0 +1,120 @@
+import pytest
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from backend.database import indexes
+from backend.database.connection import get_db
+from backend.database.indexes import INDEXES, ensure_indexes, verify_indexes
+from backend.ensure_indexes import main
+
+
+def _names(specs):
+    return sorted(m.document["name"] for m in indexes._models(specs))
+
+
+@pytest.fixture
+def db(monkeypatch):
+    # $indexStats is server-side bookkeeping; usage is not what these tests check
+    monkeypatch.setattr(indexes, "_index_usage", lambda coll: {})
+    db = get_db()
+    for coll_name in INDEXES:
+        db[coll_name].drop_indexes()
+    yield db
+    # the rest of the suite runs without the registered indexes
+    for coll_name in INDEXES:
+        db[coll_name].drop_indexes()
+
+
+def _lossy_partial_indexes(db) -> set:
+    """Registered partial indexes the test database stores without their
+    filter (mongomock does), which verify_indexes rightly calls different."""
+    db.index_probe.create_indexes([IndexModel("x", partialFilterExpression={"x": {"$exists": True}})])
+    try:
+        if "partialFilterExpression" in db.index_probe.index_information()["x_1"]:
+            return set()
+    finally:
+        db.index_probe.drop()
+    return {m.document["name"] for specs in INDEXES.values() for m in indexes._models(specs) if "partialFilterExpression" in m.document}
+
+
+def test_ensure_indexes_creates_every_registered_index(db):
+    report = ensure_indexes(db)
+    for coll_name, specs in INDEXES.items():
+        assert sorted(report[coll_name]["created"]) == _names(specs)
+        assert report[coll_name]["errors"] == {}
+        assert set(_names(specs)) <= set(db[coll_name].index_information())
+
+    # a second run finds them all in place
+    again = ensure_indexes(db)
+    assert all(r["created"] == [] for r in again.values())
+    lossy = _lossy_partial_indexes(db)
+    verified = verify_indexes(db)
+    assert all(r["missing"] == [] and set(r["different"]) <= lossy for r in verified.values())
+    assert main(["--check"]) == (1 if lossy else 0)
+
+
+def test_verify_indexes_reports_missing_and_different_indexes(db):
+    ensure_indexes(db)
+    db.orders.drop_index("created_at_-1__id_-1")
+    # same name as the registered index but without the uniqueness it enforces
+    db.carts.drop_index("user_id_1")
+    db.carts.create_index([("user_id", ASCENDING)])
+    # same name, other keys
+    db.product_sales.drop_index("quantity_-1__id_-1")
+    db.product_sales.create_index([("quantity", ASCENDING)], name="quantity_-1__id_-1")
+
+    report = verify_indexes(db)
+    assert report["orders"]["missing"] == ["created_at_-1__id_-1"]
+    assert report["carts"] == {"missing": [], "different": ["user_id_1"], "unregistered": [], "unused": []}
+    assert report["product_sales"]["different"] == ["quantity_-1__id_-1"]
+    assert report["products"]["missing"] == []
+    assert set(report["products"]["different"]) <= _lossy_partial_indexes(db)
+    assert main(["--check"]) == 1
+
+    # ensure_indexes does not replace an index that exists under the same name
+    assert ensure_indexes(db)["orders"]["created"] == ["created_at_-1__id_-1"]
+    assert verify_indexes(db)["carts"]["different"] == ["user_id_1"]
+
+
+def _plan_indexes(plan) -> set:
+    """Names of the indexes scanned anywhere in an explain() plan."""
+    found = set()
+    if isinstance(plan, dict):
+        if plan.get("stage") == "IXSCAN":
+            found.add(plan.get("indexName"))
+        for v in plan.values():
+            found |= _plan_indexes(v)
+    elif isinstance(plan, list):
+        for v in plan:
+            found |= _plan_indexes(v)
+    return found
+
+
+def test_listing_and_order_queries_use_their_indexes(db):
+    ensure_indexes(db)
+    if not hasattr(db.products.find(), "explain"):
+        pytest.skip("database without explain()")
+    db.products.insert_many([
+        {"name": f"item {i}", "category": "cat" + str(i % 3), "price": i, "created_at": None} for i in range(50)
+    ])
+    db.orders.insert_many([{"user_id": ObjectId(), "payment_status": "paid", "created_at": None} for _ in range(20)])
+    try:
+        cases = [
+            (db.products.find({"category": "cat1"}).sort([("price", ASCENDING), ("_id", ASCENDING)]), "category_1_price_1__id_1"),
+            (db.products.find({"price": {"$gte": 10, "$lte": 20}}).sort([("price", ASCENDING), ("_id", ASCENDING)]), "price_1__id_1"),
+            (db.products.find().sort([("created_at", DESCENDING), ("_id", DESCENDING)]).limit(20), "created_at_-1__id_-1"),
+            (db.orders.find({"user_id": ObjectId()}).sort([("created_at", DESCENDING), ("_id", DESCENDING)]), "user_id_1_created_at_-1__id_-1"),
+            (db.orders.find({"payment_status": "paid"}).sort([("created_at", DESCENDING), ("_id", DESCENDING)]), "payment_status_1_created_at_-1__id_-1"),
+        ]
+        for cursor, index in cases:
+            assert index in _plan_indexes(cursor.explain()["queryPlanner"]["winningPlan"])
+
+        # the listing runs its items page as an aggregate
+        explain = db.command("aggregate", "products", pipeline=[
+            {"$match": {"category": "cat2"}},
+            {"$sort": {"price": ASCENDING, "_id": ASCENDING}},
+            {"$limit": 20},
+        ], explain=True)
+        assert "category_1_price_1__id_1" in _plan_indexes(explain)
+    finally:
+        db.products.delete_many({"name": {"$regex": "^item "}})
+        db.orders.delete_many({"created_at": None})
@@ -0,0 +1,253 @@
+import json
+import time
+import bcrypt
+import pytest
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+from fastapi.testclient import TestClient
+from backend.server import app
+from backend.database.connection import get_db
+from backend.core import sales_analytics
+from backend.core.sales_stats import rebuild
+from backend.core.suggest import product_suggest
+from backend.core.tasks import TaskQueue, enqueue, task
+from backend.migrate_order_product_ids import migrate
+
+
+def login_admin(db, email="ordersadmin@example.com"):
+    db.users.delete_many({"email": email})
+    pw = bcrypt.hashpw(b"adminpass", bcrypt.gensalt()).decode()
+    db.users.insert_one({"username": "ordersadmin", "email": email, "password_hash": pw, "role": "admin"})
+    admin = TestClient(app)
+    assert admin.post("/api/auth/login", json={"email": email, "password": "adminpass"}).status_code == 200
+    return admin
+
+
+def seed_orders(db, n=7):
+    db.orders.delete_many({})
+    now = datetime.utcnow()
+    users = [ObjectId(), ObjectId()]
+    docs = []
+    for i in range(n):
+        docs.append({
+            "user_id": users[i % 2],
+            "items": [{"product_id": str(ObjectId()), "quantity": 1, "price": 100}],
+            "total_amount": 100,
+            "payment_status": "paid" if i % 3 else "success",
+            # two orders share each timestamp so the _id tie-break matters
+            "created_at": now - timedelta(minutes=i // 2),
+        })
+    db.orders.insert_many(docs)
+    return users
+
+
+def test_admin_orders_keyset_pages_and_filters():
+    db = get_db()
+    users = seed_orders(db)
+    admin = login_admin(db)
+
+    seen, after = [], None
+    while True:
+        params = {"limit": 3, **({"after": after} if after else {})}
+        body = admin.get("/api/orders/admin", params=params).json()
+        seen += [o["id"] for o in body["orders"]]
+        after = body["next_cursor"]
+        if not after:
+            break
+    expected = [str(d["_id"]) for d in db.orders.find().sort([("created_at", -1), ("_id", -1)])]
+    assert seen == expected
+
+    paid = admin.get("/api/orders/admin", params={"status": "paid"}).json()["orders"]
+    assert len(paid) == 4 and {o["payment_status"] for o in paid} == {"paid"}
+    mine = admin.get("/api/orders/admin", params={"user_id": str(users[0])}).json()["orders"]
+    assert len(mine) == 4
+    since = (datetime.utcnow() - timedelta(seconds=30)).isoformat()
+    assert len(admin.get("/api/orders/admin", params={"from": since}).json()["orders"]) == 2
+
+    streamed = admin.get("/api/orders/admin", params={"stream": "true", "status": "paid"})
+    assert [o["id"] for o in json.loads(streamed.text)["orders"]] == [o["id"] for o in paid]
+
+
+def test_admin_export_streams_flattened_lines():
+    import csv
+    import io
+    db = get_db()
+    seed_orders(db, n=3)
+    db.orders.update_one({}, {"$push": {"items": {"product_id": "p2", "quantity": 3, "price": 50}}})
+    admin = login_admin(db)
+
+    res = admin.get("/api/orders/admin/export", params={"format": "csv", "batch_size": 1})
+    assert res.status_code == 200
+    assert res.headers["content-disposition"].startswith("attachment;")
+    rows = list(csv.DictReader(io.StringIO(res.text)))
+    assert len(rows) == 4
+    assert {r["line_total"] for r in rows} == {"100", "150"}
+
+    res = admin.get("/api/orders/admin/export", params={"format": "ndjson", "status": "paid"})
+    lines = [json.loads(line) for line in res.text.splitlines()]
+    assert {line["payment_status"] for line in lines} == {"paid"}
+    assert len(lines) == 2
+
+    assert admin.get("/api/orders/admin/export", params={"format": "xml"}).status_code == 400
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        return
+    res = admin.get("/api/orders/admin/export", params={"format": "parquet", "batch_size": 2})
+    table = pq.read_table(io.BytesIO(res.content))
+    assert table.num_rows == 4
+    assert table.column("line_total").to_pylist().count(150) == 1
+
+
+def _wait_for(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_checkout_side_effects_run_from_the_outbox():
+    db = get_db()
+    db.outbox.delete_many({})
+    db.products.delete_many({})
+    db.carts.delete_many({})
+    admin = login_admin(db)
+    pid = admin.post("/api/products", json={"name": "Mug", "price": 500, "stock": 5}).json()["id"]
+
+    db.users.delete_many({"email": "outbox@example.com"})
+    buyer = TestClient(app)
+    buyer.post("/api/auth/register", json={"username": "outbox", "email": "outbox@example.com", "password": "buyerpw"})
+    assert buyer.post("/api/auth/login", json={"email": "outbox@example.com", "password": "buyerpw"}).status_code == 200
+    assert buyer.post("/api/cart/add", json={"product_id": pid, "quantity": 2, "price": 500}).status_code == 200
+    assert buyer.get(f"/api/products/{pid}").json()["stock"] == 5
+    order_id = buyer.post("/api/checkout", json={"items": [{"product_id": pid, "quantity": 2, "price": 500}]}).json()["order_id"]
+
+    # cache invalidation and popularity do not wait for the outbox
+    assert buyer.get(f"/api/products/{pid}").json()["stock"] == 3
+    assert product_suggest._popularity.get(pid) == 2
+    tasks = list(db.outbox.find({"payload.order_id": ObjectId(order_id)}))
+    assert [t["name"] for t in tasks] == ["order.confirmation_email"]
+    assert _wait_for(lambda: db.outbox.count_documents({"status": "done"}) == 1)
+
+    stats = admin.get("/api/admin/tasks").json()
+    assert stats["pending"] == 0 and stats["lag_seconds"] == 0.0 and stats["processed"] >= 1
+
+
+def test_failed_tasks_are_retried_with_backoff():
+    db = get_db()
+    db.outbox.delete_many({})
+    calls = []
+
+    @task("test.flaky")
+    def flaky(db, payload):
+        calls.append(payload["n"])
+        if len(calls) == 1:
+            raise RuntimeError("smtp down")
+
+    queue = TaskQueue(get_db, workers=1, queue_size=4)
+    enqueue(db, "test.flaky", {"n": 1})
+    queue.start()
+    try:
+        assert _wait_for(lambda: db.outbox.find_one({"name": "test.flaky", "status": "pending", "attempts": 1}))
+        retry = db.outbox.find_one({"name": "test.flaky"})
+        assert retry["last_error"] == "RuntimeError('smtp down')"
+        assert retry["run_after"] > datetime.utcnow()
+        assert queue.stats()["pending"] == 1 and queue.stats()["lag_seconds"] == 0.0
+
+        # make the retry due now
+        db.outbox.update_one({"_id": retry["_id"]}, {"$set": {"run_after": datetime.utcnow()}})
+        queue.notify()
+        assert _wait_for(lambda: db.outbox.find_one({"name": "test.flaky", "status": "done"}))
+        assert calls == [1, 1] and queue.retried == 1 and queue.processed == 1
+    finally:
+        queue.stop()
+
+
+def test_insights_read_counters_kept_at_checkout():
+    db = get_db()
+    for c in ("orders", "products", "carts", "sales_totals", "sales_daily", "product_sales"):
+        db[c].delete_many({})
+    admin = login_admin(db)
+    pid = admin.post("/api/products", json={"name": "Lamp", "price": 250, "stock": 10}).json()["id"]
+
+    db.users.delete_many({"email": "counters@example.com"})
+    buyer = TestClient(app)
+    buyer.post("/api/auth/register", json={"username": "counters", "email": "counters@example.com", "password": "buyerpw"})
+    assert buyer.post("/api/auth/login", json={"email": "counters@example.com", "password": "buyerpw"}).status_code == 200
+    for qty in (1, 3):
+        assert buyer.post("/api/checkout", json={"items": [{"product_id": pid, "quantity": qty, "price": 250}]}).status_code == 200
+
+    body = admin.get("/api/admin/insights").json()
+    assert body["orders_count"] == 2 and body["total_revenue"] == 1000
+    assert body["product_sales"] == [{"product_id": pid, "name": "Lamp", "quantity": 4, "revenue": 1000}]
+    assert body["daily_sales"][-1] == {"date": datetime.utcnow().date().isoformat(), "orders": 2, "revenue": 1000, "units": 4}
+    assert len(body["daily_sales"]) == 30
+    # reads never touch the orders collection for sales figures
+    db.orders.insert_one({"items": [{"product_id": ObjectId(pid), "quantity": 5, "price": 250}], "total_amount": 1250, "created_at": datetime.utcnow()})
+    assert admin.get("/api/admin/insights").json()["orders_count"] == 2
+
+    assert rebuild(db) == {"orders": 3, "days": 1, "products": 1}
+    body = admin.get("/api/admin/insights").json()
+    assert body["orders_count"] == 3 and body["total_revenue"] == 2250
+    assert body["product_sales"][0]["quantity"] == 9
+
+
+def test_migration_stores_order_product_ids_as_object_ids():
+    db = get_db()
+    seed_orders(db, n=3)
+    unknown = {"product_id": "not-a-product", "quantity": 1, "price": 5}
+    db.orders.update_one({}, {"$push": {"items": unknown}})
+
+    assert migrate(db, dry_run=True) == {"scanned": 3, "changed": 3, "dry_run": True}
+    assert migrate(db, batch_size=2) == {"scanned": 3, "changed": 3, "dry_run": False}
+    lines = [it for o in db.orders.find() for it in o["items"]]
+    assert sum(isinstance(it["product_id"], ObjectId) for it in lines) == 3
+    assert unknown in lines
+    # nothing left to convert
+    assert migrate(db)["changed"] == 0
+
+
+def test_sales_buckets_align_like_date_trunc():
+    ts = datetime(2026, 10, 15, 13, 45, 10)  # a Thursday
+    assert sales_analytics.bucket_start(ts, "hour") == datetime(2026, 10, 15, 13)
+    assert sales_analytics.bucket_start(ts, "day") == datetime(2026, 10, 15)
+    assert sales_analytics.bucket_start(ts, "week") == datetime(2026, 10, 12)
+    assert sales_analytics.bucket_start(datetime(2026, 10, 12), "week") == datetime(2026, 10, 12)
+
+
+def test_sales_analytics_memoizes_closed_buckets():
+    db = get_db()
+    db.orders.delete_many({})
+    now = datetime(2026, 10, 15, 13, 30)
+    def order(ts, amount, qty):
+        return {"items": [{"product_id": ObjectId(), "quantity": qty, "price": amount // qty}], "total_amount": amount, "created_at": ts}
+    db.orders.insert_many([
+        order(datetime(2026, 10, 15, 11, 5), 100, 1),
+        order(datetime(2026, 10, 15, 11, 55), 300, 3),
+        order(datetime(2026, 10, 15, 13, 10), 50, 2),
+    ])
+    sales_analytics.forget()
+    try:
+        series = sales_analytics.sales_series(db, "hour", datetime(2026, 10, 15, 11, 20), now=now)
+    except OperationFailure:
+        pytest.skip("MongoDB without $dateTrunc (needs 5.0+)")
+    assert [(b["start"].hour, b["orders"], b["revenue"], b["units"]) for b in series] == [(11, 2, 400, 4), (12, 0, 0, 0), (13, 1, 50, 2)]
+
+    # closed buckets come from the memo; only the open one sees new orders
+    db.orders.insert_many([order(datetime(2026, 10, 15, 11, 30), 999, 1), order(datetime(2026, 10, 15, 13, 20), 70, 1)])
+    series = sales_analytics.sales_series(db, "hour", datetime(2026, 10, 15, 11), now=now)
+    assert [b["revenue"] for b in series] == [400, 0, 120]
+    sales_analytics.forget()
+    assert sales_analytics.sales_series(db, "hour", datetime(2026, 10, 15, 11), now=now)[0]["revenue"] == 1399
+
+    weeks = sales_analytics.sales_series(db, "week", datetime(2026, 10, 1), datetime(2026, 10, 16), now=now)
+    assert [(b["start"], b["orders"]) for b in weeks] == [(datetime(2026, 9, 28), 0), (datetime(2026, 10, 5), 0), (datetime(2026, 10, 12), 5)]
+
+    admin = login_admin(db)
+    assert admin.get("/api/admin/analytics/sales", params={"granularity": "minute"}).status_code == 400
+    assert admin.get("/api/admin/analytics/sales", params={"granularity": "hour", "from": "2000-01-01T00:00:00"}).status_code == 400
+    body = admin.get("/api/admin/analytics/sales", params={"granularity": "day", "from": "2026-10-14T00:00:00Z", "to": "2026-10-16T00:00:00Z"}).json()
+    assert [(b["start"], b["orders"]) for b in body["buckets"]] == [("2026-10-14T00:00:00", 0), ("2026-10-15T00:00:00", 5)]
@@ -0,0 +1,250 @@
+from fastapi.testclient import TestClient
+from backend.server import app
+from backend.database.connection import get_db
+from backend.core.cache import catalog_cache
+from backend.core.etag import bump_catalog_version
+from datetime import datetime, timedelta
+from bson import ObjectId
+
+client = TestClient(app)
+
+
+def seed_products(db, n=7):
+    db.products.delete_many({})
+    now = datetime.utcnow()
+    docs = []
+    for i in range(n):
+        docs.append({"name": f"Item {i}", "price": (i % 3) * 100, "stock": 5, "category": "cat-a" if i % 2 else "cat-b", "created_at": now - timedelta(minutes=i)})
+    if docs:
+        db.products.insert_many(docs)
+    # seeded behind the routes' back, so drop anything cached
+    catalog_cache.clear()
+
+
+def test_cursor_pagination_matches_page_order():
+    db = get_db()
+    seed_products(db)
+
+    for sort in ["price_asc", "price_desc", "newest", None]:
+        params = {"limit": 3}
+        if sort:
+            params["sort"] = sort
+        full = client.get("/api/products", params={**params, "limit": 100}).json()["items"]
+
+        seen = []
+        after = None
+        while True:
+            p = dict(params)
+            if after:
+                p["after"] = after
+            res = client.get("/api/products", params=p)
+            assert res.status_code == 200
+            data = res.json()
+            seen.extend(it["id"] for it in data["items"])
+            after = data["next_cursor"]
+            if not after:
+                break
+        assert seen == [it["id"] for it in full]
+
+
+def test_cursor_rejects_other_sort():
+    db = get_db()
+    seed_products(db)
+    cur = client.get("/api/products", params={"limit": 2, "sort": "newest"}).json()["next_cursor"]
+    res = client.get("/api/products", params={"limit": 2, "sort": "price_asc", "after": cur})
+    assert res.status_code == 400
+
+
+def test_total_modes():
+    db = get_db()
+    seed_products(db)
+    assert client.get("/api/products", params={"limit": 2}).json()["total"] == 7
+    assert client.get("/api/products", params={"limit": 2, "category": "cat-a"}).json()["total"] == 3
+    assert client.get("/api/products", params={"limit": 2, "total": "estimated"}).json()["total"] == 7
+    res = client.get("/api/products", params={"limit": 2, "total": "none"}).json()
+    assert res["total"] is None
+    assert len(res["items"]) == 2
+
+
+def test_bm25_search_ranks_and_prefix_matches():
+    from backend.core.search import product_search
+    db = get_db()
+    seed_products(db, n=0)
+    db.products.insert_many([
+        {"name": "Ultra Laptop", "description": "Thin laptop for travel", "price": 500, "stock": 1, "category": "electronics"},
+        {"name": "Laptop Sleeve", "description": "Protective case", "price": 20, "stock": 1, "category": "accessories"},
+        {"name": "Desk Lamp", "description": "Good light for a laptop desk", "price": 30, "stock": 1, "category": "home"},
+    ])
+    catalog_cache.clear()
+    product_search.build_from_db(db)
+
+    res = client.get("/api/products", params={"q": "laptop", "search_engine": "bm25"}).json()
+    names = [it["name"] for it in res["items"]]
+    assert names[0] == "Ultra Laptop"
+    assert set(names) == {"Ultra Laptop", "Laptop Sleeve", "Desk Lamp"}
+
+    res = client.get("/api/products", params={"q": "lapt", "search_engine": "bm25", "category": "accessories"}).json()
+    assert [it["name"] for it in res["items"]] == ["Laptop Sleeve"]
+
+
+def test_facets_follow_the_filter():
+    db = get_db()
+    seed_products(db)
+    res = client.get("/api/products", params={"limit": 2, "facets": "true", "price_bounds": "0,100,200,300"}).json()
+    cats = {c["category"]: c["count"] for c in res["facets"]["categories"]}
+    assert cats == {"cat-a": 3, "cat-b": 4}
+    assert [b["count"] for b in res["facets"]["price_histogram"]] == [3, 2, 2]
+
+    res = client.get("/api/products", params={"limit": 2, "facets": "true", "category": "cat-a", "price_bounds": "0,150,300"}).json()
+    assert res["facets"]["categories"] == [{"category": "cat-a", "count": 3}]
+    assert sum(b["count"] for b in res["facets"]["price_histogram"]) == 3
+
+    # a write from another worker only bumps the DB version, not this cache
+    db.products.insert_one({"name": "Item 7", "price": 250, "stock": 5, "category": "cat-c", "created_at": datetime.utcnow()})
+    bump_catalog_version(db)
+    res = client.get("/api/products", params={"limit": 2, "facets": "true", "price_bounds": "0,100,200,300"}).json()
+    assert {c["category"]: c["count"] for c in res["facets"]["categories"]} == {"cat-a": 3, "cat-b": 4, "cat-c": 1}
+
+
+def test_fields_projection_and_presets():
+    db = get_db()
+    seed_products(db, n=0)
+    pid = db.products.insert_one({"name": "Camera", "description": "x" * 500, "price": 900, "stock": 2, "category": "electronics", "images": ["a.jpg", "b.jpg"]}).inserted_id
+    catalog_cache.clear()
+
+    item = client.get("/api/products", params={"fields": "card"}).json()["items"][0]
+    assert "description" not in item
+    assert item["images"] == ["a.jpg"]
+
+    item = client.get("/api/products", params={"fields": "name,price", "sort": "newest"}).json()["items"][0]
+    assert set(item) <= {"id", "name", "price", "created_at"}
+
+    doc = client.get(f"/api/products/{pid}", params={"fields": "name"}).json()
+    assert set(doc) == {"id", "name"}
+    assert "description" in client.get(f"/api/products/{pid}").json()
+
+    assert client.get("/api/products", params={"fields": "password"}).status_code == 400
+
+
+def test_conditional_get_returns_304_until_product_changes():
+    db = get_db()
+    seed_products(db, n=0)
+    pid = db.products.insert_one({"name": "Mug", "price": 10, "stock": 3, "version": 1}).inserted_id
+    catalog_cache.clear()
+
+    first = client.get(f"/api/products/{pid}")
+    etag = first.headers["etag"]
+    assert "version" not in first.json()
+    again = client.get(f"/api/products/{pid}", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.content == b""
+
+    listing = client.get("/api/products")
+    assert client.get("/api/products", headers={"If-None-Match": listing.headers["etag"]}).status_code == 304
+
+    # simulate a product write from another worker
+    db.products.update_one({"_id": pid}, {"$inc": {"version": 1}})
+    db.counters.update_one({"_id": "products"}, {"$inc": {"version": 1}}, upsert=True)
+    changed = client.get(f"/api/products/{pid}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert client.get("/api/products/batch", params={"ids": str(pid)}).json()["items"][0]["product"]["stock"] == 3
+    db.products.update_one({"_id": pid}, {"$set": {"stock": 1}, "$inc": {"version": 1}})
+    assert client.get("/api/products/batch", params={"ids": str(pid)}).json()["items"][0]["product"]["stock"] == 1
+    assert client.get("/api/products", headers={"If-None-Match": listing.headers["etag"]}).status_code == 200
+
+
+def test_product_responses_hide_stock_bookkeeping():
+    db = get_db()
+    seed_products(db, n=0)
+    pid = db.products.insert_one({"name": "Kettle", "price": 40, "stock": 6, "held": 2, "stock_shards": None, "version": 3}).inserted_id
+    catalog_cache.clear()
+
+    for body in (
+        client.get(f"/api/products/{pid}").json(),
+        client.get("/api/products").json()["items"][0],
+        client.get("/api/products/batch", params={"ids": str(pid)}).json()["items"][0]["product"],
+    ):
+        assert body["name"] == "Kettle"
+        assert not {"held", "stock_shards", "version"} & set(body)
+
+
+def test_bulk_import_upserts_on_sku_and_reports_bad_rows():
+    db = get_db()
+    seed_products(db, n=0)
+    db.users.delete_many({"email": "importer@example.com"})
+    import bcrypt
+    pw = bcrypt.hashpw(b"adminpass", bcrypt.gensalt()).decode()
+    db.users.insert_one({"username": "importer", "email": "importer@example.com", "password_hash": pw, "role": "admin"})
+    admin = TestClient(app)
+    assert admin.post("/api/auth/login", json={"email": "importer@example.com", "password": "adminpass"}).status_code == 200
+
+    body = "\n".join([
+        '{"name": "Pen", "price": 5, "stock": 10, "sku": "PEN-1"}',
+        '{"name": "", "price": 5, "stock": 1}',
+        'not json',
+        '{"name": "Pen v2", "price": 6, "stock": 10, "sku": "PEN-1"}',
+    ])
+    report = admin.post("/api/products/import?format=ndjson", content=body).json()
+    assert report["rows"] == 4
+    assert report["errors"] == 2
+    assert [e["row"] for e in report["error_report"]] == [2, 3]
+    assert db.products.count_documents({"sku": "PEN-1"}) == 1
+
+    csv_body = 'name,price,stock,images,description\nMug,12,3,a.jpg|b.jpg,"two\nlines"\n'
+    report = admin.post("/api/products/import?format=csv", content=csv_body).json()
+    assert report["errors"] == 0
+    mug = db.products.find_one({"name": "Mug"})
+    assert mug["images"] == ["a.jpg", "b.jpg"]
+    assert mug["description"] == "two\nlines"
+
+
+def test_batch_lookup_keeps_request_order():
+    db = get_db()
+    seed_products(db, n=3)
+    ids = [str(d["_id"]) for d in db.products.find().sort("_id", 1)]
+    unknown = "0" * 24
+    res = client.get("/api/products/batch", params={"ids": f"{ids[2]},{unknown},bad,{ids[0]}", "fields": "card"})
+    assert res.status_code == 200
+    items = res.json()["items"]
+    assert [it["id"] for it in items] == [ids[2], unknown, "bad", ids[0]]
+    assert [it["found"] for it in items] == [True, False, False, True]
+    assert items[1]["error"] == "not_found" and items[2]["error"] == "invalid_id"
+    assert "description" not in items[0]["product"]
+
+
+def test_suggest_ranks_by_popularity():
+    from backend.core.suggest import SuggestIndex
+    index = SuggestIndex()
+    a, b, c = ObjectId(), ObjectId(), ObjectId()
+    index.build([
+        {"_id": a, "name": "Ultra Laptop", "category": "Laptops"},
+        {"_id": b, "name": "Laptop Sleeve", "category": "Accessories"},
+        {"_id": c, "name": "Lamp", "category": "Home"},
+    ], popularity={b: 5})
+    names = [s["name"] for s in index.suggest("lap")]
+    assert names[0] == "Laptop Sleeve"
+    assert set(names) == {"Laptop Sleeve", "Ultra Laptop", "Laptops"}
+
+    index.record_sale(a, 10)
+    # a different limit skips the memoized answer
+    products = [s["name"] for s in index.suggest("lap", limit=5) if s["type"] == "product"]
+    assert products == ["Ultra Laptop", "Laptop Sleeve"]
+    index.remove_product(a)
+    assert [s["name"] for s in index.suggest("lapt")] == ["Laptop Sleeve"]
+
+
+def test_suggest_ranks_the_whole_prefix_range():
+    from backend.core.suggest import SuggestIndex, TOP_K
+    index = SuggestIndex()
+    docs = [{"_id": ObjectId(), "name": f"Sock {i:04d}", "category": None} for i in range(3000)]
+    index.build(docs, popularity={docs[-1]["_id"]: 7})
+    # alphabetically last, but the best seller
+    assert index.suggest("s", limit=1)[0]["name"] == "Sock 2999"
+    assert index.suggest("sock 2", limit=1)[0]["name"] == "Sock 2999"
+
+    # a product outside the kept top list is raised into it by its sales
+    index.record_sale(docs[1500]["_id"], 9)
+    assert [s["name"] for s in index.suggest("so", limit=2)] == ["Sock 1500", "Sock 2999"]
+    index.record_sale(docs[2000]["_id"], 8)
+    assert [s["name"] for s in index.suggest("so", limit=3)] == ["Sock 1500", "Sock 2000", "Sock 2999"]
+    assert len(index._top["so"]) == TOP_K
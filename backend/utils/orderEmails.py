@@ -0,0 +1,38 @@
+import os
+import smtplib
+from email.mime.text import MIMEText
+from bson import ObjectId
+from ..core.logging import logger
+
+
+def send_order_confirmation(db, order_id: ObjectId) -> bool:
+    """Email the buyer a plain-text order summary.
+
+    Uses the same ADMIN_EMAIL / ADMIN_EMAIL_PASSWORD account as the contact
+    mailer; returns False (without raising) when that is not configured or
+    the order has no reachable buyer. SMTP errors propagate so the task is
+    retried.
+    """
+    sender_email = os.getenv("ADMIN_EMAIL")
+    app_password = os.getenv("ADMIN_EMAIL_PASSWORD")
+    if not sender_email or not app_password:
+        logger.debug("Order confirmation for %s skipped: mail is not configured", order_id)
+        return False
+    order = db.orders.find_one({"_id": order_id})
+    user = db.users.find_one({"_id": order.get("user_id")}, {"email": 1, "username": 1}) if order and order.get("user_id") else None
+    if not user or not user.get("email"):
+        return False
+
+    lines = [f"Hi {user.get('username') or ''},", "", f"Thanks for your order {order_id}.", ""]
+    for it in order.get("items") or []:
+        lines.append(f"  {it.get('quantity')} x {it.get('name') or it.get('product_id')} @ {it.get('price')}")
+    lines += ["", f"Total: {order.get('total_amount')}"]
+    msg = MIMEText("\n".join(lines), "plain")
+    msg["Subject"] = f"Order confirmation {order_id}"
+    msg["From"] = sender_email
+    msg["To"] = user["email"]
+
+    with smtplib.SMTP_SSL("smtp.gmail.com", 465, timeout=30) as server:
+        server.login(sender_email, app_password)
+        server.sendmail(sender_email, user["email"], msg.as_string())
+    return True
@@ -0,0 +1,160 @@
+import csv
+import io
+from ..core.serialization import ORDER_PROJECTION, dumps
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+# one row per order line; orders without items still get a row
+COLUMNS = [
+    "order_id", "created_at", "user_id", "payment_status", "total_amount", "simulated",
+    "line", "product_id", "name", "quantity", "price", "line_total",
+]
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def parquet_available() -> bool:
+    return pq is not None
+
+
+def _str(v):
+    return str(v) if v is not None else None
+
+
+def flatten_order(d: dict):
+    created = d.get("created_at")
+    order = {
+        "order_id": str(d["_id"]),
+        "created_at": created.isoformat() if hasattr(created, "isoformat") else _str(created),
+        "user_id": _str(d.get("user_id")),
+        "payment_status": d.get("payment_status"),
+        "total_amount": d.get("total_amount"),
+        "simulated": bool(d.get("simulated", False)),
+    }
+    items = [it for it in d.get("items") or () if isinstance(it, dict)]
+    if not items:
+        yield {**order, "line": None, "product_id": None, "name": None, "quantity": None, "price": None, "line_total": None}
+        return
+    for n, it in enumerate(items, 1):
+        qty, price = it.get("quantity"), it.get("price")
+        yield {
+            **order,
+            "line": n,
+            "product_id": _str(it.get("product_id")),
+            "name": it.get("name"),
+            "quantity": qty,
+            "price": price,
+            "line_total": qty * price if isinstance(qty, (int, float)) and isinstance(price, (int, float)) else None,
+        }
+
+
+def _batches(cursor, batch_size: int):
+    # group flattened rows so each yield is one network write / row group
+    rows = []
+    for d in cursor:
+        rows.extend(flatten_order(d))
+        if len(rows) >= batch_size:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+
+def iter_csv(cursor, batch_size: int):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(COLUMNS)
+    for rows in _batches(cursor, batch_size):
+        writer.writerows([[row[c] for c in COLUMNS] for row in rows])
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+
+def iter_ndjson(cursor, batch_size: int):
+    for rows in _batches(cursor, batch_size):
+        yield b"".join(dumps(row) + b"\n" for row in rows)
+
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back to the caller.
+
+    ParquetWriter needs a seekless stream that knows its position; the
+    chunks are drained after every row group so nothing accumulates.
+    """
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        out, self._chunks = b"".join(self._chunks), []
+        return out
+
+
+def _parquet_schema():
+    return pa.schema([
+        ("order_id", pa.string()),
+        ("created_at", pa.string()),
+        ("user_id", pa.string()),
+        ("payment_status", pa.string()),
+        ("total_amount", pa.float64()),
+        ("simulated", pa.bool_()),
+        ("line", pa.int32()),
+        ("product_id", pa.string()),
+        ("name", pa.string()),
+        ("quantity", pa.int64()),
+        ("price", pa.float64()),
+        ("line_total", pa.float64()),
+    ])
+
+
+def iter_parquet(cursor, batch_size: int):
+    """One Parquet row group per batch; requires pyarrow."""
+    schema = _parquet_schema()
+    sink = _ChunkSink()
+    with pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema) as writer:
+        for rows in _batches(cursor, batch_size):
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def export_orders(db, query: dict, fmt: str, batch_size: int = 1000):
+    """Yield the export file for orders matching `query`, oldest first.
+
+    Memory use is bounded by `batch_size` (the Mongo cursor batch and the
+    number of rows per write) whatever the number of orders.
+    """
+    cursor = db.orders.find(query, ORDER_PROJECTION).sort([("created_at", 1), ("_id", 1)]).batch_size(batch_size)
+    writer = {"csv": iter_csv, "ndjson": iter_ndjson, "parquet": iter_parquet}[fmt]
+    try:
+        yield from writer(cursor, batch_size)
+    finally:
+        cursor.close()
@@ -0,0 +1,151 @@
+import codecs
+import csv
+import json
+import time
+from datetime import datetime
+from typing import AsyncIterator
+from pydantic import ValidationError
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from starlette.concurrency import run_in_threadpool
+from ..models.product import ProductCreate
+
+# keep the error report bounded however bad the file is
+MAX_REPORTED_ERRORS = 1000
+CSV_LIST_SEPARATOR = "|"
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode a byte stream as UTF-8 and yield complete lines without newlines."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    async for chunk in chunks:
+        buf += decoder.decode(chunk)
+        *lines, buf = buf.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buf += decoder.decode(b"", final=True)
+    if buf:
+        yield buf.rstrip("\r")
+
+
+async def iter_ndjson(lines: AsyncIterator[str]):
+    """Yield `(row_number, dict | Exception)` for each non-blank line."""
+    n = 0
+    async for line in lines:
+        n += 1
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError("expected a JSON object")
+            yield n, row
+        except ValueError as e:
+            yield n, e
+
+
+async def iter_csv(lines: AsyncIterator[str]):
+    """Yield `(row_number, dict | Exception)`; the first record is the header.
+
+    Quoted fields may span lines, so physical lines are joined until the
+    quotes balance before handing the record to the csv module.
+    """
+    header = None
+    record, start, n = [], 0, 0
+    async for line in lines:
+        n += 1
+        if not record:
+            start = n
+        record.append(line)
+        joined = "\n".join(record)
+        if joined.count('"') % 2:
+            continue
+        record = []
+        if not joined.strip():
+            continue
+        try:
+            values = next(csv.reader([joined]))
+        except csv.Error as e:
+            yield start, e
+            continue
+        if header is None:
+            header = [h.strip() for h in values]
+            continue
+        row = {}
+        for key, value in zip(header, values):
+            if value == "":
+                continue
+            row[key] = value.split(CSV_LIST_SEPARATOR) if key == "images" else value
+        yield start, row
+    if record:
+        yield start, ValueError("unterminated quoted field")
+
+
+def _write_batch(db, ops: list, rows: list, stats: dict, errors: list):
+    try:
+        res = db.products.bulk_write(ops, ordered=False)
+        details = res.bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+        for err in details.get("writeErrors", []):
+            _add_error(stats, errors, rows[err["index"]], err.get("errmsg"))
+    stats["inserted"] += details.get("nInserted", 0)
+    stats["upserted"] += details.get("nUpserted", 0)
+    stats["updated"] += details.get("nModified", 0)
+
+
+def _add_error(stats: dict, errors: list, row, error):
+    stats["errors"] += 1
+    if len(errors) < MAX_REPORTED_ERRORS:
+        errors.append({"row": row, "error": error})
+
+
+def _to_op(product: ProductCreate, now: datetime):
+    doc = product.model_dump()
+    if doc.get("sku"):
+        # re-importing a SKU updates it in place and keeps its created_at
+        return UpdateOne(
+            {"sku": doc["sku"]},
+            {"$set": {**doc, "updated_at": now}, "$setOnInsert": {"created_at": now}, "$inc": {"version": 1}},
+            upsert=True,
+        )
+    return InsertOne({**doc, "created_at": now, "updated_at": now, "version": 1})
+
+
+async def import_products(db, rows, batch_size: int = 1000) -> dict:
+    """Validate rows with `ProductCreate` and write them in unordered batches.
+
+    `rows` yields `(row_number, dict | Exception)` as produced by
+    `iter_ndjson`/`iter_csv`. Returns counters, a per-row error report and
+    throughput.
+    """
+    started = time.monotonic()
+    stats = {"rows": 0, "inserted": 0, "upserted": 0, "updated": 0, "errors": 0}
+    errors: list = []
+    ops, op_rows = [], []
+    now = datetime.utcnow()
+    async for row_number, row in rows:
+        stats["rows"] += 1
+        if isinstance(row, Exception):
+            _add_error(stats, errors, row_number, str(row))
+            continue
+        try:
+            product = ProductCreate(**row)
+        except ValidationError as e:
+            _add_error(stats, errors, row_number, e.errors(include_url=False, include_context=False))
+            continue
+        ops.append(_to_op(product, now))
+        op_rows.append(row_number)
+        if len(ops) >= batch_size:
+            await run_in_threadpool(_write_batch, db, ops, op_rows, stats, errors)
+            ops, op_rows = [], []
+    if ops:
+        await run_in_threadpool(_write_batch, db, ops, op_rows, stats, errors)
+
+    elapsed = time.monotonic() - started
+    stats["seconds"] = round(elapsed, 3)
+    stats["rows_per_second"] = round(stats["rows"] / elapsed, 1) if elapsed > 0 else None
+    stats["error_report"] = errors
+    stats["error_report_truncated"] = stats["errors"] > len(errors)
+    return stats
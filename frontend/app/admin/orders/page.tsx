@@ -0,0 +1,79 @@
+"use client"
+
+import React, { useEffect, useState } from "react"
+import api from "../../../services/api"
+
+type Order = {
+  id: string
+  user_id?: string
+  total_amount?: number
+  payment_status?: string
+  created_at?: string
+  items?: Array<any>
+}
+
+export default function AdminOrdersPage() {
+  const [orders, setOrders] = useState<Order[]>([])
+  const [status, setStatus] = useState("")
+  // /orders/admin is paged; next_cursor fetches the older orders
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [loading, setLoading] = useState(false)
+  const [error, setError] = useState<string | null>(null)
+
+  useEffect(() => {
+    fetchOrders()
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [status])
+
+  async function fetchOrders(after?: string) {
+    setLoading(true)
+    setError(null)
+    try {
+      const params: Record<string, string> = {}
+      if (status) params.status = status
+      if (after) params.after = after
+      const data = await api.getAllOrders(params)
+      setOrders((prev) => (after ? [...prev, ...(data.orders || [])] : data.orders || []))
+      setNextCursor(data.next_cursor || null)
+    } catch (e: any) {
+      setError(e?.info?.detail || e.message || "Failed to load orders")
+    } finally {
+      setLoading(false)
+    }
+  }
+
+  return (
+    <div className="p-6">
+      <h1 className="text-2xl font-semibold mb-4">Admin — Orders</h1>
+      <div className="mb-4 flex items-center gap-2">
+        <label className="text-sm">Status</label>
+        <select className="border rounded p-1 text-black" value={status} onChange={(e) => setStatus(e.target.value)}>
+          <option value="">All</option>
+          <option value="success">success</option>
+          <option value="paid">paid</option>
+          <option value="pending">pending</option>
+          <option value="failed">failed</option>
+        </select>
+        <span className="text-sm text-zinc-500">Showing {orders.length} orders</span>
+      </div>
+      {error && <div className="text-red-600">{error}</div>}
+      <ul className="space-y-2">
+        {orders.map((o) => (
+          <li key={o.id} className="p-3 bg-white rounded shadow text-black">
+            <div className="font-mono text-sm">{o.id}</div>
+            <div>User: {o.user_id || "—"}</div>
+            <div>Total: {o.total_amount}</div>
+            <div>Status: {o.payment_status}</div>
+            <div className="text-xs">{o.created_at} — {(o.items || []).length} items</div>
+          </li>
+        ))}
+      </ul>
+      {loading && <div className="mt-4">Loading…</div>}
+      {!loading && nextCursor && (
+        <button className="mt-4 px-3 py-1 border rounded" onClick={() => fetchOrders(nextCursor)}>
+          Load older orders
+        </button>
+      )}
+    </div>
+  )
+}
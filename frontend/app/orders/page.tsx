@@ -9,6 +9,9 @@ export default function MyOrdersPage() {
   const [orders, setOrders] = useState<any[]>([]);
   const [loading, setLoading] = useState(true);
   const [raw, setRaw] = useState<any>(null);
+  // /orders/me is paged; next_cursor fetches the older orders
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     let mounted = true;
@@ -18,6 +21,7 @@ export default function MyOrdersPage() {
         if (!mounted) return;
         setRaw(r);
         setOrders(r.orders || []);
+        setNextCursor(r.next_cursor || null);
       })
       .catch((err: any) => {
         toast.error(err?.info?.detail || err?.message || 'Failed to load orders');
@@ -32,6 +36,7 @@ export default function MyOrdersPage() {
       const r = await api.getMyOrders();
       setRaw(r);
       setOrders(r.orders || []);
+      setNextCursor(r.next_cursor || null);
     } catch (err: any) {
       toast.error(err?.info?.detail || err?.message || 'Failed to load orders');
     } finally {
@@ -39,6 +44,21 @@ export default function MyOrdersPage() {
     }
   }
 
+  async function loadMore() {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const r = await api.getMyOrders(nextCursor);
+      setRaw(r);
+      setOrders((prev) => [...prev, ...(r.orders || [])]);
+      setNextCursor(r.next_cursor || null);
+    } catch (err: any) {
+      toast.error(err?.info?.detail || err?.message || 'Failed to load orders');
+    } finally {
+      setLoadingMore(false);
+    }
+  }
+
   return (
     <div className="container mx-auto px-6 py-12">
       <motion.h1 initial={{ opacity: 0, y: 6 }} animate={{ opacity: 1, y: 0 }} className="text-2xl font-semibold">My Orders</motion.h1>
@@ -48,7 +68,7 @@ export default function MyOrdersPage() {
         {!loading && orders.length === 0 && <div className="text-zinc-600">You have no orders yet.</div>}
         <div className="mt-2">
           <button className="btn btn-ghost mr-2" onClick={refresh}>Refresh</button>
-          <span className="text-sm text-zinc-500">Found {orders.length} orders</span>
+          <span className="text-sm text-zinc-500">Showing {orders.length} orders{nextCursor ? ' (more available)' : ''}</span>
         </div>
         {raw && (
           <details className="mt-2 text-xs text-zinc-500">
@@ -88,6 +108,14 @@ export default function MyOrdersPage() {
             </div>
           </div>
         ))}
+
+        {nextCursor && (
+          <div className="text-center">
+            <button className="btn btn-ghost" onClick={loadMore} disabled={loadingMore}>
+              {loadingMore ? 'Loading…' : 'Load older orders'}
+            </button>
+          </div>
+        )}
       </div>
     </div>
   )
@@ -131,12 +131,16 @@ export async function deleteProduct(id: string) {
   return request(`/api/products/${id}`, { method: "DELETE" });
 }
 
-export async function getMyOrders() {
-  return request(`/api/orders/me`);
+export async function getMyOrders(after?: string) {
+  // pages are keyset-based: pass the previous response's next_cursor
+  const qs = after ? `?${new URLSearchParams({ after }).toString()}` : "";
+  return request(`/api/orders/me${qs}`);
 }
 
-export async function getAllOrders() {
-  return request(`/api/orders/admin`);
+export async function getAllOrders(params: Record<string, string> = {}) {
+  // supports limit, after, status, from, to, user_id
+  const qs = new URLSearchParams(params).toString();
+  return request(`/api/orders/admin${qs ? `?${qs}` : ""}`);
 }
 
 export default {